@@ -6,8 +6,11 @@ Django Admin configuration for Booking model
 """
 
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Booking
+from core.admin_utils import AutocompleteFilter, EstimatedCountPaginator, autocomplete_filter_media
+from .maintenance import update_status
+from .models import Booking, Guest, OutboxMessage
 
 
 @admin.register(Booking)
@@ -21,29 +24,36 @@ class BookingAdmin(admin.ModelAdmin):
     ]
 
     list_filter = [
-        'status', 'booking_date', 'restaurant',
-        'table', 'created_at'
+        'status', 'booking_date',
+        ('restaurant', AutocompleteFilter),
+        ('table', AutocompleteFilter)
     ]
 
+    # Prefix matches only, each backed by a case-insensitive index
     search_fields = [
-        'customer_name', 'customer_email', 'customer_phone',
-        'restaurant__name', 'table__table_number'
+        '^customer_email', '^customer_phone', '^customer_name'
     ]
 
+    list_select_related = ['restaurant', 'table']
+    autocomplete_fields = ['restaurant', 'table']
+
+    # Large table: no full COUNT(*), no facet counts
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
     readonly_fields = [
-        'booking_datetime', 'end_datetime',
+        'guest', 'booking_datetime', 'end_datetime',
         'is_past', 'is_today', 'is_upcoming',
         'created_at', 'updated_at'
     ]
 
-    date_hierarchy = 'booking_date'
-
     fieldsets = (
         ('Booking Information', {
             'fields': ('restaurant', 'table', 'status')
         }),
         ('Customer Details', {
-            'fields': ('customer_name', 'customer_email', 'customer_phone')
+            'fields': ('customer_name', 'customer_email', 'customer_phone', 'guest')
         }),
         ('Booking Details', {
             'fields': (
@@ -66,6 +76,10 @@ class BookingAdmin(admin.ModelAdmin):
 
     actions = ['mark_as_cancelled', 'mark_as_completed', 'mark_as_no_show']
 
+    @property
+    def media(self):
+        return super().media + autocomplete_filter_media(self, 'restaurant')
+
     def restaurant_name(self, obj):
         return obj.restaurant.name
 
@@ -95,22 +109,80 @@ class BookingAdmin(admin.ModelAdmin):
 
     status_badge.short_description = 'Status'
 
-    # Admin actions
+    # Admin actions; update_status also counts the change for the guests
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.update(status='cancelled')
+        updated = update_status(queryset, 'cancelled')
         self.message_user(request, f'{updated} bookings marked as cancelled.')
 
     mark_as_cancelled.short_description = 'Mark selected bookings as Cancelled'
 
     def mark_as_completed(self, request, queryset):
-        updated = queryset.update(status='completed')
+        updated = update_status(queryset, 'completed')
         self.message_user(request, f'{updated} bookings marked as completed.')
 
     mark_as_completed.short_description = 'Mark selected bookings as Completed'
 
     def mark_as_no_show(self, request, queryset):
-        updated = queryset.update(status='no_show')
+        updated = update_status(queryset, 'no_show')
         self.message_user(request, f'{updated} bookings marked as no show.')
 
     mark_as_no_show.short_description = 'Mark selected bookings as No Show'
 
+
+@admin.register(Guest)
+class GuestAdmin(admin.ModelAdmin):
+    """Admin interface for guest profiles"""
+
+    list_display = [
+        'id', 'name', 'email', 'phone', 'restaurant',
+        'visits', 'cancellations', 'no_shows', 'last_visit'
+    ]
+    list_filter = [('restaurant', AutocompleteFilter)]
+    list_select_related = ['restaurant']
+
+    search_fields = ['^email', '^phone_digits', '^name']
+
+    # Counted from the bookings, never edited by hand
+    readonly_fields = [
+        'visits', 'cancellations', 'no_shows', 'last_visit',
+        'created_at', 'updated_at'
+    ]
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + autocomplete_filter_media(self, 'restaurant')
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """Admin interface for queued booking emails"""
+
+    list_display = [
+        'id', 'booking', 'kind', 'status',
+        'attempts', 'next_attempt_at', 'sent_at'
+    ]
+
+    list_filter = ['status', 'kind']
+
+    readonly_fields = [
+        'booking', 'kind', 'attempts', 'last_error',
+        'sent_at', 'created_at', 'updated_at'
+    ]
+
+    list_select_related = ['booking__restaurant']
+
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(
+            status='pending',
+            attempts=0,
+            next_attempt_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} messages queued for immediate delivery.')
+
+    retry_now.short_description = 'Retry selected messages now'
@@ -0,0 +1,379 @@
+"""
+Benchmarks for the booking hot paths
+
+Used by `manage.py benchmark_bookings`, which runs them against throwaway
+test databases. seed() builds a deterministic data set; each benchmark
+returns raw timings that summarize() turns into the JSON result format.
+"""
+
+import functools
+import gc
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as dt_time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from core.sharding import db_for_restaurant, default_shard, sharding_enabled
+from core.utils import normalize_phone
+from restaurants.models import Restaurant, Table
+from restaurants.serializers import TablePublicSerializer
+from .maintenance import backfill_guests
+from .models import Booking, Guest
+from .serializers import BookingSerializer
+from .services import BookingService
+
+# Two-hour slots, so seeded bookings on a table never overlap
+SLOTS = [dt_time(hour) for hour in range(10, 22, 2)]
+
+FILTERS = ['all', 'today', 'upcoming', 'past', 'cancelled']
+
+# Result keys saying what a benchmark's calls did rather than how fast:
+# a faster run that, say, only hit the "already booked" path is no proof
+OUTCOME_KEYS = ['booked', 'rejected', 'errors']
+
+
+def seed(restaurants, tables, bookings_per_day, days, rng):
+    """
+    Create restaurants x tables, and bookings_per_day per restaurant for
+    `days` days centred on today (past days completed/no-show/cancelled,
+    future days mostly confirmed)
+
+    Returns:
+        list: The Restaurant instances
+    """
+    User = get_user_model()
+    run = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+    owners = User.objects.bulk_create([
+        User(username=f'bench-{run}-{index}', role='OWNER', password='!')
+        for index in range(restaurants)
+    ])
+
+    created = []
+    for index, owner in enumerate(owners):
+        qr_code_id = uuid.UUID(int=rng.getrandbits(128))
+        created.append(Restaurant(
+            owner=owner,
+            name=f'Benchmark Restaurant {index}',
+            email=f'restaurant{index}@example.com',
+            phone='5550000000',
+            address=f'{index} Main Street',
+            city='Springfield',
+            state='IL',
+            zip_code='62701',
+            qr_code_id=qr_code_id,
+            # bulk_create skips the pre_save signal that assigns shards
+            shard=default_shard(qr_code_id) if sharding_enabled() else ''
+        ))
+    created = Restaurant.objects.bulk_create(created)
+
+    today = timezone.localdate()
+    first_day = today - timedelta(days=days // 2)
+    for restaurant in created:
+        db = db_for_restaurant(restaurant)
+        restaurant_tables = Table.objects.using(db).bulk_create([
+            Table(restaurant=restaurant, table_number=str(number + 1), capacity=rng.choice([2, 4, 4, 6, 8]))
+            for number in range(tables)
+        ])
+
+        bookings = []
+        for day in range(days):
+            booking_date = first_day + timedelta(days=day)
+            places = [(table, slot) for table in restaurant_tables for slot in SLOTS]
+            for table, slot in rng.sample(places, min(bookings_per_day, len(places))):
+                if booking_date < today:
+                    status = rng.choices(['completed', 'no_show', 'cancelled'], [85, 5, 10])[0]
+                else:
+                    status = rng.choices(['confirmed', 'cancelled'], [90, 10])[0]
+                bookings.append(Booking(
+                    restaurant=restaurant,
+                    table=table,
+                    customer_name=f'Guest {rng.randrange(100000)}',
+                    customer_email=f'guest{rng.randrange(100000)}@example.com',
+                    customer_phone=f'555{rng.randrange(10 ** 7):07d}',
+                    party_size=rng.randint(1, table.capacity),
+                    booking_date=booking_date,
+                    booking_time=slot,
+                    status=status
+                ))
+        for booking in bookings:
+            # bulk_create does not call Booking.save()
+            booking.customer_phone_digits = normalize_phone(booking.customer_phone)
+        Booking.objects.using(db).bulk_create(bookings, batch_size=2000)
+
+    # Nor link the guests
+    backfill_guests()
+    return created
+
+
+def measure(func, repeat):
+    """Run func once to warm up, then `repeat` times; returns seconds per call"""
+    func()
+    timings = []
+    # Like timeit: collector pauses are noise, not the code under test
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return timings
+
+
+def summarize(timings, **extra):
+    """Millisecond statistics for a list of timings in seconds"""
+    ordered = sorted(timings)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 4),
+        'median_ms': round(statistics.median(ordered) * 1000, 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        **extra,
+    }
+
+
+def future_slot(rng, days):
+    """Random (date, time) among the seeded future days"""
+    return timezone.localdate() + timedelta(days=rng.randrange(1, max(2, days // 2))), rng.choice(SLOTS)
+
+
+def bench_check_table_availability(restaurants, repeat, rng, days):
+    tables = [
+        table
+        for restaurant in restaurants
+        for table in Table.objects.using(db_for_restaurant(restaurant)).filter(restaurant=restaurant)
+    ]
+
+    def run():
+        booking_date, booking_time = future_slot(rng, days)
+        BookingService.check_table_availability(rng.choice(tables), booking_date, booking_time)
+
+    return summarize(measure(run, repeat))
+
+
+def bench_get_available_tables(restaurants, repeat, rng, days):
+    def run():
+        booking_date, booking_time = future_slot(rng, days)
+        BookingService.get_available_tables(rng.choice(restaurants), booking_date, booking_time, 2)
+
+    return summarize(measure(run, repeat))
+
+
+def bench_get_restaurant_bookings(restaurants, repeat, rng, filter_type):
+    def run():
+        list(BookingService.get_restaurant_bookings(rng.choice(restaurants), filter_type))
+
+    return summarize(measure(run, repeat))
+
+
+def bench_search_bookings(restaurants, repeat, rng):
+    """Front-desk lookups: the start of a guest's name or phone number"""
+    queries = []
+    for restaurant in restaurants:
+        guests = Booking.objects.using(db_for_restaurant(restaurant)).filter(
+            restaurant=restaurant
+        ).values_list('customer_name', 'customer_phone_digits')[:20]
+        for name, phone in guests:
+            queries += [(restaurant, name[:3]), (restaurant, phone[:6])]
+
+    def run():
+        BookingService.search_bookings(*rng.choice(queries))
+
+    return summarize(measure(run, repeat))
+
+
+def bench_booking_serializer(restaurants, repeat, rng):
+    restaurant = restaurants[0]
+    bookings = list(BookingService.get_restaurant_bookings(restaurant, 'all')[:100])
+    timings = measure(lambda: BookingSerializer(bookings, many=True).data, repeat)
+    return summarize(timings, objects=len(bookings))
+
+
+def bench_table_serializer(restaurants, repeat, rng):
+    restaurant = restaurants[0]
+    tables = list(Table.objects.using(db_for_restaurant(restaurant)).filter(restaurant=restaurant))
+    timings = measure(lambda: TablePublicSerializer(tables, many=True).data, repeat)
+    return summarize(timings, objects=len(tables))
+
+
+def bench_create_booking(restaurants, attempts, threads, rng, days):
+    """
+    create_booking from many threads at once, all competing for a small
+    set of slots so that some attempts conflict
+
+    Bookings and guests left by an earlier run are removed first, so that
+    every run starts from empty slots and does the same work.
+    """
+    restaurant = restaurants[0]
+    db = db_for_restaurant(restaurant)
+    tables = list(Table.objects.using(db).filter(restaurant=restaurant)[:3])
+    booking_date = timezone.localdate() + timedelta(days=days)
+    Booking.objects.using(db).filter(restaurant=restaurant, booking_date=booking_date).delete()
+    Guest.objects.using(db).filter(restaurant=restaurant, email__startswith='contender').delete()
+    requests = [
+        (rng.choice(tables), rng.choice(SLOTS), index)
+        for index in range(attempts)
+    ]
+    outcomes = {'booked': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def attempt(request):
+        table, slot, index = request
+        started = time.perf_counter()
+        success, _, message = BookingService.create_booking(
+            restaurant=restaurant,
+            table_id=table.id,
+            customer_data={
+                'customer_name': f'Contender {index}',
+                'customer_email': f'contender{index}@example.com',
+                'customer_phone': '5551234567',
+            },
+            booking_data={
+                'booking_date': booking_date,
+                'booking_time': slot,
+                'party_size': 2,
+            }
+        )
+        elapsed = time.perf_counter() - started
+        with lock:
+            if success:
+                outcomes['booked'] += 1
+            elif message.startswith('Error creating booking'):
+                outcomes['errors'] += 1
+            else:
+                outcomes['rejected'] += 1
+        return elapsed
+
+    def run_in_thread(request):
+        try:
+            return attempt(request)
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        timings = list(pool.map(run_in_thread, requests))
+    wall = time.perf_counter() - started
+
+    booked_slots = Booking.objects.using(db).filter(
+        restaurant=restaurant,
+        booking_date=booking_date,
+        status='confirmed'
+    ).values_list('table_id', 'booking_time')
+    double_booked = len(booked_slots) - len(set(booked_slots))
+
+    return summarize(
+        timings,
+        threads=threads,
+        throughput_per_s=round(attempts / wall, 1),
+        double_booked=double_booked,
+        **outcomes
+    )
+
+
+def run_benchmarks(restaurants, repeat, threads, days, seed_value, only=None):
+    """
+    Run every benchmark (or those named in `only`) against already seeded
+    restaurants
+
+    reference_ms() runs before and after each benchmark, and the faster
+    of the two is kept in its summary: the machine's speed while the
+    benchmark ran, to scale a baseline by.
+
+    Returns:
+        dict: Benchmark name -> summary
+    """
+    rng = random.Random(seed_value)
+    benchmarks = [
+        ('check_table_availability', functools.partial(bench_check_table_availability, restaurants, repeat, rng, days)),
+        ('get_available_tables', functools.partial(bench_get_available_tables, restaurants, repeat, rng, days)),
+    ]
+    for filter_type in FILTERS:
+        benchmarks.append((f'get_restaurant_bookings[{filter_type}]', functools.partial(
+            bench_get_restaurant_bookings, restaurants, max(1, repeat // 5), rng, filter_type
+        )))
+    benchmarks += [
+        ('booking_serializer', functools.partial(bench_booking_serializer, restaurants, repeat, rng)),
+        ('table_serializer', functools.partial(bench_table_serializer, restaurants, repeat, rng)),
+        ('create_booking_contention', functools.partial(bench_create_booking, restaurants, repeat, threads, rng, days)),
+        # Last, so the benchmarks above draw the same random numbers as before
+        ('search_bookings', functools.partial(bench_search_bookings, restaurants, repeat, rng)),
+    ]
+
+    results = {}
+    reference = reference_ms()
+    for name, run in benchmarks:
+        if only is not None and name not in only:
+            continue
+        result = run()
+        after = reference_ms()
+        results[name] = {**result, 'reference_ms': min(reference, after)}
+        reference = after
+    return results
+
+
+def reference_ms(repeat=30):
+    """
+    Fastest run of a fixed ORM workload, unrelated to the code under test
+
+    Loads the auth permissions (a table every database has) into model
+    instances, the same kind of work as the benchmarks. Its time moves
+    with the machine's speed, which on shared hosts changes from one
+    minute to the next.
+
+    Returns:
+        float: Milliseconds
+    """
+    def run():
+        for _ in range(10):
+            list(Permission.objects.using(DEFAULT_DB_ALIAS).all())
+
+    return summarize(measure(run, repeat))['min_ms']
+
+
+def same_outcome(result, other):
+    """Whether two runs of a benchmark did the same work (OUTCOME_KEYS)"""
+    return all(result.get(key) == other.get(key) for key in OUTCOME_KEYS)
+
+
+def scale(result, previous):
+    """How much slower the machine ran result than previous, by their reference_ms()"""
+    if 'reference_ms' not in result or 'reference_ms' not in previous:
+        return 1.0
+    return result['reference_ms'] / previous['reference_ms']
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """
+    Regressions against a baseline
+
+    Runs are compared on their fastest call, which is far less sensitive
+    to other load on the machine than the median (see the timeit docs).
+    Each baseline time is first scaled by the ratio of the reference_ms()
+    timed next to the two runs. A benchmark regresses when it is more than
+    `threshold` (a fraction) and more than min_delta_ms slower than in the
+    scaled baseline.
+
+    Returns:
+        list of (name, scaled baseline min_ms, current min_ms) tuples
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        before, after = previous['min_ms'] * scale(result, previous), result['min_ms']
+        if after > before * (1 + threshold) and after - before > min_delta_ms:
+            regressions.append((name, before, after))
+    return regressions
@@ -0,0 +1,329 @@
+"""
+Periodic bulk maintenance of the bookings table
+
+Jobs here touch many rows, so they work in chunks: each chunk selects
+primary keys through an index and changes them with one set-based
+statement in its own short transaction. SQLite holds its single write
+lock only for that transaction, and bookings keep flowing in between.
+Status changes are counted in the guests' statistics in the same
+transaction.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.sharding import shard_databases
+from core.transactions import write_atomic
+from core.utils import normalize_email, normalize_phone
+from .models import Booking, BookingArchive, Guest
+
+FINISHED_STATUSES = ('completed', 'no_show')
+
+# Booking.duration_hours is at most 99.9, so anything that started this
+# long ago has certainly ended
+MAX_DURATION = timedelta(hours=100)
+
+# Booking columns copied to BookingArchive as they are
+ARCHIVE_FIELDS = [
+    'id', 'restaurant_id', 'table_id', 'customer_id', 'guest_id',
+    'customer_name', 'customer_email', 'customer_phone',
+    'party_size', 'booking_date', 'booking_time', 'duration_hours',
+    'special_requests', 'status',
+    'confirmation_sent', 'confirmation_sent_at', 'created_at',
+]
+
+
+# Booking columns _update_rows needs to count status changes
+STATUS_ROW_FIELDS = ['id', 'guest_id', 'status', 'booking_date']
+
+
+def _update_rows(queryset, db, rows, changes):
+    """
+    Apply changes to rows (STATUS_ROW_FIELDS tuples) of queryset, and
+    count a status change in the guests' statistics
+
+    The rows must have been selected for update in the current
+    transaction, so they are exactly the rows the UPDATE changes and a
+    guest is never counted for a booking that was changed meanwhile.
+
+    Returns:
+        int: Number of rows updated
+    """
+    updated = queryset.filter(id__in=[row[0] for row in rows]).update(**changes)
+    if 'status' in changes:
+        Guest.objects.using(db).apply_status_changes(
+            (guest_id, status, changes['status'], booking_date)
+            for _, guest_id, status, booking_date in rows
+        )
+    return updated
+
+
+def _update_chunks(queryset, db, chunk_size, pause, **changes):
+    """
+    Apply changes to every row of queryset, chunk_size rows per transaction
+
+    The queryset must stop matching a row once it has been changed,
+    e.g. filter on the status being replaced.
+
+    Returns:
+        int: Number of rows updated
+    """
+    total = 0
+    while True:
+        # The ids through the index, then one UPDATE ... WHERE id IN (...)
+        with write_atomic(using=db):
+            rows = list(queryset.select_for_update().values_list(*STATUS_ROW_FIELDS)[:chunk_size])
+            updated = _update_rows(queryset, db, rows, changes) if rows else 0
+        if not updated:
+            return total
+        total += updated
+        if pause:
+            # Give queued writers (new bookings) the lock between chunks
+            time.sleep(pause)
+
+
+def _has_ended(row, ended_before):
+    """Whether a (*STATUS_ROW_FIELDS, booking_time, duration_hours) row ended by ended_before"""
+    *_, booking_date, booking_time, duration_hours = row
+    start = timezone.make_aware(datetime.combine(booking_date, booking_time))
+    return start + timedelta(hours=float(duration_hours)) <= ended_before
+
+
+def close_finished_bookings(now=None, finished_status=None, chunk_size=None, pause=0):
+    """
+    Move confirmed bookings that have ended to 'completed' (or 'no_show')
+
+    Bookings that started more than MAX_DURATION ago are closed with pure
+    range scans over the (status, booking_date, booking_time) index. The
+    last few days are checked row by row against each booking's own
+    duration and then closed by id, in the same chunks.
+
+    Args:
+        now: Reference time (default: timezone.now())
+        finished_status: Target status (default: BOOKING_FINISHED_STATUS)
+        chunk_size: Rows per UPDATE (default: BOOKING_MAINTENANCE_CHUNK_SIZE)
+        pause: Seconds to sleep between chunks
+
+    Returns:
+        int: Number of bookings closed
+    """
+    now = now or timezone.now()
+    finished_status = finished_status or settings.BOOKING_FINISHED_STATUS
+    chunk_size = chunk_size or settings.BOOKING_MAINTENANCE_CHUNK_SIZE
+    if finished_status not in FINISHED_STATUSES:
+        raise ValueError(f"finished_status must be one of {', '.join(FINISHED_STATUSES)}")
+
+    ended_before = now - timedelta(minutes=settings.BOOKING_FINISHED_GRACE_MINUTES)
+    cutoff = timezone.localdate(ended_before - MAX_DURATION)
+    changes = {'status': finished_status, 'updated_at': now}
+    total = 0
+
+    for db in shard_databases():
+        confirmed = Booking.objects.using(db).filter(status='confirmed').order_by()
+
+        # Whole days that are certainly over
+        total += _update_chunks(
+            confirmed.filter(booking_date__lt=cutoff),
+            db, chunk_size, pause, **changes
+        )
+
+        # Recent days: compare each booking's end time
+        recent = confirmed.filter(
+            booking_date__gte=cutoff,
+            booking_date__lte=timezone.localdate(ended_before)
+        ).values_list(*STATUS_ROW_FIELDS, 'booking_time', 'duration_hours')
+
+        ended = [row[0] for row in recent.iterator(chunk_size=chunk_size) if _has_ended(row, ended_before)]
+
+        for start in range(0, len(ended), chunk_size):
+            with write_atomic(using=db):
+                # Read again under the lock: a booking cancelled or moved
+                # since the scan above is left alone
+                rows = [
+                    row[:len(STATUS_ROW_FIELDS)]
+                    for row in recent.filter(id__in=ended[start:start + chunk_size]).select_for_update()
+                    if _has_ended(row, ended_before)
+                ]
+                if rows:
+                    total += _update_rows(confirmed, db, rows, changes)
+            if pause:
+                time.sleep(pause)
+
+    return total
+
+
+def archive_bookings(now=None, after_days=None, chunk_size=None, pause=0):
+    """
+    Move bookings older than the archive horizon to BookingArchive
+
+    Each chunk is copied and deleted in one transaction, so a booking is
+    always in exactly one of the two tables.
+
+    Args:
+        now: Reference time (default: timezone.now())
+        after_days: Horizon in days (default: BOOKING_ARCHIVE_AFTER_DAYS)
+        chunk_size: Bookings per transaction (default: BOOKING_MAINTENANCE_CHUNK_SIZE)
+        pause: Seconds to sleep between chunks
+
+    Returns:
+        int: Number of bookings archived
+    """
+    now = now or timezone.now()
+    after_days = settings.BOOKING_ARCHIVE_AFTER_DAYS if after_days is None else after_days
+    chunk_size = chunk_size or settings.BOOKING_MAINTENANCE_CHUNK_SIZE
+    cutoff = timezone.localdate(now) - timedelta(days=after_days)
+    total = 0
+
+    for db in shard_databases():
+        # Listing every status lets SQLite range-scan the
+        # (status, booking_date, booking_time) index
+        old = Booking.objects.using(db).filter(
+            status__in=[choice for choice, _ in Booking.STATUS_CHOICES],
+            booking_date__lt=cutoff
+        ).order_by()
+
+        while True:
+            # Bookings past the horizon are no longer edited, so they can be
+            # read before the write transaction starts, keeping it short
+            rows = list(old.values(*ARCHIVE_FIELDS, 'table__table_number')[:chunk_size])
+            if not rows:
+                break
+
+            archived = [
+                BookingArchive(table_number=row.pop('table__table_number'), **row)
+                for row in rows
+            ]
+            with transaction.atomic(using=db):
+                BookingArchive.objects.using(db).bulk_create(archived)
+                Booking.objects.using(db).filter(id__in=[row['id'] for row in rows]).delete()
+
+            total += len(rows)
+            if pause:
+                time.sleep(pause)
+
+    return total
+
+
+def update_status(queryset, status, chunk_size=None):
+    """
+    Set the status of every booking in queryset, keeping the guests'
+    statistics in step (QuerySet.update() alone would not)
+
+    Returns:
+        int: Number of bookings changed
+    """
+    chunk_size = chunk_size or settings.BOOKING_MAINTENANCE_CHUNK_SIZE
+    return _update_chunks(
+        queryset.exclude(status=status).order_by(), queryset.db, chunk_size, 0,
+        status=status, updated_at=timezone.now()
+    )
+
+
+def _link_chunk(model, db, rows):
+    """
+    Link rows (id, restaurant_id, customer_name, customer_email,
+    customer_phone, status, booking_date) of model to their guests,
+    creating the new ones, and count them in the guests' statistics
+
+    Returns:
+        int: Number of guests created
+    """
+    keys = [
+        (row, normalize_email(row[3]), normalize_phone(row[4]))
+        for row in rows
+    ]
+    restaurant_ids = {row[1] for row in rows}
+    emails = {email for _, email, _ in keys if email}
+    phones = {digits for _, _, digits in keys if digits}
+
+    by_email, by_phone = {}, {}
+    existing = Guest.objects.using(db).filter(
+        Q(email__in=emails) | Q(phone_digits__in=phones),
+        restaurant_id__in=restaurant_ids
+    ).values_list('id', 'restaurant_id', 'email', 'phone_digits')
+    for guest_id, restaurant_id, email, digits in existing:
+        if email:
+            by_email[restaurant_id, email] = guest_id
+        if digits:
+            by_phone[restaurant_id, digits] = guest_id
+
+    # Guests new in this chunk are Guest objects, created with their
+    # statistics; the others are ids, updated with F() expressions
+    created = []
+    links = []
+    for (booking_id, restaurant_id, name, _, phone, status, booking_date), email, digits in keys:
+        guest = by_email.get((restaurant_id, email)) or by_phone.get((restaurant_id, digits))
+        if guest is None:
+            if not (email or digits):
+                continue
+            guest = Guest(restaurant_id=restaurant_id, name=name, email=email, phone=phone, phone_digits=digits)
+            created.append(guest)
+            if email:
+                by_email[restaurant_id, email] = guest
+            if digits:
+                by_phone[restaurant_id, digits] = guest
+        if isinstance(guest, Guest):
+            guest.count_booking(status, booking_date)
+        links.append((booking_id, guest, status, booking_date))
+
+    Guest.objects.using(db).bulk_create(created)
+    Guest.objects.using(db).apply_status_changes(
+        (guest, None, status, booking_date)
+        for _, guest, status, booking_date in links
+        if not isinstance(guest, Guest)
+    )
+    # One prepared statement for the chunk: bulk_update() builds a CASE
+    # expression over every row, which cost more than the rest of the job.
+    # updated_at is set as save() would, for shard moves (see core.sharding)
+    connection = connections[db]
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {connection.ops.quote_name(model._meta.db_table)} SET guest_id = %s, updated_at = %s WHERE id = %s',
+            [(guest.id if isinstance(guest, Guest) else guest, now, booking_id) for booking_id, guest, _, _ in links]
+        )
+    return len(created)
+
+
+def backfill_guests(chunk_size=None, pause=0):
+    """
+    Link bookings without a guest (created before guests existed, or
+    with bulk_create) to their guests, and count them in the statistics
+
+    Archived bookings go first, so that guests are named after their
+    earliest booking. Each chunk is linked and counted in one
+    transaction: the job can be stopped and run again at any time.
+
+    Args:
+        chunk_size: Bookings per transaction (default: BOOKING_MAINTENANCE_CHUNK_SIZE)
+        pause: Seconds to sleep between chunks
+
+    Returns:
+        dict: bookings linked and guests created
+    """
+    chunk_size = chunk_size or settings.BOOKING_MAINTENANCE_CHUNK_SIZE
+    totals = {'bookings': 0, 'guests': 0}
+
+    for db in shard_databases():
+        for model in (BookingArchive, Booking):
+            unlinked = model.objects.using(db).filter(guest__isnull=True).order_by('id').values_list(
+                'id', 'restaurant_id', 'customer_name', 'customer_email', 'customer_phone', 'status', 'booking_date'
+            )
+            last_id = 0
+            while True:
+                with write_atomic(using=db):
+                    rows = list(unlinked.filter(id__gt=last_id)[:chunk_size])
+                    if not rows:
+                        break
+                    totals['guests'] += _link_chunk(model, db, rows)
+                totals['bookings'] += len(rows)
+                last_id = rows[-1][0]
+                if pause:
+                    time.sleep(pause)
+
+    return totals
@@ -0,0 +1,44 @@
+"""
+Move bookings older than the archive horizon to cold storage
+
+Usage:
+    python manage.py archive_bookings
+    python manage.py archive_bookings --days 180 --pause 0.05
+
+Run it periodically (e.g. nightly from cron) to keep the Booking table
+at a steady size.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bookings.maintenance import archive_bookings
+
+
+class Command(BaseCommand):
+    help = 'Move bookings older than BOOKING_ARCHIVE_AFTER_DAYS to BookingArchive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive horizon in days (default: BOOKING_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Bookings per transaction (default: BOOKING_MAINTENANCE_CHUNK_SIZE)')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to pause between chunks, letting other writers in')
+
+    def handle(self, *args, **options):
+        days = settings.BOOKING_ARCHIVE_AFTER_DAYS if options['days'] is None else options['days']
+        started = time.perf_counter()
+        archived = archive_bookings(
+            after_days=days,
+            chunk_size=options['chunk_size'],
+            pause=options['pause']
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{archived} bookings older than {days} days archived in {elapsed:.2f}s "
+            f"({archived / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
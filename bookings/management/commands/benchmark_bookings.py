@@ -0,0 +1,274 @@
+"""
+Benchmark the booking hot paths and compare against a stored baseline
+
+Usage:
+    python manage.py benchmark_bookings
+    python manage.py benchmark_bookings --restaurants 20 --tables 30 --bookings-per-day 80
+    python manage.py benchmark_bookings --output results.json --threshold 0.5
+    python manage.py benchmark_bookings --save-baseline
+    python manage.py benchmark_bookings --allow-missing-baseline
+    python manage.py benchmark_bookings --synthetic --restaurants 200 --days 90
+
+Runs against throwaway SQLite test databases (one file per alias, so the
+contention benchmark uses real locking), seeded deterministically from
+--seed. The run fails when a benchmark's fastest call is more than
+--threshold slower than in the baseline (default benchmarks/baseline.json).
+
+Baselines are machine-specific. Without a baseline recorded on this
+machine (CPU, architecture, Python or Django version) there is nothing to
+compare with, and the run fails before benchmarking unless
+--allow-missing-baseline is given, in which case it warns and passes.
+On the same machine, each baseline time is scaled by a reference
+workload timed next to the benchmark in both runs, so a busier machine
+does not fail the gate, and a regression only counts if it persists
+when the benchmark runs again. A re-run only counts if its
+calls ended the same way (as many bookings made, rejected and failed).
+Re-record a baseline with --save-baseline on the machine that runs the
+comparison.
+
+--synthetic seeds with the generator behind `manage.py generate_data`
+(realistic sittings, party sizes and occupancy; --bookings-per-day is
+then ignored), for benchmarking at production-like volumes.
+"""
+
+import functools
+import json
+import os
+import platform
+import random
+import tempfile
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from bookings import benchmarks, synthetic
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+# Parameters that change the data set; results are only comparable if equal
+VOLUME_PARAMS = ['restaurants', 'tables', 'bookings_per_day', 'days', 'threads', 'repeat', 'seed', 'synthetic']
+
+# Times a regressed benchmark is run again before the regression counts
+CONFIRM_RUNS = 2
+
+
+def processor():
+    """CPU model name, where the platform reports one"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark booking availability, listing, creation and serializers against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=5)
+        parser.add_argument('--tables', type=int, default=20)
+        parser.add_argument('--bookings-per-day', type=int, default=40, help='Per restaurant')
+        parser.add_argument('--days', type=int, default=60, help='Days of bookings, centred on today')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent create_booking callers')
+        parser.add_argument('--repeat', type=int, default=200, help='Timed calls per benchmark')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--synthetic', action='store_true', help='Seed with the generate_data generator')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--save-baseline', action='store_true', help='Overwrite the baseline with this run')
+        parser.add_argument(
+            '--allow-missing-baseline', action='store_true',
+            help='Warn and pass, rather than fail, without a baseline from this machine'
+        )
+        parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown, as a fraction')
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=0.05,
+            help='Ignore slowdowns smaller than this, whatever the ratio'
+        )
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in VOLUME_PARAMS}
+        fingerprint = {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+            'processor': processor(),
+        }
+        baseline = None if options['save_baseline'] else self.load_baseline(options, params, fingerprint)
+        regressions = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            old_config = self.setup(directory)
+            try:
+                restaurants = self.seed(options)
+                self.stdout.write(f"Seeded {self.describe(params)}")
+                run = functools.partial(
+                    benchmarks.run_benchmarks,
+                    restaurants, options['repeat'], options['threads'], options['days'], options['seed']
+                )
+                results = run()
+                if baseline:
+                    regressions = self.confirmed_regressions(run, results, baseline, options)
+            finally:
+                connections.close_all()
+                teardown_databases(old_config, verbosity=0)
+
+        report = {
+            'meta': {'params': params, **fingerprint},
+            'results': results,
+        }
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<36} min {result['min_ms']:>9.3f} ms   "
+                f"median {result['median_ms']:>9.3f} ms   "
+                f"p95 {result['p95_ms']:>9.3f} ms"
+            )
+        contention = results['create_booking_contention']
+        self.stdout.write(
+            f"create_booking: {self.outcome(contention)}, {contention['double_booked']} double-booked, "
+            f"{contention['throughput_per_s']}/s"
+        )
+
+        if options['output']:
+            self.write_json(options['output'], report)
+        if options['save_baseline']:
+            self.write_json(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+            return
+
+        if contention['double_booked']:
+            raise CommandError(f"create_booking double-booked {contention['double_booked']} slots")
+        if not baseline:
+            return
+
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(
+                f"  {name}: {before:.3f} ms -> {after:.3f} ms (+{(after / before - 1) * 100:.0f}%)"
+                for name, before, after in regressions
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"No regressions beyond {options['threshold']:.0%} of the baseline"
+        ))
+
+    def setup(self, directory):
+        # File databases rather than in-memory ones, so threads get their
+        # own connections and SQLite's write lock is really contended
+        for alias in connections:
+            if connections[alias].vendor == 'sqlite':
+                connections[alias].settings_dict['TEST']['NAME'] = os.path.join(directory, f'{alias}.sqlite3')
+        return setup_databases(verbosity=0, interactive=False)
+
+    def seed(self, options):
+        if options['synthetic']:
+            start_date = timezone.localdate() - timedelta(days=options['days'] // 2)
+            # The fresh test databases from setup() are throwaway
+            return synthetic.generate(
+                options['restaurants'], options['tables'], options['days'], start_date, options['seed'],
+                force=True
+            )['restaurants']
+        return benchmarks.seed(
+            options['restaurants'], options['tables'], options['bookings_per_day'],
+            options['days'], random.Random(options['seed'])
+        )
+
+    def load_baseline(self, options, params, fingerprint):
+        """
+        The baseline to compare this run with
+
+        Returns:
+            dict, or None (with a warning) when there is nothing comparable
+            and --allow-missing-baseline was given
+        """
+        if not os.path.exists(options['baseline']):
+            return self.missing_baseline(
+                options, f"No baseline at {options['baseline']}; run with --save-baseline to create one"
+            )
+
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        # Baselines from before --synthetic existed were not synthetic
+        if {'synthetic': False, **baseline['meta']['params']} != params:
+            raise CommandError(
+                f"Baseline was recorded with {self.describe(baseline['meta']['params'])}; "
+                f"rerun with the same options or --save-baseline"
+            )
+
+        recorded = {key: baseline['meta'].get(key) for key in fingerprint}
+        if recorded != fingerprint:
+            return self.missing_baseline(
+                options,
+                f"Baseline was recorded on {self.describe_machine(recorded)}, this is "
+                f"{self.describe_machine(fingerprint)}; not compared. "
+                f"Run with --save-baseline to record one here"
+            )
+        return baseline
+
+    def missing_baseline(self, options, message):
+        if not options['allow_missing_baseline']:
+            raise CommandError(f"{message}, or pass --allow-missing-baseline")
+        self.stdout.write(self.style.WARNING(message))
+        return None
+
+    def confirmed_regressions(self, run, results, baseline, options):
+        """
+        Regressions against the baseline that persist when the regressed
+        benchmarks run again
+
+        Re-runs replace a result when they did the same work (see
+        benchmarks.same_outcome) and were faster relative to their
+        reference workload, updating `results`.
+
+        Returns:
+            list of regressions as from benchmarks.compare()
+        """
+        for attempt in range(CONFIRM_RUNS + 1):
+            regressions = benchmarks.compare(
+                results, baseline['results'], options['threshold'], options['min_delta_ms']
+            )
+            if not regressions or attempt == CONFIRM_RUNS:
+                return regressions
+
+            names = [name for name, _, _ in regressions]
+            self.stdout.write(f"Running {', '.join(names)} again to confirm")
+            for name, result in run(only=names).items():
+                previous = baseline['results'][name]
+                if not benchmarks.same_outcome(result, results[name]):
+                    self.stdout.write(f"  {name}: ignored, its calls ended differently ({self.outcome(result)})")
+                    continue
+                # Fastest call in baseline terms
+                if (result['min_ms'] / benchmarks.scale(result, previous)
+                        < results[name]['min_ms'] / benchmarks.scale(results[name], previous)):
+                    results[name] = result
+
+    def outcome(self, result):
+        return ', '.join(f"{result[key]} {key}" for key in benchmarks.OUTCOME_KEYS)
+
+    def describe(self, params):
+        bookings = 'synthetic bookings' if params.get('synthetic') else f"{params['bookings_per_day']} bookings/day"
+        return (
+            f"{params['restaurants']} restaurants x {params['tables']} tables, "
+            f"{bookings} over {params['days']} days"
+        )
+
+    def describe_machine(self, fingerprint):
+        return (
+            f"{fingerprint['processor'] or 'unknown CPU'} ({fingerprint['machine']}), "
+            f"Python {fingerprint['python']}, Django {fingerprint['django']}"
+        )
+
+    def write_json(self, path, report):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,43 @@
+"""
+Close confirmed bookings whose end time has passed
+
+Usage:
+    python manage.py close_finished_bookings
+    python manage.py close_finished_bookings --status no_show --pause 0.05
+
+Run it periodically (e.g. hourly from cron).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bookings.maintenance import FINISHED_STATUSES, close_finished_bookings
+
+
+class Command(BaseCommand):
+    help = "Move confirmed bookings that have ended to 'completed' or 'no_show'"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=FINISHED_STATUSES, default=None,
+                            help='Target status (default: BOOKING_FINISHED_STATUS)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows per UPDATE (default: BOOKING_MAINTENANCE_CHUNK_SIZE)')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to pause between chunks, letting other writers in')
+
+    def handle(self, *args, **options):
+        status = options['status'] or settings.BOOKING_FINISHED_STATUS
+        started = time.perf_counter()
+        closed = close_finished_bookings(
+            finished_status=status,
+            chunk_size=options['chunk_size'],
+            pause=options['pause']
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{closed} bookings marked {status} in {elapsed:.2f}s "
+            f"({closed / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
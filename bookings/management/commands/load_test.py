@@ -0,0 +1,378 @@
+"""
+Replay the public QR booking flow at a given arrival rate and report capacity
+
+Usage:
+    python manage.py load_test --rate 20 --duration 60
+    python manage.py load_test --url http://localhost:8000 --rate 50 --concurrency 32
+    python manage.py load_test --rate 0 --concurrency 8 --hotspot 1.5 --output load.json
+    python manage.py load_test --manifest scale.json --restaurants 1000 --rate 50
+
+Each simulated guest does what the QR booking page does:
+
+    GET  public/<qr_code_id>/info/
+    GET  public/<qr_code_id>/tables/
+    POST public/<qr_code_id>/availability/
+    POST public/<qr_code_id>/book/          (if a table is available)
+
+Guests arrive as a Poisson process at --rate per second (0 runs
+--concurrency guests back to back instead) and are served by a pool of
+--concurrency threads. Restaurants are picked with Zipf weights, so with
+--hotspot 1 the busiest restaurant gets about as much traffic as the next
+few together; --hotspot 0 spreads guests evenly. Restaurants come from
+--qr-code, else from a `generate_data --manifest` file, else the first
+--restaurants active ones in the database.
+
+Without --url requests go through Django's WSGI handler in this process;
+each guest gets its own REMOTE_ADDR so the per-IP throttles behave as with
+real traffic. With --url they go over HTTP (one keep-alive connection per
+thread) and every guest shares this machine's address, so expect 429s
+unless the server's throttle rates are raised.
+
+Bookings are really made: run it against a staging copy. Guest emails are
+loadtest+<n>@example.com, so they are easy to find and remove afterwards.
+"""
+
+import http.client
+import io
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from restaurants.models import Restaurant
+
+ENDPOINTS = ['info', 'tables', 'availability', 'book']
+
+# Half-hour slots between 11:00 and 21:00
+SLOTS = [f'{minutes // 60:02d}:{minutes % 60:02d}:00' for minutes in range(11 * 60, 21 * 60 + 1, 30)]
+
+
+class WSGIClient:
+    """Calls the Django WSGI handler directly, as a WSGI server would"""
+
+    def __init__(self):
+        self.handler = WSGIHandler()
+
+    def request(self, method, path, body=None, remote_addr='127.0.0.1'):
+        payload = json.dumps(body).encode() if body is not None else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': remote_addr,
+            'HTTP_HOST': 'localhost',
+            'HTTP_ACCEPT': 'application/json',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(payload)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(payload),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        response = self.handler(environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            content = b''.join(response)
+        finally:
+            # Fires request_finished, which returns database connections
+            response.close()
+        return int(status[0].split()[0]), content
+
+
+class HTTPClient:
+    """One keep-alive connection per thread to a running server"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise CommandError(f"Unsupported URL scheme: {parts.scheme}")
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, remote_addr=None):
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        if remote_addr:
+            # Only honoured by servers configured with NUM_PROXIES
+            headers['X-Forwarded-For'] = remote_addr
+
+        for attempt in range(2):
+            connection = getattr(self.local, 'connection', None)
+            if connection is None:
+                connection = self.local.connection = self.connection_class(self.netloc, timeout=30)
+            try:
+                connection.request(method, self.prefix + path, body=payload, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # Keep-alive connection closed by the server: reconnect once
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+
+
+class Stats:
+    """Latencies and outcomes per endpoint, shared by all worker threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.outcomes = {endpoint: {} for endpoint in ENDPOINTS}
+        self.guests = 0
+        self.booked = 0
+        self.sold_out = 0
+        self.late = 0
+        self.in_flight = 0
+
+    def record(self, endpoint, elapsed, outcome):
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            counts = self.outcomes[endpoint]
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def classify(endpoint, status, content):
+    if status == 429:
+        return 'throttled'
+    if endpoint == 'book' and status == 400 and b'already booked' in content:
+        # Someone else took the table between availability and book
+        return 'conflict'
+    if status >= 400:
+        return 'error'
+    return 'ok'
+
+
+class Command(BaseCommand):
+    help = 'Load test the public QR booking flow and report throughput and latency per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server (default: in-process WSGI)')
+        parser.add_argument('--rate', type=float, default=10.0, help='Guest arrivals per second (0: closed loop)')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to keep guests arriving')
+        parser.add_argument('--concurrency', type=int, default=16, help='Worker threads')
+        parser.add_argument('--restaurants', type=int, default=50, help='Active restaurants to spread guests over')
+        parser.add_argument('--qr-code', action='append', dest='qr_codes', help='Restaurant qr_code_id (repeatable)')
+        parser.add_argument('--manifest', help='Take the restaurants from a generate_data manifest')
+        parser.add_argument('--hotspot', type=float, default=1.0, help='Zipf exponent of restaurant popularity')
+        parser.add_argument('--days', type=int, default=14, help='Guests book between tomorrow and this many days ahead')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        qr_codes = options['qr_codes'] or self.manifest_qr_codes(options) or [
+            str(qr_code_id) for qr_code_id in
+            Restaurant.objects.filter(is_active=True).order_by('id').values_list('qr_code_id', flat=True)[:options['restaurants']]
+        ]
+        if not qr_codes:
+            raise CommandError('No active restaurants; pass --qr-code or seed some data first')
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        client = HTTPClient(options['url']) if options['url'] else WSGIClient()
+        weights = [1 / (rank + 1) ** options['hotspot'] for rank in range(len(qr_codes))]
+        stats = Stats()
+        rng = random.Random(options['seed'])
+
+        target = options['url'] or 'in-process WSGI handler'
+        arrivals = f"{options['rate']:g} guests/s" if options['rate'] > 0 else 'closed loop'
+        self.stdout.write(
+            f"{len(qr_codes)} restaurants, {options['concurrency']} threads, {arrivals} "
+            f"for {options['duration']:g}s against {target}"
+        )
+
+        started = time.perf_counter()
+        if options['rate'] > 0:
+            self.open_loop(client, qr_codes, weights, stats, rng, options)
+        else:
+            self.closed_loop(client, qr_codes, weights, stats, options)
+        elapsed = time.perf_counter() - started
+
+        report = self.report(stats, elapsed)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+
+    def manifest_qr_codes(self, options):
+        if not options['manifest']:
+            return []
+        try:
+            with open(options['manifest']) as f:
+                return json.load(f)['qr_codes'][:options['restaurants']]
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot read manifest {options['manifest']}: {e}")
+
+    def guest(self, client, qr_code_id, number, rng, stats, options):
+        """One guest's visit; returns once they have booked or given up"""
+        address = f"10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}"
+        kwargs = {'qr_code_id': qr_code_id}
+
+        def call(endpoint, method, name, body=None):
+            started = time.perf_counter()
+            try:
+                status, content = client.request(method, reverse(name, kwargs=kwargs), body, address)
+            except Exception:
+                stats.record(endpoint, time.perf_counter() - started, 'error')
+                return None
+            outcome = classify(endpoint, status, content)
+            if outcome == 'error' and options['verbosity'] > 1:
+                self.stderr.write(f"{endpoint} {status}: {content[:200]!r}")
+            stats.record(endpoint, time.perf_counter() - started, outcome)
+            return json.loads(content) if outcome == 'ok' else None
+
+        with stats.lock:
+            stats.guests += 1
+
+        if call('info', 'GET', 'restaurants:public_info') is None:
+            return
+        if call('tables', 'GET', 'restaurants:public_tables') is None:
+            return
+
+        booking = {
+            'booking_date': str(timezone.localdate() + timedelta(days=rng.randint(1, options['days']))),
+            'booking_time': rng.choice(SLOTS),
+            'party_size': rng.choice([2, 2, 2, 3, 4, 4, 5, 6]),
+        }
+        availability = call('availability', 'POST', 'bookings:check_availability', booking)
+        if availability is None:
+            return
+        if not availability['available_tables']:
+            with stats.lock:
+                stats.sold_out += 1
+            return
+
+        created = call('book', 'POST', 'bookings:create_booking', {
+            **booking,
+            'table_id': rng.choice(availability['available_tables'])['id'],
+            'customer_name': f'Load Test {number}',
+            'customer_email': f'loadtest+{number}@example.com',
+            'customer_phone': f'555{number % 10 ** 7:07d}',
+        })
+        if created is not None:
+            with stats.lock:
+                stats.booked += 1
+
+    def open_loop(self, client, qr_codes, weights, stats, rng, options):
+        """Poisson arrivals, independent of how fast guests are served"""
+        deadline = time.perf_counter() + options['duration']
+        next_arrival = time.perf_counter()
+        number = 0
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            while True:
+                next_arrival += rng.expovariate(options['rate'])
+                if next_arrival >= deadline:
+                    break
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                with stats.lock:
+                    if stats.in_flight >= options['concurrency']:
+                        # Every worker is busy: this guest queues, so the
+                        # client rather than the server sets the pace
+                        stats.late += 1
+                    stats.in_flight += 1
+
+                qr_code_id = rng.choices(qr_codes, weights)[0]
+                pool.submit(
+                    self.queued_guest, client, qr_code_id, number,
+                    random.Random(rng.getrandbits(64)), stats, options
+                )
+                number += 1
+
+    def queued_guest(self, client, qr_code_id, number, rng, stats, options):
+        try:
+            self.guest(client, qr_code_id, number, rng, stats, options)
+        finally:
+            with stats.lock:
+                stats.in_flight -= 1
+
+    def closed_loop(self, client, qr_codes, weights, stats, options):
+        """Every thread runs guests back to back: the node's maximum throughput"""
+        deadline = time.perf_counter() + options['duration']
+        counter = iter(range(10 ** 9))
+        counter_lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            while time.perf_counter() < deadline:
+                with counter_lock:
+                    number = next(counter)
+                self.guest(client, rng.choices(qr_codes, weights)[0], number, rng, stats, options)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def report(self, stats, elapsed):
+        endpoints = {}
+        self.stdout.write(
+            f"{'endpoint':<13}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'errors':>8}{'429s':>7}{'conflicts':>11}"
+        )
+        for endpoint in ENDPOINTS:
+            ordered = sorted(stats.latencies[endpoint])
+            outcomes = stats.outcomes[endpoint]
+            result = endpoints[endpoint] = {
+                'requests': len(ordered),
+                'throughput_per_s': round(len(ordered) / elapsed, 2),
+                'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+                'errors': outcomes.get('error', 0),
+                'throttled': outcomes.get('throttled', 0),
+                'conflicts': outcomes.get('conflict', 0),
+                'conflict_rate': round(outcomes.get('conflict', 0) / len(ordered), 4) if ordered else 0.0,
+            }
+            self.stdout.write(
+                f"{endpoint:<13}{result['requests']:>9}{result['throughput_per_s']:>9.1f}"
+                f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+                f"{result['errors']:>8}{result['throttled']:>7}{result['conflicts']:>11}"
+            )
+
+        report = {
+            'seconds': round(elapsed, 2),
+            'guests': stats.guests,
+            'booked': stats.booked,
+            'sold_out': stats.sold_out,
+            'late_arrivals': stats.late,
+            'endpoints': endpoints,
+        }
+        book = endpoints['book']
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats.guests} guests in {elapsed:.1f}s ({stats.guests / elapsed:.1f}/s): "
+            f"{stats.booked} booked, {stats.sold_out} found no table, "
+            f"conflict rate {book['conflict_rate']:.1%}"
+        ))
+        if stats.late:
+            self.stdout.write(self.style.WARNING(
+                f"{stats.late} guests waited for a free worker; raise --concurrency "
+                f"or lower --rate to measure the server rather than this client"
+            ))
+        return report
@@ -0,0 +1,42 @@
+"""
+Deliver queued booking emails from the outbox
+
+Usage:
+    python manage.py send_outbox
+    python manage.py send_outbox --loop --interval 10
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.notifications import send_outbox_messages
+
+
+class Command(BaseCommand):
+    help = 'Send due booking emails from the outbox in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Messages per batch (default: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling instead of exiting when the outbox is empty')
+        parser.add_argument('--interval', type=float, default=10.0,
+                            help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            stats = send_outbox_messages(batch_size=options['batch_size'])
+            elapsed = time.perf_counter() - started
+
+            if any(stats.values()) or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{stats['sent']} sent, {stats['retried']} to retry, "
+                    f"{stats['failed']} failed permanently, {stats['skipped']} skipped in {elapsed:.2f}s "
+                    f"({stats['sent'] / elapsed if elapsed else 0:.0f} messages/s)"
+                ))
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,55 @@
+"""
+Queue and send booking reminders (24 hours and 2 hours before)
+
+Usage:
+    python manage.py send_reminders
+    python manage.py send_reminders --no-send    # only queue; send_outbox delivers
+
+Run it every few minutes from cron. Reminders are recorded in the
+outbox once per booking and kind, and each send batch is claimed before
+delivery, so overlapping runs, or a send_outbox worker running next to
+it, never send one twice.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.notifications import REMINDERS, schedule_reminders, send_outbox_messages
+
+
+class Command(BaseCommand):
+    help = 'Queue due booking reminders and send them through the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Bookings per chunk (default: REMINDER_CHUNK_SIZE)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Emails per batch (default: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--no-send', action='store_true',
+                            help='Only queue reminders, leave delivery to send_outbox')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        scheduled = schedule_reminders(chunk_size=options['chunk_size'])
+        scan_elapsed = time.perf_counter() - started
+
+        queued = ', '.join(f"{scheduled[kind]} {kind}" for kind in REMINDERS)
+        self.stdout.write(
+            f"Scanned {scheduled['scanned']} bookings in {scan_elapsed:.2f}s "
+            f"({scheduled['scanned'] / scan_elapsed if scan_elapsed else 0:.0f} bookings/s), "
+            f"queued {queued}"
+        )
+
+        if options['no_send']:
+            return
+
+        send_started = time.perf_counter()
+        stats = send_outbox_messages(batch_size=options['batch_size'])
+        send_elapsed = time.perf_counter() - send_started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['sent']} sent, {stats['retried']} to retry, "
+            f"{stats['failed']} failed permanently, {stats['skipped']} skipped in {send_elapsed:.2f}s "
+            f"({stats['sent'] / send_elapsed if send_elapsed else 0:.0f} messages/s)"
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 5.0 on 2026-10-19 09:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_outbox_message'),
+        ('restaurants', '0004_restaurant_shard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='kind',
+            field=models.CharField(choices=[('confirmation', 'Booking confirmation'), ('reminder_24h', 'Reminder 24 hours before'), ('reminder_2h', 'Reminder 2 hours before')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'booking_date', 'booking_time'], name='bookings_bo_status_2fbf98_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0 on 2026-10-19 09:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_reminders'),
+        ('restaurants', '0004_restaurant_shard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('table_number', models.CharField(max_length=50)),
+                ('customer_name', models.CharField(max_length=200)),
+                ('customer_email', models.EmailField(max_length=254)),
+                ('customer_phone', models.CharField(max_length=20)),
+                ('party_size', models.PositiveIntegerField()),
+                ('booking_date', models.DateField()),
+                ('booking_time', models.TimeField()),
+                ('duration_hours', models.DecimalField(decimal_places=1, max_digits=3)),
+                ('special_requests', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('completed', 'Completed'), ('no_show', 'No Show')], max_length=20)),
+                ('confirmation_sent', models.BooleanField(default=False)),
+                ('confirmation_sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+                ('restaurant', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_bookings', to='restaurants.restaurant')),
+                ('table', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_bookings', to='restaurants.table')),
+            ],
+            options={
+                'verbose_name': 'Archived Booking',
+                'verbose_name_plural': 'Archived Bookings',
+                'ordering': ['-booking_date', '-booking_time'],
+                'indexes': [models.Index(fields=['restaurant', 'booking_date'], name='bookings_bo_restaur_24b57a_idx')],
+            },
+        ),
+    ]
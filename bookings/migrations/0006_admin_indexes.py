@@ -0,0 +1,41 @@
+# Generated by Django 5.0 on 2026-10-19 10:03
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_archive'),
+        ('restaurants', '0004_restaurant_shard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='bookings_bo_restaur_96c7cf_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['restaurant', 'booking_date', 'booking_time'], name='bookings_bo_restaur_c80c3b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booking_date', 'booking_time'], name='bookings_bo_booking_fa13ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(django.db.models.functions.comparison.Collate('customer_email', 'NOCASE'), name='booking_email_nocase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(django.db.models.functions.comparison.Collate('customer_phone', 'NOCASE'), name='booking_phone_nocase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(django.db.models.functions.comparison.Collate('customer_name', 'NOCASE'), name='booking_name_nocase_idx'),
+        ),
+    ]
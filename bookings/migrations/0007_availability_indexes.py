@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-19 10:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_admin_indexes'),
+        ('restaurants', '0004_restaurant_shard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='bookings_bo_table_i_ab4b74_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['table', 'status', 'booking_date', 'booking_time'], name='booking_table_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['restaurant', 'status', 'booking_date', 'booking_time'], name='booking_rest_status_idx'),
+        ),
+    ]
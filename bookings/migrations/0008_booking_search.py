@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+from core.utils import normalize_phone
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def backfill_phone_digits(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        chunk = list(
+            Booking.objects.using(db).filter(id__gt=last_id).order_by('id').only('id', 'customer_phone')[:BACKFILL_CHUNK_SIZE]
+        )
+        if not chunk:
+            return
+        for booking in chunk:
+            booking.customer_phone_digits = normalize_phone(booking.customer_phone)
+        Booking.objects.using(db).bulk_update(chunk, ['customer_phone_digits'])
+        last_id = chunk[-1].id
+
+
+def install_search(apps, schema_editor):
+    from bookings import search
+    search.install(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    from bookings import search
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_availability_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='customer_phone_digits',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_phone_digits, migrations.RunPython.noop, hints={'sharded': True}),
+        migrations.RunPython(install_search, uninstall_search, hints={'sharded': True}),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0 on 2026-10-19 11:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_booking_search'),
+        ('restaurants', '0004_restaurant_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Guest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('phone_digits', models.CharField(blank=True, max_length=20)),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('cancellations', models.PositiveIntegerField(default=0)),
+                ('no_shows', models.PositiveIntegerField(default=0)),
+                ('last_visit', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='guests', to='restaurants.restaurant')),
+            ],
+            options={
+                'verbose_name': 'Guest',
+                'verbose_name_plural': 'Guests',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='guest',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='bookings.guest'),
+        ),
+        migrations.AddField(
+            model_name='bookingarchive',
+            name='guest',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_bookings', to='bookings.guest'),
+        ),
+        migrations.AddConstraint(
+            model_name='guest',
+            constraint=models.UniqueConstraint(condition=models.Q(('email', ''), _negated=True), fields=('restaurant', 'email'), name='unique_guest_email'),
+        ),
+        migrations.AddConstraint(
+            model_name='guest',
+            constraint=models.UniqueConstraint(condition=models.Q(('phone_digits', ''), _negated=True), fields=('restaurant', 'phone_digits'), name='unique_guest_phone'),
+        ),
+    ]
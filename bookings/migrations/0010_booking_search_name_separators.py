@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def reinstall_search(apps, schema_editor):
+    # Recreates the triggers with the current term SQL and re-indexes
+    from bookings import search
+    if search.is_installed(schema_editor.connection):
+        search.uninstall(schema_editor.connection)
+    search.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_guest'),
+    ]
+
+    operations = [
+        migrations.RunPython(reinstall_search, reinstall_search, hints={'sharded': True}),
+    ]
@@ -2,14 +2,192 @@
 Enhanced Booking model with customer tracking
 """
 
-from django.db import models
+from django.db import models, router
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.db.models import F, Q, Value
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.functions import Coalesce, Collate, Greatest
 from django.utils import timezone
 from datetime import timedelta
+from core.sharding import ShardedQuerySet
+from core.transactions import write_atomic
+from core.utils import normalize_email, normalize_phone
 from restaurants.models import Restaurant, Table
 
 
+class StatusAttribute(DeferredAttribute):
+    """
+    Booking.status, noting when it is changed after the row was loaded
+
+    Booking.save() only reads the stored status, and updates guest
+    statistics, for bookings marked here. Marking costs nothing at load
+    time, unlike a snapshot of the loaded value: lists load thousands.
+    """
+
+    def __set__(self, instance, value):
+        data = instance.__dict__
+        if self.field.attname in data:
+            if data[self.field.attname] != value:
+                data['_status_changed'] = True
+        elif instance._state.db is not None:
+            # Loaded without the status (or refreshed): the stored one is unknown
+            data['_status_changed'] = True
+        data[self.field.attname] = value
+
+
+class StatusField(models.CharField):
+    descriptor_class = StatusAttribute
+
+    def deconstruct(self):
+        # A plain CharField in the database and in migrations
+        name, _, args, kwargs = super().deconstruct()
+        return name, 'django.db.models.CharField', args, kwargs
+
+
+class GuestQuerySet(ShardedQuerySet):
+
+    def for_booking(self, booking):
+        """
+        The guest of the booking's restaurant with its email, or failing
+        that its phone number, created for someone new
+
+        Returns:
+            Guest, or None if the booking has neither
+        """
+        email = normalize_email(booking.customer_email)
+        digits = normalize_phone(booking.customer_phone)
+        matches = Q()
+        if email:
+            matches |= Q(email=email)
+        if digits:
+            matches |= Q(phone_digits=digits)
+        if not matches:
+            return None
+
+        # Both lookups in one query, through the unique indexes
+        guests = list(self.filter(matches, restaurant_id=booking.restaurant_id)[:2])
+        if guests:
+            return min(guests, key=lambda guest: guest.email != email)
+        return self.create(
+            restaurant=booking.restaurant,
+            name=booking.customer_name,
+            email=email,
+            phone=booking.customer_phone,
+            phone_digits=digits
+        )
+
+    def apply_status_changes(self, changes):
+        """
+        Count booking status changes in their guests' statistics
+
+        Guests with the same change, e.g. one more visit on the same day,
+        are updated together, with F() expressions so that concurrent
+        changes to one guest add up.
+
+        Args:
+            changes: iterable of (guest id, previous status or None for a
+                new booking, new status, booking date)
+
+        Returns:
+            int: Number of guests updated
+        """
+        totals = {}
+        for guest_id, old_status, new_status, booking_date in changes:
+            if guest_id is None or old_status == new_status:
+                continue
+            counts, last_visit = totals.get(guest_id, ({}, None))
+            for status, step in ((old_status, -1), (new_status, 1)):
+                counter = Guest.STATUS_COUNTERS.get(status)
+                if counter:
+                    counts[counter] = counts.get(counter, 0) + step
+            if new_status == 'completed':
+                last_visit = max(last_visit or booking_date, booking_date)
+            totals[guest_id] = (counts, last_visit)
+
+        groups = {}
+        for guest_id, (counts, last_visit) in totals.items():
+            key = (tuple(sorted((counter, step) for counter, step in counts.items() if step)), last_visit)
+            if key != ((), None):
+                groups.setdefault(key, []).append(guest_id)
+
+        now = timezone.now()
+        for (counts, last_visit), guest_ids in groups.items():
+            changes = {counter: F(counter) + step for counter, step in counts}
+            if last_visit:
+                # last_visit only moves forward: an undone visit leaves it
+                changes['last_visit'] = Greatest(Coalesce('last_visit', Value(last_visit)), Value(last_visit))
+            self.filter(id__in=guest_ids).update(updated_at=now, **changes)
+        return sum(len(guest_ids) for guest_ids in groups.values())
+
+
+class Guest(models.Model):
+    """
+    A restaurant's guest, across all of their bookings
+
+    Bookings are matched to guests by normalized email, then by phone
+    digits. The statistics are counted as bookings change status (see
+    GuestQuerySet.apply_status_changes) rather than aggregated from the
+    bookings, and deleting or archiving a booking leaves them as they are.
+    """
+
+    # Booking status -> counter
+    STATUS_COUNTERS = {
+        'completed': 'visits',
+        'cancelled': 'cancellations',
+        'no_show': 'no_shows',
+    }
+
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        related_name='guests'
+    )
+
+    # From the guest's first booking; email lower case
+    name = models.CharField(max_length=200)
+    email = models.EmailField(blank=True)
+    phone = models.CharField(max_length=20, blank=True)
+    phone_digits = models.CharField(max_length=20, blank=True)
+
+    # Statistics
+    visits = models.PositiveIntegerField(default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    no_shows = models.PositiveIntegerField(default=0)
+    last_visit = models.DateField(null=True, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = GuestQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Guest'
+        verbose_name_plural = 'Guests'
+        constraints = [
+            # Also the indexes GuestQuerySet.for_booking looks guests up by
+            models.UniqueConstraint(
+                fields=['restaurant', 'email'], condition=~Q(email=''), name='unique_guest_email'
+            ),
+            models.UniqueConstraint(
+                fields=['restaurant', 'phone_digits'], condition=~Q(phone_digits=''), name='unique_guest_phone'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.visits} visits)"
+
+    def count_booking(self, status, booking_date):
+        """Count a booking in the statistics of a guest not yet saved"""
+        counter = self.STATUS_COUNTERS.get(status)
+        if counter:
+            setattr(self, counter, getattr(self, counter) + 1)
+        if status == 'completed' and (self.last_visit is None or booking_date > self.last_visit):
+            self.last_visit = booking_date
+
+
 class Booking(models.Model):
     """
     Booking model - represents a table reservation
@@ -46,10 +224,24 @@ class Booking(models.Model):
         limit_choices_to={'role': 'CUSTOMER'}
     )
 
+    # Set by save() for new bookings; bulk_create leaves it empty until
+    # `manage.py backfill_guests`
+    guest = models.ForeignKey(
+        Guest,
+        on_delete=models.SET_NULL,
+        related_name='bookings',
+        null=True,
+        blank=True,
+        editable=False
+    )
+
     # Guest Information (for non-registered users)
     customer_name = models.CharField(max_length=200)
     customer_email = models.EmailField()
     customer_phone = models.CharField(max_length=20)
+    # customer_phone reduced to digits, for search; set by save(), so
+    # bulk_create callers must fill it in themselves
+    customer_phone_digits = models.CharField(max_length=20, blank=True, editable=False)
 
     # Booking Details
     party_size = models.PositiveIntegerField(
@@ -70,7 +262,7 @@ class Booking(models.Model):
     special_requests = models.TextField(blank=True)
 
     # Status
-    status = models.CharField(
+    status = StatusField(
         max_length=20,
         choices=STATUS_CHOICES,
         default='pending'
@@ -84,19 +276,70 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     class Meta:
         ordering = ['-booking_date', '-booking_time']
         verbose_name = 'Booking'
         verbose_name_plural = 'Bookings'
         indexes = [
-            models.Index(fields=['table', 'booking_date', 'status']),
-            models.Index(fields=['restaurant', 'booking_date']),
+            # Availability checks; booking_time last so the default ordering
+            # comes from the index and SQLite does not prefer another one
+            models.Index(fields=['table', 'status', 'booking_date', 'booking_time'], name='booking_table_status_idx'),
+            # Dashboard 'today', 'upcoming' and 'cancelled' filters
+            models.Index(fields=['restaurant', 'status', 'booking_date', 'booking_time'], name='booking_rest_status_idx'),
+            # Dashboard 'all' and 'past' filters
+            models.Index(fields=['restaurant', 'booking_date', 'booking_time']),
             models.Index(fields=['customer', 'booking_date']),
+            # Range scans across all restaurants (reminder scheduling)
+            models.Index(fields=['status', 'booking_date', 'booking_time']),
+            # Admin changelist: default ordering and prefix search
+            models.Index(fields=['booking_date', 'booking_time']),
+            models.Index(Collate('customer_email', 'NOCASE'), name='booking_email_nocase_idx'),
+            models.Index(Collate('customer_phone', 'NOCASE'), name='booking_phone_nocase_idx'),
+            models.Index(Collate('customer_name', 'NOCASE'), name='booking_name_nocase_idx'),
         ]
 
     def __str__(self):
         return f"{self.customer_name} - {self.restaurant.name} - {self.booking_date}"
 
+    def save(self, *args, **kwargs):
+        self.customer_phone_digits = normalize_phone(self.customer_phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'customer_phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'customer_phone_digits'}
+        saves_status = (
+            (self._state.adding or '_status_changed' in self.__dict__)
+            and 'status' in self.__dict__
+            and (update_fields is None or 'status' in update_fields)
+        )
+
+        using = kwargs.get('using') or router.db_for_write(Booking, instance=self)
+        if not saves_status and not (self._state.adding and self.guest_id is None):
+            # Nothing read first: no need for the write lock, nor the extra query
+            super().save(*args, **kwargs)
+            return
+
+        with write_atomic(using=using, savepoint=False):
+            if self._state.adding and self.guest_id is None:
+                self.guest = Guest.objects.using(using).for_booking(self)
+            saved_status = None
+            if saves_status and not self._state.adding:
+                # The stored status rather than a snapshot taken at load
+                # time: loading stays cheap, and a concurrent change is
+                # not counted twice (on SQLite, the transaction's write
+                # lock rather than select_for_update() holds it still)
+                saved_status = Booking.objects.using(using).select_for_update().filter(
+                    pk=self.pk
+                ).values_list('status', flat=True).first()
+            super().save(*args, **kwargs)
+            if saves_status:
+                Guest.objects.using(using).apply_status_changes([
+                    (self.guest_id, saved_status, self.status, self.booking_date)
+                ])
+        if saves_status:
+            self.__dict__.pop('_status_changed', None)
+
     @property
     def booking_datetime(self):
         """Combine date and time"""
@@ -142,4 +385,148 @@ class Booking(models.Model):
             self.status = 'confirmed'
             self.save()
             return True
-        return False
\ No newline at end of file
+        return False
+
+class BookingArchive(models.Model):
+    """
+    Cold storage for bookings past BOOKING_ARCHIVE_AFTER_DAYS
+
+    Rows are moved here by `manage.py archive_bookings` so the hot Booking
+    table and its indexes stay roughly constant in size. Archived bookings
+    keep their original id and are read-only; exports and statistics
+    read both tables (see BookingService.get_booking_history).
+    """
+
+    # Original Booking id
+    id = models.BigIntegerField(primary_key=True)
+
+    # Relationships - no database constraints, so tables and restaurants
+    # can still be edited or removed without touching history
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_bookings'
+    )
+    table = models.ForeignKey(
+        Table,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_bookings'
+    )
+    customer = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        db_constraint=False,
+        related_name='archived_bookings',
+        null=True,
+        blank=True
+    )
+    guest = models.ForeignKey(
+        Guest,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_bookings',
+        null=True,
+        blank=True
+    )
+
+    # Table number at archive time, in case the table is renamed or removed
+    table_number = models.CharField(max_length=50)
+
+    # Guest Information
+    customer_name = models.CharField(max_length=200)
+    customer_email = models.EmailField()
+    customer_phone = models.CharField(max_length=20)
+
+    # Booking Details
+    party_size = models.PositiveIntegerField()
+    booking_date = models.DateField()
+    booking_time = models.TimeField()
+    duration_hours = models.DecimalField(max_digits=3, decimal_places=1)
+    special_requests = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+
+    # Confirmation tracking
+    confirmation_sent = models.BooleanField(default=False)
+    confirmation_sent_at = models.DateTimeField(null=True, blank=True)
+
+    # Timestamps - created_at is the original booking's
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-booking_date', '-booking_time']
+        verbose_name = 'Archived Booking'
+        verbose_name_plural = 'Archived Bookings'
+        indexes = [
+            models.Index(fields=['restaurant', 'booking_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_name} - {self.booking_date} (archived)"
+
+class OutboxMessage(models.Model):
+    """
+    Email waiting to be sent for a booking (transactional outbox)
+
+    Rows are written in the same transaction as the booking change they
+    announce, and delivered later by `manage.py send_outbox`, so a booking
+    request never waits on the mail server and no email is lost or sent
+    for a booking that was rolled back.
+    """
+
+    KIND_CHOICES = [
+        ('confirmation', 'Booking confirmation'),
+        ('reminder_24h', 'Reminder 24 hours before'),
+        ('reminder_2h', 'Reminder 2 hours before'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+
+    booking = models.ForeignKey(
+        Booking,
+        on_delete=models.CASCADE,
+        related_name='outbox_messages'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+
+    # Delivery tracking
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        verbose_name = 'Outbox Message'
+        verbose_name_plural = 'Outbox Messages'
+        constraints = [
+            # One email of each kind per booking, even if enqueued twice
+            models.UniqueConstraint(fields=['booking', 'kind'], name='unique_outbox_booking_kind'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for booking {self.booking_id} ({self.status})"
@@ -0,0 +1,350 @@
+"""
+Booking emails through a transactional outbox
+
+Booking code only writes OutboxMessage rows, inside its own transaction.
+`manage.py send_outbox` delivers due messages in batches over a single
+mail connection, records the result with a few bulk UPDATEs and retries
+failures with exponential backoff.
+
+Each batch is claimed before it is sent by pushing its next_attempt_at
+OUTBOX_CLAIM_SECONDS ahead, so concurrent workers (send_outbox --loop
+next to send_reminders) never pick up the same messages. A worker that
+dies mid-batch leaves them due again once the claim runs out.
+
+Reminders are queued into the same outbox by `manage.py send_reminders`;
+the (booking, kind) unique constraint makes sure each goes out once.
+"""
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.template.loader import get_template
+from django.utils import timezone
+
+from core.sharding import shard_databases
+from core.transactions import write_atomic
+from .models import Booking, OutboxMessage
+
+# kind -> (subject, plain text body, HTML body) templates
+MESSAGE_TEMPLATES = {
+    'confirmation': (
+        'emails/booking_confirmation_subject.txt',
+        'emails/booking_confirmation.txt',
+        'emails/booking_confirmation.html',
+    ),
+    'reminder_24h': (
+        'emails/booking_reminder_subject.txt',
+        'emails/booking_reminder.txt',
+        'emails/booking_reminder.html',
+    ),
+    'reminder_2h': (
+        'emails/booking_reminder_subject.txt',
+        'emails/booking_reminder.txt',
+        'emails/booking_reminder.html',
+    ),
+}
+
+# Reminder kind -> how long before the booking it is sent, shortest first
+REMINDERS = {
+    'reminder_2h': timedelta(hours=2),
+    'reminder_24h': timedelta(hours=24),
+}
+
+# kind -> Booking (flag, timestamp) fields set once the message is sent
+SENT_FIELDS = {
+    'confirmation': ('confirmation_sent', 'confirmation_sent_at'),
+}
+
+
+@lru_cache(maxsize=None)
+def get_message_templates(kind):
+    """Templates for a message kind, compiled once per process"""
+    return tuple(get_template(name) for name in MESSAGE_TEMPLATES[kind])
+
+
+def enqueue_confirmation(booking):
+    """Queue the confirmation email; call inside the booking's transaction"""
+    return OutboxMessage.objects.using(booking._state.db).create(
+        booking=booking,
+        kind='confirmation'
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff after the given number of failed attempts"""
+    seconds = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_RETRY_MAX_SECONDS))
+
+
+def build_email(message, connection):
+    booking = message.booking
+    context = {'booking': booking, 'restaurant': booking.restaurant}
+    subject, text, html = get_message_templates(message.kind)
+
+    email = EmailMultiAlternatives(
+        subject=' '.join(subject.render(context).split()),
+        body=text.render(context),
+        to=[booking.customer_email],
+        reply_to=[booking.restaurant.email],
+        connection=connection
+    )
+    email.attach_alternative(html.render(context), 'text/html')
+    return email
+
+
+def claim_due_messages(db, batch_size):
+    """
+    Claim up to batch_size due messages for this worker
+
+    The ids are read and their claim written in one transaction that
+    holds the write lock from BEGIN (SKIP LOCKED rows on backends with
+    row locks), so no other worker can read them as due in between.
+    """
+    now = timezone.now()
+    due = OutboxMessage.objects.using(db).filter(status='pending', next_attempt_at__lte=now)
+    with write_atomic(using=db):
+        ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size])
+        if ids:
+            due.filter(pk__in=ids).update(
+                next_attempt_at=now + timedelta(seconds=settings.OUTBOX_CLAIM_SECONDS),
+                updated_at=now
+            )
+    if not ids:
+        return []
+
+    # Restaurants live in the catalog database, so they are prefetched
+    # rather than joined (see core.sharding)
+    return list(
+        OutboxMessage.objects.using(db).filter(
+            pk__in=ids
+        ).select_related('booking__table').prefetch_related('booking__restaurant')
+    )
+
+
+def is_stale(message, now):
+    """Reminders for cancelled or already started bookings are dropped"""
+    booking = message.booking
+    return message.kind in REMINDERS and (
+        booking.status != 'confirmed' or booking.booking_datetime <= now
+    )
+
+
+def send_batch(batch, connection, db):
+    """
+    Send one batch and record the outcome
+
+    Returns:
+        dict: Counts of sent, retried, failed and skipped messages
+    """
+    now = timezone.now()
+    stale = [message for message in batch if is_stale(message, now)]
+    if stale:
+        OutboxMessage.objects.using(db).filter(
+            pk__in=[message.pk for message in stale]
+        ).update(status='skipped', updated_at=now)
+        batch = [message for message in batch if message not in stale]
+
+    failures = {}
+    for message in batch:
+        # One message per call on the already open connection: if the
+        # server fails halfway through, we still know exactly what went out
+        try:
+            connection.send_messages([build_email(message, connection)])
+        except Exception as e:
+            failures[message.pk] = e
+
+    now = timezone.now()
+    sent = [message for message in batch if message.pk not in failures]
+    failed = [message for message in batch if message.pk in failures]
+
+    for message in failed:
+        message.attempts += 1
+        message.last_error = str(failures[message.pk])
+        message.updated_at = now
+        if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.status = 'failed'
+        else:
+            message.next_attempt_at = now + retry_delay(message.attempts)
+
+    with transaction.atomic(using=db):
+        if sent:
+            OutboxMessage.objects.using(db).filter(
+                pk__in=[message.pk for message in sent]
+            ).update(
+                status='sent',
+                sent_at=now,
+                attempts=F('attempts') + 1,
+                last_error='',
+                updated_at=now
+            )
+
+            for kind, (flag, timestamp) in SENT_FIELDS.items():
+                booking_ids = [message.booking_id for message in sent if message.kind == kind]
+                if booking_ids:
+                    Booking.objects.using(db).filter(pk__in=booking_ids).update(
+                        **{flag: True, timestamp: now},
+                        updated_at=now
+                    )
+
+        if failed:
+            OutboxMessage.objects.using(db).bulk_update(
+                failed,
+                ['attempts', 'status', 'next_attempt_at', 'last_error', 'updated_at']
+            )
+
+    retried = sum(1 for message in failed if message.status == 'pending')
+    return {
+        'sent': len(sent),
+        'retried': retried,
+        'failed': len(failed) - retried,
+        'skipped': len(stale),
+    }
+
+
+def send_outbox_messages(batch_size=None, connection=None):
+    """
+    Deliver every due outbox message on every booking database
+
+    Safe to run from several workers at once: each batch is claimed
+    before it is sent (see claim_due_messages).
+
+    Args:
+        batch_size: Messages loaded and recorded per round trip
+        connection: Mail backend connection (default: get_connection())
+
+    Returns:
+        dict: Counts of sent, retried, failed and skipped messages
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    connection = connection or get_connection()
+    stats = {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0}
+
+    with connection:
+        # Never the read replica: it could hand out messages already sent
+        for db in shard_databases():
+            while True:
+                batch = claim_due_messages(db, batch_size)
+                if not batch:
+                    break
+                for key, count in send_batch(batch, connection, db).items():
+                    stats[key] += count
+
+    return stats
+
+
+def due_reminder(booking_start, created_at, now):
+    """
+    Reminder kind whose window is open for a booking, or None
+
+    Only the closest reminder is sent (a booking 90 minutes away gets the
+    2-hour reminder, not both), and none if the booking was made inside
+    that window, since the confirmation has just gone out.
+    """
+    if booking_start <= now:
+        return None
+    for kind, lead in REMINDERS.items():
+        window_opens = booking_start - lead
+        if window_opens <= now:
+            return kind if created_at < window_opens else None
+    return None
+
+
+def schedule_reminders(now=None, chunk_size=None):
+    """
+    Queue every reminder that is due into the outbox
+
+    Each booking database is scanned with one range query over the
+    (status, booking_date, booking_time) index, streamed in fixed-size
+    chunks; each chunk costs one lookup of already queued reminders and
+    one bulk INSERT.
+
+    Returns:
+        dict: Number of bookings scanned and reminders queued per kind
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or settings.REMINDER_CHUNK_SIZE
+    horizon = now + max(REMINDERS.values())
+    stats = {'scanned': 0, **{kind: 0 for kind in REMINDERS}}
+
+    for db in shard_databases():
+        bookings = Booking.objects.using(db).filter(
+            status='confirmed',
+            booking_date__gte=timezone.localdate(now),
+            booking_date__lte=timezone.localdate(horizon)
+        ).order_by('booking_date', 'booking_time').values_list(
+            'id', 'booking_date', 'booking_time', 'created_at'
+        )
+
+        chunk = []
+        for row in bookings.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                queue_reminders(chunk, db, now, stats)
+                chunk = []
+        if chunk:
+            queue_reminders(chunk, db, now, stats)
+
+    return stats
+
+
+def queue_reminders(chunk, db, now, stats):
+    stats['scanned'] += len(chunk)
+
+    due = {}
+    for booking_id, booking_date, booking_time, created_at in chunk:
+        start = timezone.make_aware(datetime.combine(booking_date, booking_time))
+        kind = due_reminder(start, created_at, now)
+        if kind:
+            due[booking_id] = kind
+    if not due:
+        return
+
+    with write_atomic(using=db):
+        queued = set(
+            OutboxMessage.objects.using(db).filter(
+                booking_id__in=list(due),
+                kind__in=list(REMINDERS)
+            ).values_list('booking_id', 'kind')
+        )
+        messages = [
+            OutboxMessage(booking_id=booking_id, kind=kind)
+            for booking_id, kind in due.items()
+            if (booking_id, kind) not in queued
+        ]
+        added = insert_new(messages, db)
+
+    for message in added:
+        stats[message.kind] += 1
+
+
+def insert_new(messages, db):
+    """
+    Insert outbox messages, skipping any already queued by another run
+
+    The caller holds the write lock, so on SQLite no other run can queue
+    one between its lookup and this insert; the (booking, kind) constraint
+    covers databases where one can. Only conflicts, which are rare, pay
+    for the row-by-row retry.
+
+    Returns:
+        list: The messages actually inserted
+    """
+    try:
+        with transaction.atomic(using=db):
+            return OutboxMessage.objects.using(db).bulk_create(messages)
+    except IntegrityError:
+        pass
+
+    added = []
+    for message in messages:
+        try:
+            with transaction.atomic(using=db):
+                OutboxMessage.objects.using(db).bulk_create([message])
+        except IntegrityError:
+            continue
+        added.append(message)
+    return added
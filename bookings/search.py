@@ -0,0 +1,222 @@
+"""
+Front-desk search over bookings by guest name, email and phone
+
+On SQLite, booking_search is a contentless FTS5 index over
+bookings_booking: it holds only the index, keyed by booking id. Triggers
+on bookings_booking keep it in step, so every write path updates it:
+save(), bulk_create, QuerySet.update() and delete(), archiving and shard
+moves.
+
+Every term is indexed with its restaurant's id in front ("17xsmith",
+"17p5550123"), so a restaurant's bookings form their own short posting
+lists. A search never reads another restaurant's matches, and lookups
+stay well under a millisecond on millions of bookings.
+
+Names match on the start of any word: "smi" finds John Smith, "john sm"
+needs both. Every separator in a name becomes a space before the prefix
+is added, and words joined by token characters are indexed both whole
+and apart, so "jane", "mary-jane" and "smith" all find "Smith,
+Mary-Jane". Emails match from their start: "jsmith@" but not "gmail". A
+query of digits and phone punctuation only is a phone number and matches
+the start of Booking.customer_phone_digits. Other databases fall back to
+prefix filters on the columns.
+
+The triggers belong to bookings_booking, and SQLite drops them whenever
+a migration rebuilds that table (most AlterField and RemoveField
+operations do). A post_migrate handler puts them back and re-indexes
+(restore_triggers), so later migrations need no extra step.
+"""
+
+import re
+
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from core.utils import normalize_phone
+from .models import Booking
+
+SEARCH_TABLE = 'booking_search'
+
+# Shortest digit string treated as a phone number
+MIN_PHONE_DIGITS = 3
+
+# Emails stay one term: the tokenizer keeps these inside words
+TOKEN_CHARS = ".@-+_'"
+TERM = re.compile(r"[\w.@+'\-]+")
+LETTER = re.compile(r'[^\W\d_]')
+
+# Characters the tokenizer splits names on, turned into spaces before
+# indexing so that every word gets its restaurant prefix. The tokenizer
+# splits on any other punctuation too, but each character costs a nested
+# replace() and SQLite's parser stops at about 28 levels, so only those
+# seen in names are listed.
+NAME_SEPARATORS = '\t\n\r\u00a0,/()&;:"!?\u2018\u2019\u2013\u2014'
+
+TRIGGERS = ('insert', 'delete', 'update')
+
+
+def _replace_sql(expression, chars):
+    """SQL replacing each of chars in expression with a space"""
+    for char in chars:
+        expression = f"replace({expression}, '{char.replace(chr(39), chr(39) * 2)}', ' ')"
+    return expression
+
+
+def _terms_sql(row):
+    """SQL for the text indexed for a bookings_booking row ('new' or 'old')"""
+    name_prefix = f"{row}.restaurant_id || 'x'"
+    words = _replace_sql(f"{row}.customer_name", NAME_SEPARATORS)
+    # "mary-jane" as typed, and "jane" on its own
+    parts = _replace_sql(words, TOKEN_CHARS)
+    return (
+        f"{name_prefix} || replace({words}, ' ', ' ' || {name_prefix}) || ' ' || "
+        f"{name_prefix} || replace({parts}, ' ', ' ' || {name_prefix}) || ' ' || "
+        f"{name_prefix} || {row}.customer_email || ' ' || "
+        f"{row}.restaurant_id || 'p' || {row}.customer_phone_digits"
+    )
+
+
+def _create_sql():
+    table = Booking._meta.db_table
+    tokenchars = TOKEN_CHARS.replace("'", "''")
+    changed = ' OR '.join(
+        f'old.{column} IS NOT new.{column}'
+        for column in ('restaurant_id', 'customer_name', 'customer_email', 'customer_phone_digits')
+    )
+    return [
+        # detail=none: search only asks which bookings hold a term prefix,
+        # so positions are not stored
+        f"""CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+            terms, content='',
+            tokenize="unicode61 remove_diacritics 2 tokenchars '{tokenchars}'", detail=none
+        )""",
+        f"""CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (new.id, {_terms_sql('new')});
+        END""",
+        f"""CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, terms) VALUES ('delete', old.id, {_terms_sql('old')});
+        END""",
+        # Status changes, the most common update, leave the index alone
+        f"""CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE ON {table} WHEN {changed} BEGIN
+            INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, terms) VALUES ('delete', old.id, {_terms_sql('old')});
+            INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (new.id, {_terms_sql('new')});
+        END""",
+    ]
+
+
+def install(connection):
+    """Create the search index and its triggers, indexing existing bookings"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for sql in _create_sql():
+            cursor.execute(sql)
+    rebuild(connection)
+
+
+def uninstall(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{trigger}')
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def is_installed(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+        return cursor.fetchone() is not None
+
+
+def missing_triggers(connection):
+    """Names of the index's triggers absent from the database"""
+    names = [f'{SEARCH_TABLE}_{trigger}' for trigger in TRIGGERS]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)", names
+        )
+        present = {row[0] for row in cursor.fetchall()}
+    return [name for name in names if name not in present]
+
+
+def restore_triggers(connection):
+    """
+    Recreate the triggers after a table rebuild dropped them, and re-index
+
+    Bookings written while they were missing are not in the index, so it
+    is rebuilt whenever one had to be recreated.
+
+    Returns:
+        bool: Whether anything was restored
+    """
+    if not is_installed(connection) or not missing_triggers(connection):
+        return False
+    with connection.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{trigger}')
+        for sql in _create_sql()[1:]:
+            cursor.execute(sql)
+    rebuild(connection)
+    return True
+
+
+def rebuild(connection):
+    """Re-index every booking, e.g. after loading rows with the triggers dropped"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('delete-all')")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, terms) "
+            f"SELECT new.id, {_terms_sql('new')} FROM {Booking._meta.db_table} new"
+        )
+
+
+def phone_digits(query):
+    """The digits of query if it is a phone number, else None"""
+    digits = normalize_phone(query)
+    if len(digits) < MIN_PHONE_DIGITS or LETTER.search(query):
+        return None
+    return digits
+
+
+def match_expression(restaurant_id, query):
+    """
+    FTS5 query for the bookings of a restaurant matching query
+
+    Returns:
+        str, or None when query has nothing to search for
+    """
+    restaurant_id = int(restaurant_id)
+    digits = phone_digits(query)
+    if digits:
+        return f'"{restaurant_id}p{digits}"*'
+    words = TERM.findall(query.lower())
+    if not words:
+        return None
+    return ' AND '.join(f'"{restaurant_id}x{word}"*' for word in words)
+
+
+def filter_bookings(queryset, restaurant, query, connection):
+    """
+    Narrow queryset to the bookings of restaurant matching query
+
+    On SQLite the index terms already carry the restaurant, and queryset
+    should not filter on it: SQLite would then walk the restaurant's
+    bookings instead of looking up the few matches by id.
+    """
+    if connection.vendor == 'sqlite':
+        expression = match_expression(restaurant.id, query)
+        if expression is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [expression]
+        ))
+
+    queryset = queryset.filter(restaurant=restaurant)
+    digits = phone_digits(query)
+    if digits:
+        return queryset.filter(customer_phone_digits__startswith=digits)
+    query = query.strip()
+    return queryset.filter(Q(customer_name__istartswith=query) | Q(customer_email__istartswith=query))
@@ -3,14 +3,31 @@ Serializers for Booking model
 """
 
 from rest_framework import serializers
-from .models import Booking
+from .models import Booking, Guest
+from core.tracing import TracedListSerializer, TracedSerializerMixin
 from restaurants.serializers import TablePublicSerializer
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class GuestSummarySerializer(serializers.ModelSerializer):
+    """
+    A guest's history, shown next to each of their bookings
+
+    Load bookings with select_related('guest') to serialize them without
+    a query per booking; BookingService.LIST_DEFERRED leaves the other
+    guest columns out of the join.
+    """
+
+    class Meta:
+        model = Guest
+        fields = ['id', 'name', 'visits', 'cancellations', 'no_shows', 'last_visit']
+        read_only_fields = fields
+
+
+class BookingSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     """
     Full booking serializer - for restaurant owner dashboard
     """
+    guest = GuestSummarySerializer(read_only=True)
     table_number = serializers.CharField(source='table.table_number', read_only=True)
     table_capacity = serializers.IntegerField(source='table.capacity', read_only=True)
     restaurant_name = serializers.CharField(source='restaurant.name', read_only=True)
@@ -25,7 +42,7 @@ class BookingSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'restaurant', 'restaurant_name',
             'table', 'table_number', 'table_capacity',
-            'customer_name', 'customer_email', 'customer_phone',
+            'customer_name', 'customer_email', 'customer_phone', 'guest',
             'party_size', 'booking_date', 'booking_time',
             'booking_datetime', 'end_datetime',
             'duration_hours', 'special_requests',
@@ -35,9 +52,10 @@ class BookingSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'restaurant', 'created_at', 'updated_at'
         ]
+        list_serializer_class = TracedListSerializer
 
 
-class BookingCreateSerializer(serializers.Serializer):
+class BookingCreateSerializer(TracedSerializerMixin, serializers.Serializer):
     """
     Serializer for creating bookings from public booking page
     """
@@ -78,7 +96,7 @@ class BookingCreateSerializer(serializers.Serializer):
         return value
 
 
-class AvailabilityCheckSerializer(serializers.Serializer):
+class AvailabilityCheckSerializer(TracedSerializerMixin, serializers.Serializer):
     """
     Serializer for checking availability
     """
@@ -101,9 +119,33 @@ class BookingStatsSerializer(serializers.Serializer):
     today_bookings = serializers.IntegerField()
     upcoming_bookings = serializers.IntegerField()
     cancelled_bookings = serializers.IntegerField()
+    archived_bookings = serializers.IntegerField()
     total_revenue_potential = serializers.DecimalField(
         max_digits=10,
         decimal_places=2,
         required=False
     )
 
+
+class BookingSearchSerializer(serializers.Serializer):
+    """
+    Query parameters for the front-desk booking search
+    """
+    q = serializers.CharField(min_length=2, max_length=100)
+    date = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class BookingExportSerializer(serializers.Serializer):
+    """
+    Query parameters for the CSV booking export
+    """
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    include_archived = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        """Ensure the date range is not reversed"""
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must be before date_to")
+        return data
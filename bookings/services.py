@@ -3,11 +3,18 @@ Booking business logic and availability checking
 This is the CORE of the platform
 """
 
-from django.db import transaction
+import heapq
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models import F
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Booking
+from . import search
+from .models import Booking, BookingArchive
+from .notifications import enqueue_confirmation
 from restaurants.models import Table
+from core import metrics, tracing
+from core.sharding import db_for_instance, db_for_restaurant
+from core.transactions import write_atomic
 
 
 class BookingService:
@@ -15,7 +22,25 @@ class BookingService:
     Service class to handle all booking-related business logic
     """
 
+    # Columns returned by get_booking_history (exports, analytics)
+    HISTORY_FIELDS = [
+        'id', 'booking_date', 'booking_time', 'duration_hours',
+        'table_number', 'party_size',
+        'customer_name', 'customer_email', 'customer_phone',
+        'status', 'special_requests', 'created_at',
+    ]
+
+    # Joined columns booking lists leave out: only the table and guest
+    # fields BookingSerializer shows are read, and converted, per row
+    LIST_DEFERRED = [
+        'table__restaurant', 'table__description', 'table__is_active',
+        'table__created_at', 'table__updated_at',
+        'guest__restaurant', 'guest__email', 'guest__phone', 'guest__phone_digits',
+        'guest__created_at', 'guest__updated_at',
+    ]
+
     @staticmethod
+    @tracing.traced()
     def check_table_availability(table, booking_date, booking_time, duration_hours=2.0):
         """
         Check if a table is available for the requested time slot
@@ -33,10 +58,10 @@ class BookingService:
         requested_start = timezone.make_aware(
             datetime.combine(booking_date, booking_time)
         )
-        requested_end = requested_start + timedelta(hours=duration_hours)
+        requested_end = requested_start + timedelta(hours=float(duration_hours))
 
         # Get all confirmed bookings for this table on this date
-        existing_bookings = Booking.objects.filter(
+        existing_bookings = Booking.objects.using(db_for_instance(table)).filter(
             table=table,
             booking_date=booking_date,
             status='confirmed'
@@ -56,6 +81,8 @@ class BookingService:
         return True, "Table is available"
 
     @staticmethod
+    @metrics.AVAILABILITY_CHECK_SECONDS.time()
+    @tracing.traced()
     def get_available_tables(restaurant, booking_date, booking_time, party_size, duration_hours=2.0):
         """
         Get all available tables for given criteria
@@ -68,28 +95,43 @@ class BookingService:
             duration_hours: Duration in hours
 
         Returns:
-            QuerySet of available Table objects
+            list of available Table objects
         """
+        db = db_for_restaurant(restaurant)
+
         # Get all active tables that can accommodate the party
-        suitable_tables = Table.objects.filter(
+        suitable_tables = list(Table.objects.using(db).filter(
             restaurant=restaurant,
             is_active=True,
             capacity__gte=party_size
+        ))
+        if not suitable_tables:
+            return []
+
+        requested_start = timezone.make_aware(
+            datetime.combine(booking_date, booking_time)
         )
+        requested_end = requested_start + timedelta(hours=float(duration_hours))
 
-        available_tables = []
+        # One query for the whole restaurant's bookings that day rather than
+        # one per table, over the (restaurant, status, booking_date) index
+        existing_bookings = restaurant.bookings.using(db).filter(
+            status='confirmed',
+            booking_date=booking_date
+        ).only('restaurant', 'table', 'booking_date', 'booking_time', 'duration_hours').order_by()
 
-        for table in suitable_tables:
-            is_available, _ = BookingService.check_table_availability(
-                table, booking_date, booking_time, duration_hours
-            )
-            if is_available:
-                available_tables.append(table)
+        # Same overlap test as check_table_availability
+        booked_table_ids = {
+            booking.table_id
+            for booking in existing_bookings
+            if booking.booking_datetime < requested_end and booking.end_datetime > requested_start
+        }
 
-        return available_tables
+        return [table for table in suitable_tables if table.id not in booked_table_ids]
 
     @staticmethod
-    @transaction.atomic
+    @metrics.BOOKING_CREATE_SECONDS.time()
+    @tracing.traced()
     def create_booking(restaurant, table_id, customer_data, booking_data):
         """
         Create a new booking with proper validation and race condition prevention
@@ -103,62 +145,83 @@ class BookingService:
         Returns:
             tuple: (success: bool, booking: Booking or None, message: str)
         """
-        try:
-            # Get table with row-level lock to prevent race conditions
-            table = Table.objects.select_for_update().get(
-                id=table_id,
-                restaurant=restaurant,
-                is_active=True
-            )
-
-            # Extract booking data
-            booking_date = booking_data['booking_date']
-            booking_time = booking_data['booking_time']
-            party_size = booking_data['party_size']
-            duration_hours = booking_data.get('duration_hours', 2.0)
+        db = db_for_restaurant(restaurant)
 
-            # Validate party size
-            if party_size > table.capacity:
-                return False, None, f"Table capacity is {table.capacity}, but party size is {party_size}"
-
-            # Check availability (double-check even with lock)
-            is_available, message = BookingService.check_table_availability(
-                table, booking_date, booking_time, duration_hours
-            )
-
-            if not is_available:
-                return False, None, message
-
-            # Validate booking is not in the past
-            booking_datetime = timezone.make_aware(
-                datetime.combine(booking_date, booking_time)
-            )
-            if booking_datetime < timezone.now():
-                return False, None, "Cannot book in the past"
-
-            # Create the booking
-            booking = Booking.objects.create(
-                restaurant=restaurant,
-                table=table,
-                customer_name=customer_data['customer_name'],
-                customer_email=customer_data['customer_email'],
-                customer_phone=customer_data['customer_phone'],
-                party_size=party_size,
-                booking_date=booking_date,
-                booking_time=booking_time,
-                duration_hours=duration_hours,
-                special_requests=booking_data.get('special_requests', ''),
-                status='confirmed'
-            )
-
-            return True, booking, "Booking confirmed successfully"
+        try:
+            with metrics.BOOKING_TRANSACTIONS_IN_PROGRESS.track_in_progress(), write_atomic(using=db):
+                # Lock the table's row against concurrent bookings. SQLite
+                # ignores select_for_update(): there write_atomic() already
+                # holds the database's write lock, so concurrent writers
+                # wait for it to commit
+                with tracing.span('booking.lock_table', table_id=table_id):
+                    table = Table.objects.using(db).select_for_update().get(
+                        id=table_id,
+                        restaurant=restaurant,
+                        is_active=True
+                    )
+
+                # Extract booking data
+                booking_date = booking_data['booking_date']
+                booking_time = booking_data['booking_time']
+                party_size = booking_data['party_size']
+                duration_hours = booking_data.get('duration_hours', 2.0)
+
+                # Validate party size
+                if party_size > table.capacity:
+                    metrics.BOOKING_ATTEMPTS.labels('rejected').inc()
+                    return False, None, f"Table capacity is {table.capacity}, but party size is {party_size}"
+
+                # Check availability (double-check even with lock)
+                is_available, message = BookingService.check_table_availability(
+                    table, booking_date, booking_time, duration_hours
+                )
+
+                if not is_available:
+                    metrics.BOOKING_ATTEMPTS.labels('conflict').inc()
+                    return False, None, message
+
+                # Validate booking is not in the past
+                booking_datetime = timezone.make_aware(
+                    datetime.combine(booking_date, booking_time)
+                )
+                if booking_datetime < timezone.now():
+                    metrics.BOOKING_ATTEMPTS.labels('rejected').inc()
+                    return False, None, "Cannot book in the past"
+
+                with tracing.span('booking.insert'):
+                    # Create the booking
+                    booking = Booking.objects.using(db).create(
+                        restaurant=restaurant,
+                        table=table,
+                        customer_name=customer_data['customer_name'],
+                        customer_email=customer_data['customer_email'],
+                        customer_phone=customer_data['customer_phone'],
+                        party_size=party_size,
+                        booking_date=booking_date,
+                        booking_time=booking_time,
+                        duration_hours=duration_hours,
+                        special_requests=booking_data.get('special_requests', ''),
+                        status='confirmed'
+                    )
+
+                    # Confirmation email goes out from the outbox worker, and
+                    # only if this transaction commits
+                    enqueue_confirmation(booking)
+
+                metrics.BOOKING_ATTEMPTS.labels('created').inc()
+                return True, booking, "Booking confirmed successfully"
 
         except Table.DoesNotExist:
+            metrics.BOOKING_ATTEMPTS.labels('rejected').inc()
             return False, None, "Table not found or not available"
         except Exception as e:
+            # SQLite gave up waiting for another writer (busy timeout)
+            locked = isinstance(e, OperationalError) and 'locked' in str(e)
+            metrics.BOOKING_ATTEMPTS.labels('lock_timeout' if locked else 'error').inc()
             return False, None, f"Error creating booking: {str(e)}"
 
     @staticmethod
+    @tracing.traced()
     def cancel_booking(booking_id, restaurant):
         """
         Cancel a booking
@@ -170,16 +233,20 @@ class BookingService:
         Returns:
             tuple: (success: bool, message: str)
         """
-        try:
-            booking = Booking.objects.get(
-                id=booking_id,
-                restaurant=restaurant
-            )
+        db = db_for_restaurant(restaurant)
 
-            if booking.cancel():
-                return True, "Booking cancelled successfully"
-            else:
-                return False, "Booking cannot be cancelled"
+        try:
+            with write_atomic(using=db):
+                booking = Booking.objects.using(db).get(
+                    id=booking_id,
+                    restaurant=restaurant
+                )
+
+                if booking.cancel():
+                    metrics.BOOKINGS_CANCELLED.inc()
+                    return True, "Booking cancelled successfully"
+                else:
+                    return False, "Booking cannot be cancelled"
 
         except Booking.DoesNotExist:
             return False, "Booking not found"
@@ -196,7 +263,12 @@ class BookingService:
         Returns:
             QuerySet of Booking objects
         """
-        base_query = Booking.objects.filter(restaurant=restaurant)
+        # Through the reverse relation every booking gets this restaurant
+        # instance without a query; tables and guests live on the same
+        # database and are joined, with the columns the list shows only
+        base_query = restaurant.bookings.using(db_for_restaurant(restaurant)).select_related(
+            'table', 'guest'
+        ).defer(*BookingService.LIST_DEFERRED)
 
         today = timezone.now().date()
         now = timezone.now()
@@ -223,3 +295,72 @@ class BookingService:
 
         else:  # 'all'
             return base_query
+
+    @staticmethod
+    @metrics.BOOKING_SEARCH_SECONDS.time()
+    @tracing.traced()
+    def search_bookings(restaurant, query, booking_date=None, limit=20):
+        """
+        Find a restaurant's bookings by guest name, email or phone
+
+        Args:
+            restaurant: Restaurant instance
+            query: Start of a name or email word, or of a phone number
+            booking_date: Only bookings on this date (optional)
+            limit: Most bookings returned
+
+        Returns:
+            list of Booking objects, latest first
+        """
+        db = db_for_restaurant(restaurant)
+        bookings = Booking.objects.using(db).select_related('table', 'guest').defer(*BookingService.LIST_DEFERRED)
+        if booking_date:
+            bookings = bookings.filter(booking_date=booking_date)
+        bookings = list(search.filter_bookings(bookings, restaurant, query, connections[db or DEFAULT_DB_ALIAS])[:limit])
+        # As the reverse relation would, saving a query per booking
+        for booking in bookings:
+            booking.restaurant = restaurant
+        return bookings
+
+    @staticmethod
+    def get_booking_history(restaurant, date_from=None, date_to=None, include_archived=True):
+        """
+        Stream bookings from the hot table and the archive, oldest first
+
+        Args:
+            restaurant: Restaurant instance
+            date_from: First booking date to include (optional)
+            date_to: Last booking date to include (optional)
+            include_archived: Also read BookingArchive
+
+        Returns:
+            Iterator of dicts with the HISTORY_FIELDS keys plus 'archived'
+        """
+        db = db_for_restaurant(restaurant)
+        filters = {'restaurant': restaurant}
+        if date_from:
+            filters['booking_date__gte'] = date_from
+        if date_to:
+            filters['booking_date__lte'] = date_to
+
+        def rows(queryset, archived, **columns):
+            fields = [name for name in BookingService.HISTORY_FIELDS if name not in columns]
+            queryset = queryset.filter(**filters).order_by('booking_date', 'booking_time', 'id')
+            for row in queryset.values(*fields, **columns).iterator(chunk_size=2000):
+                row['archived'] = archived
+                yield row
+
+        sources = [rows(Booking.objects.using(db), False, table_number=F('table__table_number'))]
+        if include_archived:
+            sources.insert(0, rows(BookingArchive.objects.using(db), True))
+
+        return heapq.merge(
+            *sources,
+            key=lambda row: (row['booking_date'], row['booking_time'], row['id'])
+        )
+
+    @staticmethod
+    @tracing.traced()
+    def count_archived_bookings(restaurant):
+        """Number of a restaurant's bookings in cold storage"""
+        return BookingArchive.objects.using(db_for_restaurant(restaurant)).filter(restaurant=restaurant).count()
@@ -0,0 +1,15 @@
+"""
+Signal handlers for the bookings app
+"""
+
+from django.db import connections
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from . import search
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    """Put back search triggers a migration dropped by rebuilding bookings_booking"""
+    if sender.name == 'bookings':
+        search.restore_triggers(connections[using])
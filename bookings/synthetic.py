@@ -0,0 +1,520 @@
+"""
+Deterministic synthetic data at production scale
+
+Used by `manage.py generate_data` and by `benchmark_bookings --synthetic`.
+Everything is drawn from random.Random seeded per restaurant, so a seed,
+a start date and the volume parameters always give the same rows.
+
+Bookings follow three sittings a day (lunch, early and late dinner) that
+never overlap on a table, with peak-hour start times, busier weekends,
+per-restaurant popularity, party sizes that fit the table and a pool of
+regulars who book again and again. Past days are completed, no-show or
+cancelled; future days mostly confirmed. Each restaurant's guests are
+deduplicated and counted as Booking.save() would, and written with their
+final statistics.
+
+Users, restaurants and tables go through bulk_create. Bookings and guests,
+which are most of the rows, are inserted with executemany on pre-converted
+tuples:
+bulk_create prepares every field of every object through the model layer,
+which caps it at a few thousand rows per second. Each database is loaded
+in one transaction with relaxed SQLite pragmas and foreign key checks
+off. The Booking indexes and search triggers are dropped for the load,
+and the indexes, search included, rebuilt once at the end.
+
+That is only safe on a database nobody else uses: generate() refuses to
+load into a database that already has restaurants or bookings, or into
+the default database outside DEBUG, unless forced.
+"""
+
+import functools
+import itertools
+import random
+import time
+import uuid
+from bisect import bisect_right
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core.sharding import db_for_restaurant, default_shard, shard_databases, sharding_enabled
+from core.utils import normalize_phone
+from restaurants.models import Restaurant, Table
+from . import search
+from .models import Booking, Guest
+
+# Sitting -> (start times with weights, duration in hours, base occupancy).
+# Early dinner ends by 19:30, when the late sitting starts.
+SITTINGS = {
+    'lunch': ([(dt_time(11, 30), 2), (dt_time(12), 5), (dt_time(12, 30), 6), (dt_time(13), 3)], Decimal('1.5'), 0.35),
+    'early': ([(dt_time(17), 3), (dt_time(17, 15), 2), (dt_time(17, 30), 4)], Decimal('2.0'), 0.40),
+    'late': ([(dt_time(19, 30), 6), (dt_time(19, 45), 3), (dt_time(20), 5), (dt_time(20, 30), 3), (dt_time(21), 1)], Decimal('2.0'), 0.55),
+}
+
+# Monday..Sunday demand multipliers
+WEEKDAY_DEMAND = [0.6, 0.7, 0.8, 0.9, 1.3, 1.4, 1.0]
+
+TABLE_CAPACITIES = ([2, 4, 6, 8, 10], [30, 40, 18, 9, 3])
+
+# Share of seats filled: tables for 4 mostly seat 2 to 4
+PARTY_FILL = ([1.0, 0.75, 0.5, 0.25], [45, 30, 20, 5])
+
+PAST_STATUSES = (['completed', 'no_show', 'cancelled'], [85, 5, 10])
+FUTURE_STATUSES = (['confirmed', 'cancelled'], [92, 8])
+
+# Days between booking and visit
+LEAD_DAYS = ([0, 1, 2, 3, 5, 7, 14, 21, 30], [15, 20, 15, 12, 12, 10, 8, 5, 3])
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+    'Priya', 'Wei', 'Aisha', 'Mohammed', 'Yuki', 'Olga', 'Ana', 'Luis', 'Fatima', 'Hiroshi',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Patel', 'Nguyen', 'Kim',
+]
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'icloud.com', 'example.com']
+# Guests type their number in many ways
+PHONE_FORMATS = [
+    '{area}{exchange}{line}',
+    '({area}) {exchange}-{line}',
+    '{area}-{exchange}-{line}',
+    '+1 {area} {exchange} {line}',
+    '+1{area}{exchange}{line}',
+]
+# Distinct one-off guests (see guest_pool)
+GUEST_POOL_SIZE = 100000
+SPECIAL_REQUESTS = [
+    'Window seat preferred', 'Birthday celebration', 'High chair needed', 'Wheelchair access',
+    'Quiet table please', 'Anniversary', 'Vegetarian in party', 'Nut allergy',
+]
+
+# Booking columns written by the loader, in tuple order; the ones in
+# PREPARED_COLUMNS go through the model field's database conversion
+BOOKING_COLUMNS = [
+    'restaurant_id', 'table_id', 'guest_id', 'customer_name', 'customer_email', 'customer_phone', 'customer_phone_digits',
+    'party_size', 'booking_date', 'booking_time', 'duration_hours', 'special_requests',
+    'status', 'confirmation_sent', 'created_at', 'updated_at',
+]
+PREPARED_COLUMNS = ['booking_date', 'booking_time', 'duration_hours', 'confirmation_sent', 'created_at']
+
+# Guest columns, in the order of the lists booking_rows builds
+GUEST_COLUMNS = [
+    'id', 'restaurant_id', 'name', 'email', 'phone', 'phone_digits',
+    'visits', 'cancellations', 'no_shows', 'last_visit', 'created_at', 'updated_at',
+]
+# Booking status -> position of its counter in a guest list
+GUEST_COUNTERS = {status: GUEST_COLUMNS.index(counter) for status, counter in Guest.STATUS_COUNTERS.items()}
+LAST_VISIT = GUEST_COLUMNS.index('last_visit')
+
+
+def restaurant_rng(seed, index, purpose):
+    """Independent random stream per restaurant and purpose"""
+    return random.Random(f'{seed}:{index}:{purpose}')
+
+
+def weighted(values, weights):
+    """
+    (values, cumulative probabilities): draw with
+    values[bisect_right(cumulative, rng.random())]
+
+    random.choices() recomputes the cumulative weights on every call,
+    which dominated the cost of generating a row.
+    """
+    total = sum(weights)
+    cumulative = list(itertools.accumulate(weight / total for weight in weights))
+    cumulative[-1] = 1.0
+    return values, cumulative
+
+
+def make_guest(rng):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    phone = rng.choice(PHONE_FORMATS).format(
+        area=rng.randrange(201, 990), exchange=rng.randrange(200, 1000), line=f'{rng.randrange(10000):04d}'
+    )
+    email = f'{first}.{last}{rng.randrange(1000)}@{rng.choice(EMAIL_DOMAINS)}'.lower()
+    return f'{first} {last}', email, phone, normalize_phone(phone)
+
+
+def guest_pool(seed):
+    """
+    The occasional guests, shared by all restaurants
+
+    Making a guest costs more than the rest of a row, so one-off guests are
+    drawn from this pool; with GUEST_POOL_SIZE of them a restaurant rarely
+    sees the same one twice.
+    """
+    rng = random.Random(f'{seed}:guests')
+    return [make_guest(rng) for _ in range(GUEST_POOL_SIZE)]
+
+
+def party_sizes(capacity):
+    """Party size distribution for a table, from the share of seats filled"""
+    sizes = {}
+    for fill, weight in zip(*PARTY_FILL):
+        size = max(1, round(capacity * fill))
+        sizes[size] = sizes.get(size, 0) + weight
+    return weighted(list(sizes), list(sizes.values()))
+
+
+def booking_rows(restaurant, tables, start_date, days, today, rng, prep, guests, guest_ids, profiles):
+    """
+    Rows (in BOOKING_COLUMNS order) for one restaurant
+
+    The inner loop runs once per row and is written for speed: every
+    distribution is precomputed and drawn with one random() and a bisect.
+
+    Args:
+        restaurant: Restaurant instance
+        tables: list of (table id, capacity)
+        prep: dict of column -> function converting a value for the database
+        guests: guest_pool()
+        guest_ids: iterator of free Guest ids
+        profiles: list the restaurant's guests are added to, in
+            GUEST_COLUMNS order without the timestamps, once its last
+            row has been taken
+    """
+    popularity = min(rng.lognormvariate(0, 0.35), 1.8)
+    regulars = [make_guest(rng) for _ in range(max(5, len(tables) * 3))]
+    sittings = [
+        (weighted([prep['booking_time'](time) for time, _ in starts], [weight for _, weight in starts]),
+         prep['duration_hours'](duration), occupancy)
+        for starts, duration, occupancy in SITTINGS.values()
+    ]
+    party = {capacity: party_sizes(capacity) for _, capacity in tables}
+    past_statuses, future_statuses = weighted(*PAST_STATUSES), weighted(*FUTURE_STATUSES)
+    lead_values, lead_cumulative = weighted(*LEAD_DAYS)
+    sent = {status: prep['confirmation_sent'](status != 'cancelled') for status in PAST_STATUSES[0] + FUTURE_STATUSES[0]}
+    created_at = prep['created_at']
+    restaurant_id = restaurant.id
+    random_ = rng.random
+    guest_count, regular_count, request_count = len(guests), len(regulars), len(SPECIAL_REQUESTS)
+    # Guests of this restaurant, matched by email then phone as in GuestQuerySet.for_booking
+    by_email, by_phone, restaurant_profiles = {}, {}, []
+
+    for day in range(days):
+        booking_date = start_date + timedelta(days=day)
+        date_value = prep['booking_date'](booking_date)
+        demand = popularity * WEEKDAY_DEMAND[booking_date.weekday()]
+        status_values, status_cumulative = past_statuses if booking_date < today else future_statuses
+        day_sittings = [
+            (start_values, start_cumulative, duration, min(occupancy * demand, 0.95))
+            for (start_values, start_cumulative), duration, occupancy in sittings
+        ]
+        created_on = [booking_date - timedelta(days=lead) for lead in lead_values]
+
+        for table_id, capacity in tables:
+            party_values, party_cumulative = party[capacity]
+            for start_values, start_cumulative, duration, occupancy in day_sittings:
+                if random_() >= occupancy:
+                    continue
+                # A uniform draw below p, divided by p, is a fresh uniform draw
+                draw = random_()
+                if draw < 0.3:
+                    name, email, phone, digits = regulars[int(draw / 0.3 * regular_count)]
+                else:
+                    name, email, phone, digits = guests[int((draw - 0.3) / 0.7 * guest_count)]
+                status = status_values[bisect_right(status_cumulative, random_())]
+                profile = by_email.get(email) or by_phone.get(digits)
+                if profile is None:
+                    profile = [next(guest_ids), restaurant_id, name, email, phone, digits, 0, 0, 0, None]
+                    restaurant_profiles.append(profile)
+                    by_email[email] = by_phone[digits] = profile
+                if status in GUEST_COUNTERS:
+                    profile[GUEST_COUNTERS[status]] += 1
+                    if status == 'completed':
+                        # Days go forward: the latest visit so far
+                        profile[LAST_VISIT] = booking_date
+                created = created_at(created_on[bisect_right(lead_cumulative, random_())], 8 + int(random_() * 15))
+                draw = random_()
+                special_requests = SPECIAL_REQUESTS[int(draw * 10 * request_count)] if draw < 0.1 else ''
+
+                yield (
+                    restaurant_id, table_id, profile[0], name, email, phone, digits,
+                    party_values[bisect_right(party_cumulative, random_())], date_value,
+                    start_values[bisect_right(start_cumulative, random_())], duration,
+                    special_requests, status, sent[status], created, created,
+                )
+
+    profiles.extend(restaurant_profiles)
+
+
+def value_preparers(connection):
+    """
+    Column -> cached conversion of a Python value for this connection
+
+    created_at takes a date and an hour instead of a datetime.
+    """
+    def preparer(field):
+        @functools.lru_cache(maxsize=None)
+        def prepare(value):
+            return field.get_db_prep_save(value, connection)
+        return prepare
+
+    preparers = {column: preparer(Booking._meta.get_field(column)) for column in PREPARED_COLUMNS}
+    prepare_datetime = preparers['created_at']
+    tz = timezone.get_current_timezone()
+
+    # Rows are created on the hour: cache by (date, hour), skipping make_aware
+    @functools.lru_cache(maxsize=None)
+    def created_at(day, hour):
+        return prepare_datetime(timezone.make_aware(datetime.combine(day, dt_time(hour)), tz))
+
+    preparers['created_at'] = created_at
+    return preparers
+
+
+@contextmanager
+def relaxed_pragmas(connection):
+    """
+    Trade durability for speed while loading a throwaway database
+
+    A crash during the load can corrupt the database file: only use this
+    on databases that can be regenerated.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+
+    relaxed = {
+        'synchronous': 'OFF',
+        'cache_size': -262144,
+        'temp_store': 'MEMORY',
+    }
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+        # WAL databases stay in WAL: switching needs exclusive access
+        if journal_mode.lower() != 'wal':
+            relaxed['journal_mode'] = 'MEMORY'
+        previous = {}
+        for name in relaxed:
+            cursor.execute(f'PRAGMA {name}')
+            previous[name] = cursor.fetchone()[0]
+        for name, value in relaxed.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def deferred_indexes(connection, model):
+    """
+    Drop a table's indexes and triggers for a bulk load and restore them
+    afterwards
+
+    Building an index once over sorted data is much cheaper than updating
+    it row by row. The same goes for the search index the Booking triggers
+    maintain, which is rebuilt at the end. Run it inside the load
+    transaction, so a failed load also restores them.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+
+    with connection.cursor() as cursor:
+        # Automatic indexes (primary key, unique) have no SQL and stay
+        cursor.execute(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE type IN ('index', 'trigger') AND tbl_name = %s AND sql IS NOT NULL",
+            [model._meta.db_table]
+        )
+        deferred = cursor.fetchall()
+        for kind, name, _ in deferred:
+            cursor.execute(f'DROP {kind.upper()} "{name}"')
+    yield
+    with connection.cursor() as cursor:
+        for _, _, sql in deferred:
+            cursor.execute(sql)
+    if model is Booking and search.is_installed(connection):
+        search.rebuild(connection)
+
+
+def write_guests(cursor, sql, profiles, connection):
+    """Insert the guest lists from booking_rows and empty profiles; returns how many"""
+    prepare_date = Guest._meta.get_field('last_visit').get_db_prep_save
+    now = Guest._meta.get_field('created_at').get_db_prep_save(timezone.now(), connection)
+    count = len(profiles)
+    cursor.executemany(sql, [
+        (*profile[:LAST_VISIT], prepare_date(profile[LAST_VISIT], connection), now, now)
+        for profile in profiles
+    ])
+    profiles.clear()
+    return count
+
+
+def next_id(connection, model):
+    """First primary key of model's table above every id used, or reserved for a shard"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX(id) FROM "{table}"')
+        last = cursor.fetchone()[0] or 0
+        if connection.vendor == 'sqlite':
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            last = max(last, row[0] if row else 0)
+    return last + 1
+
+
+def check_target():
+    """
+    Raise ValueError unless every database the load writes to is a
+    throwaway one
+
+    The load relaxes durability and drops the booking indexes, so it must
+    not run next to real traffic: every database has to be empty, and
+    the default database is only used with DEBUG on.
+    """
+    if Restaurant.objects.using(DEFAULT_DB_ALIAS).exists():
+        raise ValueError(f"Database {DEFAULT_DB_ALIAS!r} already has restaurants")
+    for db in shard_databases():
+        if Booking.objects.using(db).exists():
+            raise ValueError(f"Database {db!r} already has bookings")
+    if not settings.DEBUG and DEFAULT_DB_ALIAS in shard_databases():
+        raise ValueError(f"Refusing to load bookings into {DEFAULT_DB_ALIAS!r} with DEBUG off")
+
+
+def create_restaurants(count, tables, seed):
+    """Owners, restaurants and their tables; returns {restaurant: [(table id, capacity)]}"""
+    User = get_user_model()
+    if User.objects.filter(username=f'synthetic-{seed}-0').exists():
+        raise ValueError(f"Data for seed {seed} already exists; pick another seed")
+
+    owners = User.objects.bulk_create([
+        User(username=f'synthetic-{seed}-{index}', role='OWNER', password='!')
+        for index in range(count)
+    ], batch_size=5000)
+
+    restaurants = []
+    for index, owner in enumerate(owners):
+        rng = restaurant_rng(seed, index, 'restaurant')
+        qr_code_id = uuid.UUID(int=rng.getrandbits(128))
+        restaurants.append(Restaurant(
+            owner=owner,
+            name=f'{rng.choice(LAST_NAMES)}\'s {rng.choice(["Bistro", "Kitchen", "Grill", "Trattoria", "Diner", "Cafe"])} {index}',
+            email=f'restaurant{index}@example.com',
+            phone=f'555{rng.randrange(10 ** 7):07d}',
+            address=f'{rng.randrange(1, 9999)} Main Street',
+            city='Springfield',
+            state='IL',
+            zip_code=f'{rng.randrange(10000, 99999)}',
+            qr_code_id=qr_code_id,
+            # bulk_create skips the pre_save signal that assigns shards
+            shard=default_shard(qr_code_id) if sharding_enabled() else ''
+        ))
+    restaurants = Restaurant.objects.bulk_create(restaurants, batch_size=5000)
+
+    layout = {}
+    for index, restaurant in enumerate(restaurants):
+        rng = restaurant_rng(seed, index, 'tables')
+        size = max(2, round(tables * rng.uniform(0.5, 1.5)))
+        layout[restaurant] = [
+            Table(restaurant=restaurant, table_number=str(number + 1), capacity=rng.choices(*TABLE_CAPACITIES)[0])
+            for number in range(size)
+        ]
+
+    by_database = {}
+    for restaurant, restaurant_tables in layout.items():
+        by_database.setdefault(db_for_restaurant(restaurant) or DEFAULT_DB_ALIAS, []).extend(restaurant_tables)
+    for db, database_tables in by_database.items():
+        Table.objects.using(db).bulk_create(database_tables, batch_size=5000)
+
+    return {
+        restaurant: [(table.id, table.capacity) for table in restaurant_tables]
+        for restaurant, restaurant_tables in layout.items()
+    }
+
+
+def generate(restaurants, tables, days, start_date, seed, batch_size=50000, defer_indexes=True, progress=None,
+             force=False):
+    """
+    Create the whole data set
+
+    Args:
+        restaurants: Number of restaurants (one owner each)
+        tables: Average tables per restaurant
+        days: Days of bookings from start_date
+        start_date: First booking date; days before today are in the past
+        seed: Seed of every random choice
+        batch_size: Booking rows per executemany call
+        defer_indexes: Rebuild the Booking indexes after the load
+        progress: Optional callable(rows so far, elapsed seconds)
+        force: Skip check_target(), for databases known to be throwaway
+
+    Returns:
+        dict: restaurants (list), tables, bookings, guests and seconds: in
+        total, inserting bookings and guests (load_seconds) and rebuilding
+        indexes (index_seconds)
+    """
+    if not force:
+        check_target()
+    started = time.perf_counter()
+    layout = create_restaurants(restaurants, tables, seed)
+    guests = guest_pool(seed)
+    today = timezone.localdate()
+
+    by_database = {}
+    for index, restaurant in enumerate(layout):
+        by_database.setdefault(db_for_restaurant(restaurant) or DEFAULT_DB_ALIAS, []).append((index, restaurant))
+
+    columns = ', '.join(f'"{column}"' for column in BOOKING_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(BOOKING_COLUMNS))
+    sql = f'INSERT INTO "{Booking._meta.db_table}" ({columns}) VALUES ({placeholders})'
+    guest_sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+        Guest._meta.db_table,
+        ', '.join(f'"{column}"' for column in GUEST_COLUMNS),
+        ', '.join(['%s'] * len(GUEST_COLUMNS))
+    )
+
+    total = guest_total = 0
+    load_seconds = index_seconds = 0.0
+    for db, members in by_database.items():
+        connection = connections[db]
+        prep = value_preparers(connection)
+        guest_ids = itertools.count(next_id(connection, Guest))
+        profiles = []
+        load_started = time.perf_counter()
+        # As in loaddata: the rows are valid by construction, so skip the
+        # foreign key lookups SQLite would make for every one of them
+        with relaxed_pragmas(connection), connection.constraint_checks_disabled(), transaction.atomic(using=db):
+            indexes = deferred_indexes(connection, Booking) if defer_indexes else nullcontext()
+            with indexes, connection.cursor() as cursor:
+                rows = itertools.chain.from_iterable(
+                    booking_rows(
+                        restaurant, layout[restaurant], start_date, days, today,
+                        restaurant_rng(seed, index, 'bookings'), prep, guests, guest_ids, profiles
+                    )
+                    for index, restaurant in members
+                )
+                while batch := list(itertools.islice(rows, batch_size)):
+                    cursor.executemany(sql, batch)
+                    total += len(batch)
+                    # Guests of the restaurants finished so far
+                    guest_total += write_guests(cursor, guest_sql, profiles, connection)
+                    if progress:
+                        progress(total, time.perf_counter() - started)
+                guest_total += write_guests(cursor, guest_sql, profiles, connection)
+                rebuild_started = time.perf_counter()
+            index_seconds += time.perf_counter() - rebuild_started
+        load_seconds += rebuild_started - load_started
+
+    return {
+        'restaurants': list(layout),
+        'tables': sum(len(restaurant_tables) for restaurant_tables in layout.values()),
+        'bookings': total,
+        'guests': guest_total,
+        'seconds': time.perf_counter() - started,
+        'load_seconds': load_seconds,
+        'index_seconds': index_seconds,
+    }
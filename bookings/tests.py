@@ -1,3 +1,1165 @@
-from django.test import TestCase
+"""
+Query budget and query plan tests for the booking endpoints
 
-# Create your tests here.
+Each endpoint declares the most queries it may run, checked at two data
+sizes so that an N+1 (a query per booking or per table) fails here. Plan
+tests run EXPLAIN QUERY PLAN on the hot booking queries and check that
+SQLite searches the intended index instead of scanning the table. Search
+tests check that the booking search index follows every write, and guest
+tests that the guest statistics follow every status change. Closing and
+archive tests check the maintenance jobs' boundaries, and that a booking
+is always in exactly one of the hot and archive tables. Notification
+tests cover the email outbox: what is queued, retried and queued only once.
+Tracing tests check the spans of a booking, from the middleware's root
+span down, instrumentation tests the queries, timings and status recorded
+per sampled request, and benchmark tests that the regression gate needs
+a baseline.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, time, timedelta
+from smtplib import SMTPException
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import instrumentation, tracing
+from core.admin_utils import EstimatedCountPaginator
+from core.sharding import db_for_restaurant
+from restaurants.models import Restaurant, Table
+from . import maintenance, search
+from .maintenance import archive_bookings, backfill_guests, close_finished_bookings, update_status
+from .models import Booking, BookingArchive, Guest, OutboxMessage
+from .notifications import claim_due_messages, enqueue_confirmation, schedule_reminders, send_outbox_messages
+from .services import BookingService
+from .signals import restore_search_triggers
+
+FILTERS = ['all', 'today', 'upcoming', 'past', 'cancelled']
+
+
+def index_name(*fields):
+    """Name of the Booking index on exactly these fields"""
+    for index in Booking._meta.indexes:
+        if list(index.fields) == list(fields):
+            return index.name
+    raise LookupError(f"No Booking index on {fields}")
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Helpers for query budgets and query plans
+
+    Queries are counted on every database, so budgets hold whether or not
+    bookings are sharded.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        # Throttle counters live in the cache
+        cache.clear()
+
+    @contextmanager
+    def capture_queries(self):
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in connections
+            ]
+            yield contexts
+        self.captured = [query['sql'] for context in contexts for query in context.captured_queries]
+
+    @contextmanager
+    def assertMaxQueries(self, maximum):
+        with self.capture_queries():
+            yield
+        if len(self.captured) > maximum:
+            self.fail(
+                f"{len(self.captured)} queries executed, budget is {maximum}:\n" +
+                '\n'.join(self.captured)
+            )
+
+    def count_queries(self, func):
+        with self.capture_queries():
+            func()
+        return len(self.captured)
+
+    def query_plan(self, sql, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, plan, name):
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {name}\b', plan)
+        self.assertIsNone(re.search(r'SCAN bookings_booking(?! USING)', plan), plan)
+
+
+class BookingFixturesMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        cls.restaurant = Restaurant.objects.create(
+            owner=cls.owner,
+            name='Budget Bistro',
+            email='bistro@example.com',
+            phone='5550000000',
+            address='1 Main Street',
+            city='Springfield',
+            state='IL',
+            zip_code='62701'
+        )
+        cls.db = db_for_restaurant(cls.restaurant) or DEFAULT_DB_ALIAS
+        cls.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def add_tables(self, count):
+        start = Table.objects.using(self.db).filter(restaurant=self.restaurant).count()
+        return Table.objects.using(self.db).bulk_create([
+            Table(restaurant=self.restaurant, table_number=str(start + number + 1), capacity=4)
+            for number in range(count)
+        ])
+
+    def book(self, email='jane@example.com', phone='(555) 010-2030', days=1, at=time(19), **fields):
+        """One booking at self.table, `days` from today"""
+        return Booking.objects.using(self.db).create(
+            restaurant=self.restaurant,
+            table=self.table,
+            customer_name='Jane Guest',
+            customer_email=email,
+            customer_phone=phone,
+            party_size=2,
+            booking_date=timezone.localdate() + timedelta(days=days),
+            booking_time=at,
+            **fields
+        )
+
+    def add_bookings(self, count):
+        """count bookings spread over yesterday, today and the next days"""
+        tables = self.add_tables(2)
+        today = timezone.localdate()
+        Booking.objects.using(self.db).bulk_create([
+            Booking(
+                restaurant=self.restaurant,
+                table=tables[number % 2],
+                customer_name=f'Guest {number}',
+                customer_email=f'guest{number}@example.com',
+                customer_phone='5551234567',
+                customer_phone_digits='5551234567',
+                party_size=2,
+                booking_date=today + timedelta(days=number % 5 - 1),
+                booking_time=time(11 + number % 10),
+                status='cancelled' if number % 7 == 0 else 'confirmed'
+            )
+            for number in range(count)
+        ])
+
+
+class DashboardQueryBudgetTests(BookingFixturesMixin, QueryBudgetTestCase):
+    """Owner dashboard endpoints, with session authentication (2 queries)"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+
+    def test_booking_list(self):
+        for count in (3, 40):
+            self.add_bookings(count)
+            for filter_type in FILTERS:
+                with self.subTest(bookings=count, filter=filter_type), self.assertMaxQueries(4):
+                    response = self.client.get(reverse('bookings:booking_list'), {'filter': filter_type})
+                self.assertEqual(response.status_code, 200)
+
+    def test_today_bookings(self):
+        for count in (3, 40):
+            self.add_bookings(count)
+            with self.subTest(bookings=count), self.assertMaxQueries(4):
+                response = self.client.get(reverse('bookings:today_bookings'))
+            self.assertEqual(response.status_code, 200)
+
+    def test_booking_stats(self):
+        for count in (3, 40):
+            self.add_bookings(count)
+            with self.subTest(bookings=count), self.assertMaxQueries(8):
+                response = self.client.get(reverse('bookings:booking_stats'))
+            self.assertEqual(response.status_code, 200)
+
+    def test_booking_list_with_guests(self):
+        for count in (3, 40):
+            self.add_bookings(count)
+            backfill_guests()
+            with self.subTest(bookings=count), self.assertMaxQueries(4):
+                response = self.client.get(reverse('bookings:booking_list'))
+            self.assertEqual(response.status_code, 200)
+            guests = [booking['guest'] for booking in response.data['bookings']]
+            self.assertTrue(all(guest['name'].startswith('Guest ') for guest in guests))
+            self.assertEqual(guests[0]['visits'], 0)
+
+            booking_id = response.data['bookings'][0]['id']
+            with self.assertMaxQueries(4):
+                response = self.client.get(reverse('bookings:booking_detail', args=[booking_id]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['guest'], guests[0])
+
+    def test_booking_search(self):
+        for count in (3, 40):
+            self.add_bookings(count)
+            with self.subTest(bookings=count), self.assertMaxQueries(4):
+                response = self.client.get(reverse('bookings:booking_search'), {'q': 'guest'})
+            self.assertEqual(response.status_code, 200)
+
+
+class PublicQueryBudgetTests(BookingFixturesMixin, QueryBudgetTestCase):
+    """Public QR booking endpoints (no authentication queries)"""
+
+    def url(self, name):
+        return reverse(name, kwargs={'qr_code_id': self.restaurant.qr_code_id})
+
+    def check_availability(self):
+        response = self.client.post(self.url('bookings:check_availability'), {
+            'booking_date': str(self.tomorrow),
+            'booking_time': '19:00:00',
+            'party_size': 2,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_check_availability_is_constant_in_table_count(self):
+        self.add_bookings(10)
+        with_few_tables = self.count_queries(self.check_availability)
+        self.add_tables(30)
+        self.add_bookings(30)
+        with_many_tables = self.count_queries(self.check_availability)
+
+        self.assertEqual(with_few_tables, with_many_tables)
+        self.assertLessEqual(with_many_tables, 3)
+
+    def test_create_booking(self):
+        table = self.add_tables(1)[0]
+        # Includes finding the guest and, on a first visit, creating it
+        with self.assertMaxQueries(9):
+            response = self.client.post(self.url('bookings:create_booking'), {
+                'customer_name': 'Jane Guest',
+                'customer_email': 'jane@example.com',
+                'customer_phone': '5551234567',
+                'table_id': table.id,
+                'party_size': 2,
+                'booking_date': str(self.tomorrow),
+                'booking_time': '19:00:00',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_duration_hours_is_accepted(self):
+        # The serializers hand durations over as Decimal
+        table = self.add_tables(1)[0]
+        response = self.client.post(self.url('bookings:check_availability'), {
+            'booking_date': str(self.tomorrow),
+            'booking_time': '17:00:00',
+            'party_size': 2,
+            'duration_hours': '2.5',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['available_tables']], [table.id])
+
+        response = self.client.post(self.url('bookings:create_booking'), {
+            'customer_name': 'Jane Guest',
+            'customer_email': 'jane@example.com',
+            'customer_phone': '5551234567',
+            'table_id': table.id,
+            'party_size': 2,
+            'booking_date': str(self.tomorrow),
+            'booking_time': '17:00:00',
+            'duration_hours': '2.5',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        # 17:00-19:30 overlaps a 19:00 start
+        response = self.client.post(self.url('bookings:check_availability'), {
+            'booking_date': str(self.tomorrow),
+            'booking_time': '19:00:00',
+            'party_size': 2,
+            'duration_hours': '1.5',
+        }, content_type='application/json')
+        self.assertEqual(response.json()['available_tables'], [])
+
+    def test_public_info(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get(self.url('restaurants:public_info'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_public_tables(self):
+        for count in (2, 30):
+            self.add_tables(count)
+            with self.subTest(tables=count), self.assertMaxQueries(2):
+                response = self.client.get(self.url('restaurants:public_tables'))
+            self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plans are checked against SQLite')
+class BookingQueryPlanTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_bookings(50)
+
+    def test_restaurant_bookings_filters(self):
+        expected = {
+            'all': index_name('restaurant', 'booking_date', 'booking_time'),
+            'today': 'booking_rest_status_idx',
+            'upcoming': 'booking_rest_status_idx',
+            'past': index_name('restaurant', 'booking_date', 'booking_time'),
+            'cancelled': 'booking_rest_status_idx',
+        }
+        for filter_type, name in expected.items():
+            with self.subTest(filter=filter_type):
+                queryset = BookingService.get_restaurant_bookings(self.restaurant, filter_type)
+                self.assertUsesIndex(queryset.explain(), name)
+
+    def test_check_table_availability(self):
+        table = Table.objects.using(self.db).filter(restaurant=self.restaurant).first()
+        with self.capture_queries():
+            BookingService.check_table_availability(table, self.tomorrow, time(19))
+        self.assertUsesIndex(self.query_plan(self.captured[-1], self.db), 'booking_table_status_idx')
+
+    def test_get_available_tables(self):
+        with self.capture_queries():
+            BookingService.get_available_tables(self.restaurant, self.tomorrow, time(19), 2)
+        booking_queries = [sql for sql in self.captured if 'FROM "bookings_booking"' in sql]
+        self.assertEqual(len(booking_queries), 1)
+        self.assertUsesIndex(self.query_plan(booking_queries[0], self.db), 'booking_rest_status_idx')
+
+    def test_search_bookings(self):
+        with self.capture_queries():
+            BookingService.search_bookings(self.restaurant, 'guest 1')
+        plan = self.query_plan(self.captured[-1], self.db)
+        # Looks up the matches by id rather than walking the restaurant's bookings
+        self.assertIn('SEARCH bookings_booking USING INTEGER PRIMARY KEY', plan)
+        self.assertIn('VIRTUAL TABLE', plan)
+
+
+class BookingSearchTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.table = self.add_tables(1)[0]
+        self.smith = self.book('John Smith', 'jsmith@example.com', '(555) 010-2030')
+        self.book('Maria Smithers', 'maria@example.com', '555 010 9999')
+        self.book('Ann Lee', 'ann.lee@example.com', '+1 312 555 0000')
+
+    def book(self, name, email, phone, restaurant=None, table=None):
+        restaurant = restaurant or self.restaurant
+        return Booking.objects.using(db_for_restaurant(restaurant) or DEFAULT_DB_ALIAS).create(
+            restaurant=restaurant,
+            table=table or self.table,
+            customer_name=name,
+            customer_email=email,
+            customer_phone=phone,
+            party_size=2,
+            booking_date=self.tomorrow,
+            booking_time=time(19)
+        )
+
+    def search(self, query, restaurant=None):
+        return sorted(
+            booking.customer_name
+            for booking in BookingService.search_bookings(restaurant or self.restaurant, query)
+        )
+
+    def test_name_and_email_prefixes(self):
+        self.assertEqual(self.search('smi'), ['John Smith', 'Maria Smithers'])
+        self.assertEqual(self.search('SMITH'), ['John Smith', 'Maria Smithers'])
+        self.assertEqual(self.search('john sm'), ['John Smith'])
+        self.assertEqual(self.search('ann.lee@ex'), ['Ann Lee'])
+        self.assertEqual(self.search('smyth'), [])
+
+    def test_phone_ignores_formatting(self):
+        self.assertEqual(self.search('555-010'), ['John Smith', 'Maria Smithers'])
+        self.assertEqual(self.search('5550102030'), ['John Smith'])
+        self.assertEqual(self.search('+1 (312)'), ['Ann Lee'])
+
+    def test_other_restaurants_excluded(self):
+        other = Restaurant.objects.create(
+            owner=get_user_model().objects.create_user(username='other', password='pass', role='OWNER'),
+            name='Other Bistro',
+            email='other@example.com',
+            phone='5550000001',
+            address='2 Main Street',
+            city='Springfield',
+            state='IL',
+            zip_code='62701'
+        )
+        table = Table.objects.using(db_for_restaurant(other) or DEFAULT_DB_ALIAS).create(
+            restaurant=other, table_number='1', capacity=4
+        )
+        self.book('Jane Smith', 'jane@example.com', '5550102031', restaurant=other, table=table)
+        self.assertEqual(self.search('smith'), ['John Smith', 'Maria Smithers'])
+        self.assertEqual(self.search('smith', restaurant=other), ['Jane Smith'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.smith.customer_name = 'John Smythe'
+        self.smith.customer_phone = '555 777 8888'
+        self.smith.save()
+        self.assertEqual(self.search('smi'), ['Maria Smithers'])
+        self.assertEqual(self.search('smy'), ['John Smythe'])
+        self.assertEqual(self.search('555777'), ['John Smythe'])
+
+        Booking.objects.using(self.db).filter(pk=self.smith.pk).update(customer_name='Jon Smith')
+        self.assertEqual(self.search('jon'), ['Jon Smith'])
+
+        Booking.objects.using(self.db).filter(customer_name='Maria Smithers').delete()
+        self.assertEqual(self.search('smi'), ['Jon Smith'])
+
+
+    def test_every_word_of_a_name_is_found(self):
+        self.book('Mary-Jane Watson', 'mj@example.com', '5550101010')
+        self.book("Smith,Jo O'Neil", 'jo@example.com', '5550101011')
+        self.book('Lee/Park (Kim)', 'kim@example.com', '5550101012')
+        self.assertEqual(self.search('jane'), ['Mary-Jane Watson'])
+        self.assertEqual(self.search('mary-jane'), ['Mary-Jane Watson'])
+        self.assertEqual(self.search('jo'), ['John Smith', "Smith,Jo O'Neil"])
+        self.assertEqual(self.search('neil'), ["Smith,Jo O'Neil"])
+        self.assertEqual(self.search("o'neil"), ["Smith,Jo O'Neil"])
+        self.assertEqual(self.search('park kim'), ['Lee/Park (Kim)'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The index is SQLite only')
+class SearchTriggerTests(TransactionTestCase):
+    """Migrations that rebuild bookings_booking drop the search triggers"""
+    # Outside a test transaction: SQLite refuses schema changes while a
+    # mirrored replica's transaction reads the same in-memory database
+    databases = '__all__'
+
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        self.restaurant = Restaurant.objects.create(
+            owner=owner, name='Budget Bistro', email='bistro@example.com', phone='5550000000',
+            address='1 Main Street', city='Springfield', state='IL', zip_code='62701'
+        )
+        self.db = db_for_restaurant(self.restaurant) or DEFAULT_DB_ALIAS
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        self.table = Table.objects.using(self.db).create(restaurant=self.restaurant, table_number='1', capacity=4)
+
+    def book(self, name, at):
+        Booking.objects.using(self.db).create(
+            restaurant=self.restaurant, table=self.table, customer_name=name,
+            customer_email='ann@example.com', customer_phone='5550101013',
+            party_size=2, booking_date=self.tomorrow, booking_time=at
+        )
+
+    def search(self, query):
+        return sorted(booking.customer_name for booking in BookingService.search_bookings(self.restaurant, query))
+
+    def test_dropped_triggers_are_restored_after_migrate(self):
+        db_connection = connections[self.db]
+        # What SQLite does to them when a migration remakes bookings_booking
+        with db_connection.cursor() as cursor:
+            for trigger in search.TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {search.SEARCH_TABLE}_{trigger}')
+        self.book('Ann Perkins', time(12))
+        self.assertEqual(self.search('perk'), [])
+
+        restore_search_triggers(apps.get_app_config('bookings'), using=self.db)
+        self.assertEqual(search.missing_triggers(db_connection), [])
+        self.assertEqual(self.search('perk'), ['Ann Perkins'])
+        self.book('Ann Perkinson', time(19))
+        self.assertEqual(self.search('perk'), ['Ann Perkins', 'Ann Perkinson'])
+
+class GuestStatisticsTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.table = self.add_tables(1)[0]
+
+    def guest(self, booking):
+        return Guest.objects.using(self.db).get(pk=booking.guest_id)
+
+    def test_bookings_share_a_guest_by_email_or_phone(self):
+        first = self.book()
+        self.assertEqual(self.book(email=' Jane@Example.com ', phone='555 999 0000').guest_id, first.guest_id)
+        self.assertEqual(self.book(email='jane.work@example.com', phone='555-010-2030').guest_id, first.guest_id)
+        self.assertNotEqual(self.book(email='john@example.com', phone='5550000000').guest_id, first.guest_id)
+        self.assertEqual(Guest.objects.using(self.db).count(), 2)
+
+    def test_status_changes_update_counters(self):
+        booking = self.book(status='confirmed')
+        booking.cancel()
+        self.assertEqual(self.guest(booking).cancellations, 1)
+
+        booking.status = 'completed'
+        booking.save()
+        guest = self.guest(booking)
+        self.assertEqual((guest.visits, guest.cancellations, guest.last_visit), (1, 0, booking.booking_date))
+
+        # Loaded without the status: the stored one is read before saving
+        booking = Booking.objects.using(self.db).defer('status').get(pk=booking.pk)
+        booking.status = 'no_show'
+        booking.save()
+        guest = self.guest(booking)
+        self.assertEqual((guest.visits, guest.no_shows), (0, 1))
+
+    def test_saves_that_keep_the_status_skip_the_statistics(self):
+        booking = Booking.objects.using(self.db).get(pk=self.book(status='confirmed').pk)
+        booking.special_requests = 'Window seat'
+        booking.status = 'confirmed'
+        with self.assertNumQueries(1, using=self.db):
+            booking.save()
+
+        booking.status = 'cancelled'
+        with CaptureQueriesContext(connections[self.db]) as queries:
+            booking.save()
+        self.assertRegex(queries[0]['sql'], r'^SELECT "bookings_booking"."status" ')
+        self.assertEqual(self.guest(booking).cancellations, 1)
+        # Counted once: the change has been saved
+        with self.assertNumQueries(1, using=self.db):
+            booking.save()
+        self.assertEqual(self.guest(booking).cancellations, 1)
+
+    def test_bulk_status_changes_update_counters(self):
+        bookings = [self.book(days=-day, status='confirmed') for day in (3, 2, 1)]
+        closed = close_finished_bookings(finished_status='completed')
+        self.assertEqual(closed, 3)
+        guest = self.guest(bookings[0])
+        self.assertEqual((guest.visits, guest.last_visit), (3, bookings[2].booking_date))
+
+        queryset = Booking.objects.using(self.db).filter(pk__in=[bookings[0].pk, bookings[1].pk])
+        self.assertEqual(update_status(queryset, 'no_show'), 2)
+        guest = self.guest(bookings[0])
+        self.assertEqual((guest.visits, guest.no_shows), (1, 2))
+
+    def test_bookings_changed_while_closing_are_not_counted(self):
+        booking = self.book(days=-1, status='confirmed')
+        has_ended = maintenance._has_ended
+
+        def cancel_after_scan(row, ended_before):
+            # Staff cancel it between the scan and the chunk's transaction
+            current = Booking.objects.using(self.db).get(pk=booking.pk)
+            if current.status != 'cancelled':
+                current.status = 'cancelled'
+                current.save()
+            return has_ended(row, ended_before)
+
+        with mock.patch.object(maintenance, '_has_ended', cancel_after_scan):
+            self.assertEqual(close_finished_bookings(finished_status='completed'), 0)
+        guest = self.guest(booking)
+        self.assertEqual((guest.visits, guest.cancellations), (0, 1))
+
+    def test_backfill_links_and_counts(self):
+        Booking.objects.using(self.db).bulk_create([
+            Booking(
+                restaurant=self.restaurant,
+                table=self.table,
+                customer_name=f'Guest {number % 3}',
+                customer_email=f'guest{number % 3}@example.com',
+                customer_phone='5551234567' if number % 3 == 0 else f'555000000{number % 3}',
+                party_size=2,
+                booking_date=timezone.localdate() - timedelta(days=number + 1),
+                booking_time=time(19),
+                status='completed' if number % 2 else 'no_show'
+            )
+            for number in range(10)
+        ])
+        self.book(email='guest0@example.com', status='confirmed')
+
+        self.assertEqual(backfill_guests(chunk_size=4), {'bookings': 10, 'guests': 2})
+        self.assertEqual(backfill_guests(), {'bookings': 0, 'guests': 0})
+
+        guests = Guest.objects.using(self.db).order_by('email')
+        self.assertEqual(
+            [(guest.email, guest.visits, guest.no_shows) for guest in guests],
+            [('guest0@example.com', 2, 2), ('guest1@example.com', 2, 1), ('guest2@example.com', 1, 2)]
+        )
+        self.assertEqual(guests[1].last_visit, timezone.localdate() - timedelta(days=2))
+
+
+class ClosingTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.table = self.add_tables(1)[0]
+
+    def statuses(self, bookings):
+        return [Booking.objects.using(self.db).get(pk=booking.pk).status for booking in bookings]
+
+    def test_bookings_close_at_their_own_end_time(self):
+        ended = self.book(days=-1, at=time(19), status='confirmed')
+        running = self.book(days=-1, at=time(19, 1), status='confirmed')
+        longer = self.book(days=-1, at=time(18), duration_hours=3.5, status='confirmed')
+        # Exactly the grace period after the first booking's end (21:00)
+        end = timezone.make_aware(datetime.combine(ended.booking_date, time(21)))
+        now = end + timedelta(minutes=settings.BOOKING_FINISHED_GRACE_MINUTES)
+
+        self.assertEqual(close_finished_bookings(now=now, finished_status='completed'), 1)
+        self.assertEqual(self.statuses([ended, running, longer]), ['completed', 'confirmed', 'confirmed'])
+
+        self.assertEqual(close_finished_bookings(now=now + timedelta(minutes=30), finished_status='no_show'), 2)
+        self.assertEqual(self.statuses([ended, running, longer]), ['completed', 'no_show', 'no_show'])
+
+    def test_finished_status_must_be_final(self):
+        booking = self.book(days=-1, status='confirmed')
+        with self.assertRaises(ValueError):
+            close_finished_bookings(finished_status='cancelled')
+        self.assertEqual(self.statuses([booking]), ['confirmed'])
+
+    def test_one_booking_per_chunk(self):
+        # Old enough for the range scans, recent, cancelled, upcoming
+        closed = [self.book(days=-days, status='confirmed') for days in (30, 10, 2, 1)]
+        kept = [self.book(days=-1, at=time(12), status='cancelled'), self.book(days=1, status='confirmed')]
+
+        self.assertEqual(close_finished_bookings(finished_status='completed', chunk_size=1), 4)
+        self.assertEqual(self.statuses(closed + kept), ['completed'] * 4 + ['cancelled', 'confirmed'])
+        self.assertEqual(Guest.objects.using(self.db).get(pk=closed[0].guest_id).visits, 4)
+        self.assertEqual(close_finished_bookings(finished_status='completed', chunk_size=1), 0)
+
+
+class ArchiveTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # 4 of the 20 bookings are before today
+        self.add_bookings(20)
+        self.ids = set(Booking.objects.using(self.db).values_list('id', flat=True))
+
+    def locations(self):
+        return (
+            set(Booking.objects.using(self.db).values_list('id', flat=True)),
+            set(BookingArchive.objects.using(self.db).values_list('id', flat=True)),
+        )
+
+    def test_each_booking_is_in_exactly_one_table(self):
+        self.assertEqual(archive_bookings(after_days=0, chunk_size=1), 4)
+        hot, archived = self.locations()
+        self.assertEqual((len(hot), len(archived)), (16, 4))
+        self.assertEqual(hot | archived, self.ids)
+        self.assertFalse(hot & archived)
+        self.assertEqual(archive_bookings(after_days=0, chunk_size=1), 0)
+
+    def test_interrupted_archive_keeps_each_booking_once(self):
+        delete = QuerySet.delete
+        deletes = []
+
+        def delete_then_fail(queryset):
+            result = delete(queryset)
+            deletes.append(result)
+            if len(deletes) == 2:
+                raise DatabaseError('disk I/O error')
+            return result
+
+        with mock.patch.object(QuerySet, 'delete', delete_then_fail), self.assertRaises(DatabaseError):
+            archive_bookings(after_days=0, chunk_size=1)
+        hot, archived = self.locations()
+        self.assertEqual((len(hot), len(archived)), (19, 1))
+        self.assertEqual(hot | archived, self.ids)
+
+    def test_stats_and_export_include_archived_bookings(self):
+        archive_bookings(after_days=0)
+        self.client.force_login(self.owner)
+
+        stats = self.client.get(reverse('bookings:booking_stats')).data
+        self.assertEqual((stats['total_bookings'], stats['archived_bookings']), (20, 4))
+
+        response = self.client.get(reverse('bookings:booking_export'))
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual({int(row['id']) for row in rows}, self.ids)
+        self.assertEqual(sum(row['archived'] == 'True' for row in rows), 4)
+
+        response = self.client.get(reverse('bookings:booking_export'), {'include_archived': 'false'})
+        self.assertEqual(len(list(response.streaming_content)), 1 + 16)
+
+
+    def test_export_does_not_let_guest_text_run_as_formulas(self):
+        first, second = sorted(self.ids)[:2]
+        Booking.objects.using(self.db).filter(pk=first).update(
+            customer_name='=HYPERLINK("http://evil.example","Jane")',
+            customer_phone='+1 555 0100',
+            special_requests='@SUM(1+1)'
+        )
+        Booking.objects.using(self.db).filter(pk=second).update(
+            customer_name='-2+3', customer_email='\tjane@example.com', special_requests='\rnote'
+        )
+        archive_bookings(after_days=0)
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse('bookings:booking_export'))
+        rows = {
+            int(row['id']): row
+            for row in csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode()))
+        }
+        self.assertEqual(
+            [rows[first][column] for column in ('customer_name', 'customer_phone', 'special_requests')],
+            ['\'=HYPERLINK("http://evil.example","Jane")', "'+1 555 0100", "'@SUM(1+1)"]
+        )
+        self.assertEqual(
+            [rows[second][column] for column in ('customer_name', 'customer_email', 'special_requests')],
+            ["'-2+3", "'\tjane@example.com", "'\rnote"]
+        )
+        # Values of other columns are left alone
+        self.assertEqual(rows[first]['party_size'], '2')
+
+class NotificationTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.table = self.add_tables(1)[0]
+
+    def create_booking(self, booking_date=None):
+        return BookingService.create_booking(
+            self.restaurant,
+            self.table.id,
+            {'customer_name': 'Jane Guest', 'customer_email': 'jane@example.com', 'customer_phone': '5551234567'},
+            {'booking_date': booking_date or self.tomorrow, 'booking_time': time(19), 'party_size': 2}
+        )
+
+    def messages(self):
+        return OutboxMessage.objects.using(self.db).all()
+
+    def test_confirmation_is_queued_with_the_booking(self):
+        success, booking, _ = self.create_booking()
+        self.assertTrue(success)
+        self.assertEqual(
+            [(message.booking_id, message.kind, message.status) for message in self.messages()],
+            [(booking.id, 'confirmation', 'pending')]
+        )
+
+    def test_rolled_back_booking_queues_nothing(self):
+        def enqueue_then_fail(booking):
+            enqueue_confirmation(booking)
+            raise RuntimeError('lost connection')
+
+        with mock.patch('bookings.services.enqueue_confirmation', enqueue_then_fail):
+            success, booking, _ = self.create_booking()
+        self.assertFalse(success)
+        self.assertFalse(Booking.objects.using(self.db).exists())
+        self.assertFalse(self.messages().exists())
+
+    def test_failed_sends_back_off_then_give_up(self):
+        _, booking, _ = self.create_booking()
+        connection = mail.get_connection()
+        with mock.patch.object(connection, 'send_messages', side_effect=SMTPException('busy')):
+            self.assertEqual(send_outbox_messages(connection=connection)['retried'], 1)
+            message = self.messages().get()
+            self.assertEqual((message.status, message.attempts, message.last_error), ('pending', 1, 'busy'))
+            self.assertEqual(
+                message.next_attempt_at - message.updated_at,
+                timedelta(seconds=settings.OUTBOX_RETRY_BASE_SECONDS)
+            )
+            # Not due again until the delay has passed
+            self.assertEqual(send_outbox_messages(connection=connection)['retried'], 0)
+
+            for attempt in range(2, settings.OUTBOX_MAX_ATTEMPTS + 1):
+                self.messages().update(next_attempt_at=timezone.now())
+                stats = send_outbox_messages(connection=connection)
+            self.assertEqual(stats['failed'], 1)
+            message = self.messages().get()
+            self.assertEqual((message.status, message.attempts), ('failed', settings.OUTBOX_MAX_ATTEMPTS))
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(Booking.objects.using(self.db).get(pk=booking.pk).confirmation_sent)
+
+    def test_retried_send_is_delivered(self):
+        _, booking, _ = self.create_booking()
+        connection = mail.get_connection()
+        with mock.patch.object(connection, 'send_messages', side_effect=SMTPException('busy')):
+            send_outbox_messages(connection=connection)
+        self.messages().update(next_attempt_at=timezone.now())
+
+        self.assertEqual(send_outbox_messages(connection=connection)['sent'], 1)
+        self.assertEqual(mail.outbox[0].to, ['jane@example.com'])
+        message = self.messages().get()
+        self.assertEqual((message.status, message.attempts, message.last_error), ('sent', 2, ''))
+        self.assertTrue(Booking.objects.using(self.db).get(pk=booking.pk).confirmation_sent)
+
+    def test_claimed_batch_is_not_sent_by_another_worker(self):
+        _, booking, _ = self.create_booking()
+        # A first worker claims the batch and is still sending it
+        self.assertEqual([message.booking_id for message in claim_due_messages(self.db, 10)], [booking.id])
+
+        self.assertEqual(claim_due_messages(self.db, 10), [])
+        self.assertEqual(send_outbox_messages()['sent'], 0)
+        self.assertEqual(mail.outbox, [])
+
+        # The first worker died: once its claim runs out the message is due again
+        self.messages().update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox_messages()['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_reminders_are_queued_once(self):
+        booking_date = timezone.localdate() + timedelta(days=3)
+        _, booking, _ = self.create_booking(booking_date)
+        # Inside the 24-hour window, outside the 2-hour one
+        now = booking.booking_datetime - timedelta(hours=23)
+
+        self.assertEqual(schedule_reminders(now=now), {'scanned': 1, 'reminder_2h': 0, 'reminder_24h': 1})
+        self.assertEqual(schedule_reminders(now=now), {'scanned': 1, 'reminder_2h': 0, 'reminder_24h': 0})
+        self.assertEqual(self.messages().filter(kind='reminder_24h').count(), 1)
+
+        # A concurrent run that queued the same reminder after this run's
+        # lookup is ignored by the (booking, kind) constraint
+        OutboxMessage.objects.using(self.db).bulk_create(
+            [OutboxMessage(booking=booking, kind='reminder_24h')],
+            ignore_conflicts=True
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic(using=self.db):
+            OutboxMessage.objects.using(self.db).create(booking=booking, kind='reminder_24h')
+        self.assertEqual(self.messages().filter(kind='reminder_24h').count(), 1)
+
+    def test_reminders_queued_by_a_concurrent_run_are_not_counted(self):
+        _, first, _ = self.create_booking(timezone.localdate() + timedelta(days=3))
+        self.table = self.add_tables(1)[0]
+        _, second, _ = self.create_booking(first.booking_date)
+        now = first.booking_datetime - timedelta(hours=23)
+        # Another run queued the first reminder after this run looked
+        OutboxMessage.objects.using(self.db).create(booking=first, kind='reminder_24h')
+        values_list = QuerySet.values_list
+
+        def miss_queued(queryset, *fields, **kwargs):
+            if queryset.model is OutboxMessage:
+                return []
+            return values_list(queryset, *fields, **kwargs)
+
+        with mock.patch.object(QuerySet, 'values_list', miss_queued):
+            stats = schedule_reminders(now=now)
+        self.assertEqual(stats, {'scanned': 2, 'reminder_2h': 0, 'reminder_24h': 1})
+        self.assertEqual(
+            sorted(self.messages().filter(kind='reminder_24h').values_list('booking_id', flat=True)),
+            [first.id, second.id]
+        )
+
+
+@override_settings(
+    TRACING_EXPORTER='core.tracing.InMemoryExporter',
+    TRACING_SAMPLE_RATE=1.0,
+    MIDDLEWARE=['core.middleware.TracingMiddleware', *settings.MIDDLEWARE],
+)
+class TracingTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.table = self.add_tables(1)[0]
+        self.exporter = tracing.get_exporter()
+        self.exporter.clear()
+
+    def spans(self, name):
+        return [span for span in self.exporter.spans if span.name == name]
+
+    def span(self, name):
+        spans = self.spans(name)
+        self.assertEqual(len(spans), 1, name)
+        return spans[0]
+
+    def book_now(self):
+        return BookingService.create_booking(
+            self.restaurant, self.table.id,
+            {'customer_name': 'Jane Guest', 'customer_email': 'jane@example.com', 'customer_phone': '5551234567'},
+            {'booking_date': self.tomorrow, 'booking_time': time(19), 'party_size': 2}
+        )
+
+    def post_booking(self):
+        return self.client.post(
+            reverse('bookings:create_booking', args=[self.restaurant.qr_code_id]),
+            {
+                'customer_name': 'Jane Guest',
+                'customer_email': 'jane@example.com',
+                'customer_phone': '5551234567',
+                'table_id': self.table.id,
+                'party_size': 2,
+                'booking_date': self.tomorrow.isoformat(),
+                'booking_time': '19:00:00',
+            },
+            content_type='application/json'
+        )
+
+    def test_create_booking_spans_nest(self):
+        with tracing.start_trace('test') as root:
+            success, _, _ = self.book_now()
+        self.assertTrue(success)
+
+        create = self.span('BookingService.create_booking')
+        self.assertEqual(create.parent_id, root.span_id)
+        for name in ('booking.lock_table', 'BookingService.check_table_availability', 'booking.insert'):
+            self.assertEqual(self.span(name).parent_id, create.span_id, name)
+        self.assertEqual({span.trace.trace_id for span in self.exporter.spans}, {root.trace.trace_id})
+        # Exported once, when the root span ended, in start order
+        self.assertEqual(self.exporter.spans[0], root)
+        self.assertIsNone(tracing.current_span())
+
+    def test_middleware_root_span_is_the_requests_context(self):
+        response = self.post_booking()
+        self.assertEqual(response.status_code, 201)
+
+        root = self.span('POST bookings:create_booking')
+        self.assertEqual(response['X-Trace-Id'], root.trace.trace_id)
+        self.assertEqual(root.attributes['status'], 201)
+        self.assertIsNone(root.error)
+        self.assertEqual(self.span('BookingCreateSerializer.is_valid').parent_id, root.span_id)
+        self.assertEqual(self.span('BookingService.create_booking').parent_id, root.span_id)
+
+        # Every statement of the request, under the span that ran it
+        queries = self.spans('db.query')
+        self.assertTrue(queries)
+        span_ids = {span.span_id for span in self.exporter.spans}
+        self.assertTrue(all(query.parent_id in span_ids for query in queries))
+        self.assertEqual(self.span('booking.insert').span_id, next(
+            query.parent_id for query in queries if query.attributes['sql'].startswith('INSERT INTO "bookings_booking"')
+        ))
+        self.assertIsNone(tracing.current_span())
+
+    def test_exceptions_mark_their_spans(self):
+        with tracing.start_trace('test') as root:
+            with self.assertRaises(ValueError), tracing.span('step'):
+                raise ValueError('bad step')
+        self.assertEqual(self.span('step').error, 'ValueError')
+        self.assertIsNone(root.error)
+
+        self.exporter.clear()
+        self.client.raise_request_exception = False
+        with self.assertLogs('django.request', 'ERROR'):
+            with mock.patch.object(BookingService, 'create_booking', side_effect=RuntimeError):
+                response = self.post_booking()
+        self.assertEqual(response.status_code, 500)
+        root = self.span('POST bookings:create_booking')
+        self.assertEqual((root.error, root.attributes['status']), ('RuntimeError', 500))
+
+
+@override_settings(
+    INSTRUMENTATION_SAMPLE_RATE=0.0,
+    INSTRUMENTATION_SAMPLE_RATES={'bookings:create_booking': 1.0},
+    MIDDLEWARE=['core.middleware.RequestInstrumentationMiddleware', *settings.MIDDLEWARE],
+)
+class RequestInstrumentationTests(BookingFixturesMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.table = self.add_tables(1)[0]
+        instrumentation.clear_profiles()
+
+    def post_booking(self, **fields):
+        return self.client.post(
+            reverse('bookings:create_booking', args=[fields.pop('qr_code_id', self.restaurant.qr_code_id)]),
+            {
+                'customer_name': 'Jane Guest',
+                'customer_email': 'jane@example.com',
+                'customer_phone': '5551234567',
+                'table_id': self.table.id,
+                'party_size': 2,
+                'booking_date': self.tomorrow.isoformat(),
+                'booking_time': '19:00:00',
+                **fields
+            },
+            content_type='application/json'
+        )
+
+    def test_profile_counts_the_requests_queries(self):
+        with self.capture_queries():
+            response = self.post_booking()
+        self.assertEqual(response.status_code, 201)
+
+        [profile] = instrumentation.recent_profiles()
+        self.assertEqual(profile['view'], 'bookings:create_booking')
+        self.assertEqual(profile['queries'], len(self.captured))
+        # The statement, not its parameters: profiles hold no customer data
+        self.assertTrue(profile['slowest_sql'])
+        self.assertNotIn('jane@example.com', profile['slowest_sql'])
+        self.assertLessEqual(profile['slowest_sql_ms'], profile['sql_ms'])
+        self.assertLessEqual(profile['sql_ms'], profile['view_ms'])
+        self.assertLessEqual(profile['view_ms'], profile['total_ms'])
+        self.assertEqual(
+            response['Server-Timing'],
+            f"db;dur={profile['sql_ms']};desc=\"{profile['queries']} queries\", "
+            f"view;dur={profile['view_ms']}, total;dur={profile['total_ms']}"
+        )
+
+    def test_profile_records_the_status(self):
+        self.post_booking()
+        self.post_booking(party_size=0)
+        self.post_booking(qr_code_id='00000000-0000-0000-0000-000000000000')
+        self.assertEqual([profile['status'] for profile in instrumentation.recent_profiles()], [404, 400, 201])
+
+    def test_only_sampled_views_are_measured(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('bookings:booking_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.recent_profiles(), [])
+
+    def test_query_time_is_summed_and_the_slowest_kept(self):
+        stats = instrumentation.QueryStats()
+        execute = mock.Mock(return_value='rows')
+        # Each statement reads the clock before and after it runs
+        with mock.patch.object(instrumentation.time, 'perf_counter', side_effect=[0, 0.25, 1, 1.5, 2, 2.125]):
+            for sql in ('SELECT 1', 'SELECT 2', 'SELECT 3'):
+                self.assertEqual(stats(execute, sql, (), False, {}), 'rows')
+        self.assertEqual((stats.count, stats.duration), (3, 0.875))
+        self.assertEqual((stats.slowest, stats.slowest_sql), (0.5, 'SELECT 2'))
+
+
+
+class BookingAdminTests(BookingFixturesMixin, QueryBudgetTestCase):
+    """The Booking changelist stays cheap however many rows there are"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser(username='admin', password='pass'))
+
+    def changelist(self, **params):
+        response = self.client.get(reverse('admin:bookings_booking_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.add_bookings(10)
+        with_few_rows = self.count_queries(self.changelist)
+        self.add_bookings(40)
+        with_many_rows = self.count_queries(self.changelist)
+
+        self.assertEqual(with_few_rows, with_many_rows)
+        # Session, user, row estimate (bounded count without ANALYZE) and
+        # the page of rows with their restaurant and table
+        self.assertLessEqual(with_many_rows, 5)
+
+    def test_restaurant_filter_loads_only_the_selected_restaurant(self):
+        self.add_bookings(10)
+        with self.assertMaxQueries(6):
+            response = self.changelist(restaurant__id__exact=self.restaurant.pk, status='confirmed')
+        self.assertContains(response, 'id="autocomplete_filter_restaurant"')
+        self.assertContains(response, 'Budget Bistro')
+
+    @override_settings(ADMIN_COUNT_LIMIT=5)
+    def test_filtered_count_stops_at_the_limit(self):
+        self.add_bookings(20)
+        bookings = Booking.objects.using(self.db).order_by('pk')
+        self.assertEqual(EstimatedCountPaginator(bookings.filter(status='confirmed'), 2).count, 5)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Estimates come from sqlite_stat1')
+    @skipUnless(
+        settings.DATABASE_REPLICA_ALIAS not in settings.DATABASES,
+        "ANALYZE changes the schema, which a mirrored replica's test transaction locks"
+    )
+    def test_unfiltered_count_is_the_analyze_estimate(self):
+        self.add_bookings(20)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.add_bookings(10)
+        bookings = Booking.objects.using(self.db).order_by('pk')
+        with self.assertMaxQueries(1):
+            self.assertEqual(EstimatedCountPaginator(bookings, 2).count, 20)
+
+
+class LoadTestCommandTests(TransactionTestCase):
+    """
+    Smoke tests of `manage.py load_test`, in-process
+
+    Worker threads use their own database connections, so the data must
+    be committed rather than held in a test transaction.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        self.restaurant = Restaurant.objects.create(
+            owner=owner, name='Budget Bistro', email='bistro@example.com', phone='5550000000',
+            address='1 Main Street', city='Springfield', state='IL', zip_code='62701'
+        )
+        Table.objects.using(db_for_restaurant(self.restaurant) or DEFAULT_DB_ALIAS).bulk_create([
+            Table(restaurant=self.restaurant, table_number=str(number), capacity=6) for number in range(1, 4)
+        ])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def load_test(self, **options):
+        output = os.path.join(self.directory, 'load.json')
+        stdout = io.StringIO()
+        call_command('load_test', duration=0.5, concurrency=1, output=output, stdout=stdout, **options)
+        with open(output) as f:
+            return json.load(f), stdout.getvalue()
+
+    def test_closed_loop_books_and_reports_every_endpoint(self):
+        report, stdout = self.load_test(rate=0, qr_codes=[str(self.restaurant.qr_code_id)])
+
+        self.assertEqual(
+            set(report), {'seconds', 'guests', 'booked', 'sold_out', 'late_arrivals', 'endpoints'}
+        )
+        self.assertEqual(list(report['endpoints']), ['info', 'tables', 'availability', 'book'])
+        self.assertGreater(report['booked'], 0)
+        self.assertEqual(report['booked'], Booking.objects.using(db_for_restaurant(self.restaurant)).count())
+        self.assertEqual(sum(endpoint['errors'] for endpoint in report['endpoints'].values()), 0)
+        self.assertIn('1 restaurants, 1 threads, closed loop', stdout)
+        self.assertRegex(stdout, r'\d+ guests in [\d.]+s')
+
+    def test_restaurants_come_from_a_manifest(self):
+        manifest = os.path.join(self.directory, 'scale.json')
+        unknown = '00000000-0000-0000-0000-000000000000'
+        with open(manifest, 'w') as f:
+            json.dump({'qr_codes': [str(self.restaurant.qr_code_id), unknown]}, f)
+
+        report, stdout = self.load_test(rate=20, manifest=manifest, restaurants=1, seed=1)
+        self.assertIn('1 restaurants, 1 threads, 20 guests/s', stdout)
+        self.assertEqual(report['endpoints']['info']['errors'], 0)
+
+    def test_bad_arguments_are_command_errors(self):
+        with self.assertRaisesMessage(CommandError, 'Cannot read manifest'):
+            call_command('load_test', manifest=os.path.join(self.directory, 'missing.json'))
+        with self.assertRaisesMessage(CommandError, '--concurrency must be at least 1'):
+            call_command('load_test', concurrency=0)
+        with self.assertRaisesMessage(CommandError, 'Unsupported URL scheme'):
+            call_command('load_test', url='ftp://example.com', stdout=io.StringIO())
+        Restaurant.objects.update(is_active=False)
+        with self.assertRaisesMessage(CommandError, 'No active restaurants'):
+            call_command('load_test')
+
+class BenchmarkBaselineTests(SimpleTestCase):
+    """Without a baseline from this machine the gate fails before running"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.baseline = os.path.join(directory.name, 'baseline.json')
+
+    def test_missing_baseline_fails(self):
+        with self.assertRaisesMessage(CommandError, 'No baseline at'):
+            call_command('benchmark_bookings', baseline=self.baseline)
+
+    def test_baseline_from_another_machine_fails(self):
+        params = {
+            'restaurants': 5, 'tables': 20, 'bookings_per_day': 40, 'days': 60,
+            'threads': 8, 'repeat': 200, 'seed': 0, 'synthetic': False,
+        }
+        with open(self.baseline, 'w') as f:
+            json.dump({'meta': {'params': params, 'processor': 'Elsewhere'}, 'results': {}}, f)
+        with self.assertRaisesMessage(CommandError, 'not compared'):
+            call_command('benchmark_bookings', baseline=self.baseline)
+
+
+class GenerateDataTargetTests(BookingFixturesMixin, TestCase):
+    """The synthetic loader only runs on throwaway databases unless forced"""
+    databases = '__all__'
+
+    def synthetic_owners(self):
+        return get_user_model().objects.filter(username__startswith='synthetic-')
+
+    def test_refuses_a_database_with_restaurants(self):
+        with self.assertRaisesMessage(CommandError, 'already has restaurants'):
+            call_command('generate_data', restaurants=1, days=1)
+        self.assertFalse(self.synthetic_owners().exists())
+
+    @skipUnless(not settings.DATABASE_SHARDS, 'Bookings go to the shards')
+    @override_settings(DEBUG=False)
+    def test_refuses_the_default_database_outside_debug(self):
+        Restaurant.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, "into 'default' with DEBUG off"):
+            call_command('generate_data', restaurants=1, days=1)
+        self.assertFalse(self.synthetic_owners().exists())
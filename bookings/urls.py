@@ -16,6 +16,8 @@ urlpatterns = [
     path('', views.booking_list, name='booking_list'),
     path('today/', views.today_bookings, name='today_bookings'),
     path('stats/', views.booking_stats, name='booking_stats'),
+    path('search/', views.booking_search, name='booking_search'),
+    path('export/', views.booking_export, name='booking_export'),
     path('<int:pk>/', views.booking_detail, name='booking_detail'),
     path('<int:pk>/cancel/', views.cancel_booking, name='cancel_booking'),
 ]
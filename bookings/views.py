@@ -5,10 +5,13 @@ from django.shortcuts import render
 Booking API views
 """
 
+import csv
+
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from restaurants.models import Restaurant, Table
@@ -17,15 +20,22 @@ from .serializers import (
     BookingSerializer,
     BookingCreateSerializer,
     AvailabilityCheckSerializer,
+    BookingExportSerializer,
+    BookingSearchSerializer,
     BookingStatsSerializer
 )
 from .services import BookingService
+from core import metrics
+from core.sharding import db_for_restaurant
+from core.throttling import AvailabilityThrottle, BookingThrottle
 
 
 # ==================== PUBLIC BOOKING VIEWS ====================
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AvailabilityThrottle])
+@metrics.PUBLIC_REQUEST_SECONDS.labels('availability').time()
 def check_availability(request, qr_code_id):
     """
     Check table availability for given date/time
@@ -67,6 +77,8 @@ def check_availability(request, qr_code_id):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([BookingThrottle])
+@metrics.PUBLIC_REQUEST_SECONDS.labels('book').time()
 def create_booking(request, qr_code_id):
     """
     Create a new booking (public endpoint)
@@ -146,12 +158,13 @@ def booking_list(request):
     filter_type = request.query_params.get('filter', 'all')
 
     bookings = BookingService.get_restaurant_bookings(restaurant, filter_type)
-    serializer = BookingSerializer(bookings, many=True)
+    # Serializing loads the bookings, so counting them needs no query
+    data = BookingSerializer(bookings, many=True).data
 
     return Response({
         'filter': filter_type,
-        'count': bookings.count(),
-        'bookings': serializer.data
+        'count': len(data),
+        'bookings': data
     })
 
 
@@ -170,12 +183,12 @@ def today_bookings(request):
         }, status=status.HTTP_404_NOT_FOUND)
 
     bookings = BookingService.get_restaurant_bookings(restaurant, 'today')
-    serializer = BookingSerializer(bookings, many=True)
+    data = BookingSerializer(bookings, many=True).data
 
     return Response({
         'date': timezone.now().date(),
-        'count': bookings.count(),
-        'bookings': serializer.data
+        'count': len(data),
+        'bookings': data
     })
 
 
@@ -193,7 +206,8 @@ def booking_stats(request):
             'error': 'No restaurant found'
         }, status=status.HTTP_404_NOT_FOUND)
 
-    total_bookings = Booking.objects.filter(restaurant=restaurant).count()
+    archived_bookings = BookingService.count_archived_bookings(restaurant)
+    total_bookings = Booking.objects.using(db_for_restaurant(restaurant)).filter(restaurant=restaurant).count() + archived_bookings
     today_bookings = BookingService.get_restaurant_bookings(restaurant, 'today').count()
     upcoming_bookings = BookingService.get_restaurant_bookings(restaurant, 'upcoming').count()
     cancelled_bookings = BookingService.get_restaurant_bookings(restaurant, 'cancelled').count()
@@ -202,13 +216,95 @@ def booking_stats(request):
         'total_bookings': total_bookings,
         'today_bookings': today_bookings,
         'upcoming_bookings': upcoming_bookings,
-        'cancelled_bookings': cancelled_bookings
+        'cancelled_bookings': cancelled_bookings,
+        'archived_bookings': archived_bookings
     }
 
     serializer = BookingStatsSerializer(stats)
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def booking_search(request):
+    """
+    Find bookings by guest name, email or phone, e.g. at the front desk
+    GET /api/bookings/search/?q=smith&date=2024-06-01&limit=20
+    """
+    try:
+        restaurant = Restaurant.objects.get(owner=request.user)
+    except Restaurant.DoesNotExist:
+        return Response({
+            'error': 'No restaurant found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = BookingSearchSerializer(data=request.query_params)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    params = serializer.validated_data
+    bookings = BookingService.search_bookings(restaurant, params['q'], params.get('date'), params['limit'])
+    data = BookingSerializer(bookings, many=True).data
+
+    return Response({
+        'query': params['q'],
+        'count': len(data),
+        'bookings': data
+    })
+
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    """Guest-entered text as a cell a spreadsheet shows rather than evaluates"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object that hands written CSV lines straight back"""
+
+    def write(self, value):
+        return value
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def booking_export(request):
+    """
+    Export bookings as CSV, including archived ones
+    GET /api/bookings/export/?date_from=2024-01-01&date_to=2024-12-31&include_archived=true
+    """
+    try:
+        restaurant = Restaurant.objects.get(owner=request.user)
+    except Restaurant.DoesNotExist:
+        return Response({
+            'error': 'No restaurant found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = BookingExportSerializer(data=request.query_params)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = BookingService.get_booking_history(restaurant, **serializer.validated_data)
+    columns = BookingService.HISTORY_FIELDS + ['archived']
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_csv_cell(row[column]) for column in columns])
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="bookings.csv"'
+    return response
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def cancel_booking(request, pk):
@@ -244,7 +340,10 @@ def booking_detail(request, pk):
     """
     try:
         restaurant = Restaurant.objects.get(owner=request.user)
-        booking = Booking.objects.get(pk=pk, restaurant=restaurant)
+        booking = Booking.objects.using(db_for_restaurant(restaurant)).select_related('table', 'guest').get(
+            pk=pk, restaurant=restaurant
+        )
+        booking.restaurant = restaurant
         serializer = BookingSerializer(booking)
         return Response(serializer.data)
     except Restaurant.DoesNotExist:
@@ -0,0 +1,13 @@
+"""
+URL configuration for staff diagnostics
+"""
+
+from django.urls import path
+from . import admin_views
+
+app_name = 'diagnostics'
+
+urlpatterns = [
+    path('requests/', admin_views.request_profiles, name='request_profiles'),
+    path('slow-queries/', admin_views.slow_queries, name='slow_queries'),
+]
@@ -0,0 +1,138 @@
+"""
+Diagnostic API views for staff
+"""
+
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from . import metrics as app_metrics
+from .instrumentation import recent_profiles
+from .profiling import list_profiles, make_token, profile_path
+from .slow_queries import slow_query_groups
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_profiles(request):
+    """
+    Recently measured requests of this process, most recent first
+    GET /api/admin/requests/?view=bookings:create_booking&min_ms=100&limit=50
+
+    Each worker process keeps its own buffer, so behind several workers
+    successive calls may show different requests.
+    """
+    try:
+        min_ms = float(request.query_params.get('min_ms', 0))
+        limit = int(request.query_params.get('limit', 100))
+    except ValueError:
+        return Response({
+            'error': 'min_ms and limit must be numbers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    view_name = request.query_params.get('view')
+    profiles = [
+        profile for profile in recent_profiles()
+        if profile['total_ms'] >= min_ms and (not view_name or profile['view'] == view_name)
+    ]
+
+    summary = {}
+    for profile in profiles:
+        view = summary.setdefault(profile['view'], {
+            'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'max_queries': 0,
+        })
+        view['requests'] += 1
+        view['total_ms'] += profile['total_ms']
+        view['max_ms'] = max(view['max_ms'], profile['total_ms'])
+        view['queries'] += profile['queries']
+        view['max_queries'] = max(view['max_queries'], profile['queries'])
+
+    return Response({
+        'count': len(profiles),
+        'summary': {
+            name: {
+                'requests': view['requests'],
+                'avg_ms': round(view['total_ms'] / view['requests'], 3),
+                'max_ms': view['max_ms'],
+                'avg_queries': round(view['queries'] / view['requests'], 1),
+                'max_queries': view['max_queries'],
+            }
+            for name, view in sorted(summary.items(), key=lambda item: -item[1]['total_ms'])
+        },
+        'results': profiles[:max(limit, 0)],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def slow_queries(request):
+    """
+    Slow query shapes seen by this process, largest total time first
+    GET /api/admin/slow-queries/
+    """
+    groups = slow_query_groups()
+    return Response({'count': len(groups), 'results': groups})
+
+
+def slow_queries_page(request):
+    """
+    Slow query log in the Django admin
+    GET /admin/slow-queries/ (wrapped in admin.site.admin_view)
+    """
+    return render(request, 'admin/slow_queries.html', {
+        **admin.site.each_context(request),
+        'title': 'Slow queries',
+        'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+        'groups': slow_query_groups(),
+    })
+
+
+def profiles_page(request):
+    """
+    Stored request profiles and a fresh profiling token
+    GET /admin/profiles/ (wrapped in admin.site.admin_view)
+    """
+    return render(request, 'admin/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'enabled': settings.PROFILING_ENABLED,
+        'token': make_token(),
+        'token_minutes': settings.PROFILING_TOKEN_MAX_AGE // 60,
+        'profiles': list_profiles(),
+    })
+
+
+def profile_download(request, name, extension):
+    """
+    One profile artifact
+    GET /admin/profiles/<name>.prof|txt (wrapped in admin.site.admin_view)
+    """
+    path = profile_path(name, extension)
+    if path is None:
+        raise Http404('No such profile')
+    if extension == 'txt':
+        return FileResponse(open(path, 'rb'), content_type='text/plain; charset=utf-8')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{name}.prof')
+
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus scrape endpoint, summed over the worker processes
+    GET /metrics
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (
+        (token and constant_time_compare(authorization, f'Bearer {token}'))
+        or request.user.is_staff
+    ):
+        return HttpResponseForbidden('Metrics require the METRICS_TOKEN bearer token or a staff session')
+    return HttpResponse(app_metrics.render(), content_type=app_metrics.CONTENT_TYPE)
@@ -11,5 +11,10 @@ class CoreConfig(AppConfig):
     verbose_name = 'Core'
 
     def ready(self):
-        """Import signals when app is ready"""
+        """Import signals and checks, and open the metrics storage when app is ready"""
+        import core.checks
         import core.models
+        import core.signals
+        from django.conf import settings
+        from core.metrics import REGISTRY
+        REGISTRY.open(settings.METRICS_DIR)
@@ -0,0 +1,20 @@
+"""
+System checks for the core app's settings
+"""
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .utils import QR_ERROR_CORRECTION_LEVELS
+
+
+@register()
+def check_qr_error_correction(app_configs, **kwargs):
+    """QR_ERROR_CORRECTION must name a level, or every QR code fails to render"""
+    if settings.QR_ERROR_CORRECTION in QR_ERROR_CORRECTION_LEVELS:
+        return []
+    return [Error(
+        f"QR_ERROR_CORRECTION is {settings.QR_ERROR_CORRECTION!r}.",
+        hint=f"Use one of {', '.join(QR_ERROR_CORRECTION_LEVELS)}.",
+        id='core.E001',
+    )]
@@ -0,0 +1,49 @@
+"""
+SQLite backend with a configurable transaction mode
+
+Django 5.0 starts every transaction with a plain (DEFERRED) BEGIN: the
+write lock is only requested by the first write, after the transaction
+has read. If another connection wrote in between, SQLite cannot upgrade
+the lock and fails at once with "database is locked", whatever the busy
+timeout. IMMEDIATE takes the write lock at BEGIN instead, waiting up to
+the busy timeout for it, which makes a transaction's reads (e.g. an
+availability check) hold until it commits.
+
+OPTIONS['transaction_mode'] sets the mode of every transaction on the
+database, with the same name and meaning as in Django 5.1, which
+supports it natively. The project leaves it unset and takes the lock
+only where a write depends on what was read (core.transactions).
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Mode of the transactions started while set, over the OPTIONS one
+        self.begin_mode = None
+
+    @property
+    def transaction_mode(self):
+        mode = self.begin_mode or self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}, not {mode!r}"
+            )
+        return mode and mode.upper()
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,34 @@
+"""
+SQLite backend for restaurant shard databases
+
+Sharded rows (tables, bookings) keep their foreign keys to catalog rows
+(restaurant, customer) that live in the 'default' database, so SQLite
+cannot enforce them: the referenced tables do not exist on a shard.
+Integrity across databases is kept by the application instead, and
+foreign key enforcement is switched off for shard connections.
+
+New rows take their ids from the shard's own range (see compiler.py).
+"""
+
+from django.db.backends.sqlite3 import operations
+
+from core.db_backends.sqlite3 import base
+
+
+class DatabaseOperations(operations.DatabaseOperations):
+    compiler_module = 'core.db_backends.sqlite3_shard.compiler'
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    ops_class = DatabaseOperations
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute('PRAGMA foreign_keys = OFF')
+        return conn
+
+    def enable_constraint_checking(self):
+        """Keep foreign keys off after schema changes re-enable them"""
+
+    def check_constraints(self, table_names=None):
+        """Cross-database foreign keys cannot be checked on a shard"""
@@ -0,0 +1,40 @@
+"""
+SQL compilers for shard databases
+
+New rows of sharded models take their primary key from the shard's own
+AUTOINCREMENT sequence, read inside the INSERT itself. SQLite would
+otherwise allocate one past the largest id in the table, which after a
+restaurant moved in from a later shard lies in that shard's id range
+(see core.sharding.reserve_shard_id_ranges).
+"""
+
+from django.db.models.expressions import RawSQL
+from django.db.models.sql import compiler
+from django.db.models.sql.compiler import *  # noqa: F401,F403
+
+from core.sharding import is_sharded_model
+
+
+class SQLInsertCompiler(compiler.SQLInsertCompiler):
+    sequence_offsets = None
+
+    def as_sql(self):
+        opts = self.query.get_meta()
+        if (
+            self.query.fields
+            and opts.pk not in self.query.fields
+            and opts.auto_field is opts.pk
+            and is_sharded_model(opts.model)
+        ):
+            self.query.fields = [opts.pk, *self.query.fields]
+            # Rows of one statement take consecutive numbers past the sequence
+            self.sequence_offsets = {id(obj): offset for offset, obj in enumerate(self.query.objs, 1)}
+        return super().as_sql()
+
+    def pre_save_val(self, field, obj):
+        if self.sequence_offsets is not None and field.primary_key:
+            return RawSQL(
+                'SELECT seq + %s FROM sqlite_sequence WHERE name = %s',
+                [self.sequence_offsets[id(obj)], self.query.get_meta().db_table]
+            )
+        return super().pre_save_val(field, obj)
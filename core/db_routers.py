@@ -0,0 +1,76 @@
+"""
+Database routers
+"""
+
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Set once the current request (or task) must read from the primary
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+# Set once the current request (or task) has written to the primary
+_wrote_to_primary = ContextVar('wrote_to_primary', default=False)
+
+
+def pin_to_primary():
+    """Send every following read of this request/task to the primary"""
+    _pinned_to_primary.set(True)
+
+
+def is_pinned_to_primary():
+    return _pinned_to_primary.get()
+
+
+def has_written_to_primary():
+    return _wrote_to_primary.get()
+
+
+def reset_primary_pin(pinned=False):
+    """
+    Start a new request/task scope
+
+    Returns:
+        Tokens to pass to restore_primary_pin() when the scope ends
+    """
+    return _pinned_to_primary.set(pinned), _wrote_to_primary.set(False)
+
+
+def restore_primary_pin(tokens):
+    pinned_token, wrote_token = tokens
+    _pinned_to_primary.reset(pinned_token)
+    _wrote_to_primary.reset(wrote_token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to the replica and writes to the primary ('default')
+
+    Reads stay on the primary when:
+    - the request/task is pinned (unsafe HTTP method, a write already
+      happened, or the client wrote recently - see ReplicaPinningMiddleware)
+    - a transaction.atomic block is open on the primary, so
+      read-modify-write sequences like create_booking see their own rows
+    """
+
+    def db_for_read(self, model, **hints):
+        if _pinned_to_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return settings.DATABASE_REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Read your writes: everything after the first write uses the primary
+        _pinned_to_primary.set(True)
+        _wrote_to_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replica hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary and is never migrated directly
+        if db == settings.DATABASE_REPLICA_ALIAS:
+            return False
+        return None
@@ -0,0 +1,127 @@
+"""
+Per-request SQL and timing measurements
+
+RequestInstrumentationMiddleware (core.middleware) measures a sample of
+requests: it installs a QueryStats execute wrapper on every database
+connection of the serving thread for the duration of the view, then
+records a profile in a process-wide ring buffer, logs it as one JSON line
+on the 'core.instrumentation' logger and adds a Server-Timing header.
+Staff read the buffer through GET /api/admin/requests/.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger('core.instrumentation')
+
+# Longest SQL kept for the slowest statement of a request
+MAX_SQL_LENGTH = 1000
+
+_recent = deque(maxlen=settings.INSTRUMENTATION_BUFFER_SIZE)
+_recent_lock = threading.Lock()
+
+
+class QueryStats:
+    """
+    Database execute wrapper counting queries and their time
+
+    Only the SQL of the slowest statement is kept, without its parameters,
+    so profiles hold no customer data.
+    """
+    __slots__ = ('count', 'duration', 'slowest', 'slowest_sql')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = ''
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if elapsed > self.slowest:
+                self.slowest = elapsed
+                self.slowest_sql = sql
+
+    def install(self):
+        """
+        Wrap every database connection of the current thread
+
+        Returns:
+            ExitStack: Close it to remove the wrappers
+        """
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+
+class RequestProfile:
+    """Measurements of one sampled request, from the view onwards"""
+
+    def __init__(self, view_name):
+        self.view_name = view_name
+        self.view_started = time.perf_counter()
+        self.queries = QueryStats()
+        self.wrappers = self.queries.install()
+
+    def finish(self, request, response, started):
+        """Stop measuring and return the profile as a dict"""
+        now = time.perf_counter()
+        self.wrappers.close()
+        queries = self.queries
+        return {
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': self.view_name,
+            'status': response.status_code,
+            'queries': queries.count,
+            'sql_ms': round(queries.duration * 1000, 3),
+            'slowest_sql_ms': round(queries.slowest * 1000, 3),
+            'slowest_sql': queries.slowest_sql[:MAX_SQL_LENGTH],
+            'view_ms': round((now - self.view_started) * 1000, 3),
+            'total_ms': round((now - started) * 1000, 3),
+        }
+
+
+def server_timing(profile):
+    """Server-Timing header value for a finished profile"""
+    return (
+        f"db;dur={profile['sql_ms']};desc=\"{profile['queries']} queries\", "
+        f"view;dur={profile['view_ms']}, "
+        f"total;dur={profile['total_ms']}"
+    )
+
+
+def record(profile):
+    """Keep a finished profile in the ring buffer and log it"""
+    with _recent_lock:
+        _recent.append(profile)
+    logger.info(json.dumps(profile))
+
+
+def recent_profiles():
+    """Profiles in the ring buffer, most recent first"""
+    with _recent_lock:
+        profiles = list(_recent)
+    profiles.reverse()
+    return profiles
+
+
+def clear_profiles():
+    with _recent_lock:
+        _recent.clear()
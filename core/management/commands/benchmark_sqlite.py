@@ -0,0 +1,157 @@
+"""
+Compare SQLite read/write throughput of the default and production profiles
+
+Usage:
+    python manage.py benchmark_sqlite
+    python manage.py benchmark_sqlite --seconds 10 --readers 8 --writers 4
+
+Each profile runs against a fresh database file with a bookings-like table.
+Writers insert rows in short transactions (like create_booking), readers
+run indexed range queries (like availability checks), all concurrently.
+The default profile opens a connection per operation, as Django does with
+CONN_MAX_AGE = 0; the production profile keeps one connection per thread.
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.signals import apply_sqlite_pragmas
+
+SCHEMA = """
+CREATE TABLE booking (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_id INTEGER NOT NULL,
+    booking_date TEXT NOT NULL,
+    booking_time TEXT NOT NULL,
+    status TEXT NOT NULL,
+    customer_name TEXT NOT NULL
+);
+CREATE INDEX booking_table_date_status ON booking (table_id, booking_date, status);
+"""
+
+TABLES = 200
+DATES = 30
+
+
+class Command(BaseCommand):
+    help = 'Benchmark SQLite read/write throughput: default settings vs the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seed-rows', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        profiles = [
+            ('default', {}, False),
+            ('production', settings.SQLITE_PRODUCTION_PRAGMAS, True),
+        ]
+
+        results = {}
+        for name, pragmas, persistent in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, f'{name}.sqlite3')
+                self.seed(path, pragmas, options['seed_rows'])
+                results[name] = self.run(path, pragmas, persistent, options)
+
+            result = results[name]
+            self.stdout.write(
+                f"{name:<11} reads/s {result['reads'] / options['seconds']:>10.0f}   "
+                f"writes/s {result['writes'] / options['seconds']:>8.0f}   "
+                f"busy errors {result['errors']:>5}"
+            )
+
+        base, prod = results['default'], results['production']
+        self.stdout.write(self.style.SUCCESS(
+            f"production vs default: reads x{prod['reads'] / max(base['reads'], 1):.1f}, "
+            f"writes x{prod['writes'] / max(base['writes'], 1):.1f}"
+        ))
+
+    def connect(self, path, pragmas):
+        # Python's sqlite3 waits 5s on a locked database by default, like Django
+        connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        apply_sqlite_pragmas(connection.cursor(), pragmas)
+        return connection
+
+    def seed(self, path, pragmas, rows):
+        connection = self.connect(path, pragmas)
+        connection.executescript(SCHEMA)
+        rng = random.Random(0)
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO booking (table_id, booking_date, booking_time, status, customer_name) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (
+                (rng.randrange(TABLES), f'2030-01-{rng.randrange(DATES) + 1:02d}',
+                 f'{rng.randrange(11, 23):02d}:00:00', 'confirmed', 'Guest')
+                for _ in range(rows)
+            )
+        )
+        connection.execute('COMMIT')
+        connection.close()
+
+    def run(self, path, pragmas, persistent, options):
+        deadline = time.perf_counter() + options['seconds']
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker(kind, seed):
+            rng = random.Random(seed)
+            done = errors = 0
+            connection = self.connect(path, pragmas) if persistent else None
+
+            while time.perf_counter() < deadline:
+                conn = connection or self.connect(path, pragmas)
+                try:
+                    table_id = rng.randrange(TABLES)
+                    booking_date = f'2030-01-{rng.randrange(DATES) + 1:02d}'
+                    if kind == 'reads':
+                        conn.execute(
+                            'SELECT booking_time FROM booking '
+                            'WHERE table_id = ? AND booking_date = ? AND status = ?',
+                            (table_id, booking_date, 'confirmed')
+                        ).fetchall()
+                    else:
+                        conn.execute('BEGIN IMMEDIATE')
+                        conn.execute(
+                            'INSERT INTO booking (table_id, booking_date, booking_time, status, customer_name) '
+                            'VALUES (?, ?, ?, ?, ?)',
+                            (table_id, booking_date, '19:00:00', 'confirmed', 'Guest')
+                        )
+                        conn.execute('COMMIT')
+                    done += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                finally:
+                    if connection is None:
+                        conn.close()
+
+            if connection is not None:
+                connection.close()
+            with lock:
+                counts[kind] += done
+                counts['errors'] += errors
+
+        threads = [
+            threading.Thread(target=worker, args=('reads', index))
+            for index in range(options['readers'])
+        ] + [
+            threading.Thread(target=worker, args=('writes', 1000 + index))
+            for index in range(options['writers'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return counts
@@ -0,0 +1,157 @@
+"""
+Profile worker startup: import time per module and app-ready time
+
+Usage:
+    python manage.py profile_startup
+    python manage.py profile_startup --top 40 --repeat 5
+    python manage.py profile_startup --output startup.json
+
+Each run starts a fresh interpreter under `python -X importtime` doing
+what a WSGI worker does before its first request: import the settings,
+django.setup() (app registry, models, AppConfig.ready), load the URLconf,
+which imports every view module, and build the middleware chain.
+
+Reported: the wall time of each phase (fastest of --repeat runs), and
+for the fastest run the slowest imports by cumulative and by self time
+and the import time per top-level package. Cumulative times include the
+imports a module triggers, so nested modules also appear in their parent.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in the child interpreter; prints the phase timings as JSON
+STARTUP_SCRIPT = """
+import json, sys, time
+mark = started = time.perf_counter()
+phases = {}
+
+def phase(name):
+    global mark
+    now = time.perf_counter()
+    phases[name] = now - mark
+    mark = now
+
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+phase('settings')
+django.setup()
+phase('apps_ready')
+from django.urls import get_resolver
+get_resolver().url_patterns
+phase('urlconf')
+from django.core.handlers.wsgi import WSGIHandler
+WSGIHandler()
+phase('middleware')
+phases['total'] = time.perf_counter() - started
+sys.stdout.write("\\n" + json.dumps(phases))
+"""
+
+PHASES = ['settings', 'apps_ready', 'urlconf', 'middleware', 'total', 'process']
+
+# import time: self [us] | cumulative | imported package
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(output):
+    """
+    Modules from `-X importtime` output
+
+    Returns:
+        list of dicts with module, self_ms, cumulative_ms and depth
+        (1 for imports made directly by the profiled code)
+    """
+    modules = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules.append({
+                'module': match.group(4),
+                'self_ms': int(match.group(1)) / 1000,
+                'cumulative_ms': int(match.group(2)) / 1000,
+                'depth': (len(match.group(3)) + 1) // 2,
+            })
+    return modules
+
+
+def package_totals(modules):
+    """Self import time summed per top-level package, slowest first"""
+    totals = {}
+    for module in modules:
+        package = module['module'].split('.')[0]
+        totals[package] = totals.get(package, 0.0) + module['self_ms']
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+class Command(BaseCommand):
+    help = 'Report worker startup time: phases, slowest imports and import time per package'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Modules and packages listed')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs; the fastest is reported')
+        parser.add_argument('--output', help='Also write the report to this JSON file')
+
+    def handle(self, *args, **options):
+        runs = [self.run_once() for _ in range(max(options['repeat'], 1))]
+        fastest = min(runs, key=lambda run: run['phases']['total'])
+        phases = {name: min(run['phases'][name] for run in runs) for name in PHASES}
+        modules = fastest['modules']
+        packages = package_totals(modules)
+        top = options['top']
+
+        self.stdout.write(f"Startup phases (fastest of {len(runs)} runs):")
+        for name in PHASES:
+            self.stdout.write(f"  {name:<12} {phases[name] * 1000:>9.1f} ms")
+
+        self.stdout.write(f"\nSlowest imports, cumulative ({len(modules)} modules imported):")
+        for module in sorted(modules, key=lambda module: module['cumulative_ms'], reverse=True)[:top]:
+            self.stdout.write(f"  {module['cumulative_ms']:>9.1f} ms  {module['module']}")
+
+        self.stdout.write("\nSlowest imports, self:")
+        for module in sorted(modules, key=lambda module: module['self_ms'], reverse=True)[:top]:
+            self.stdout.write(f"  {module['self_ms']:>9.1f} ms  {module['module']}")
+
+        self.stdout.write("\nImport time per package:")
+        for package, total in packages[:top]:
+            self.stdout.write(f"  {total:>9.1f} ms  {package}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'phases_ms': {name: round(value * 1000, 3) for name, value in phases.items()},
+                    'packages_ms': {package: round(total, 3) for package, total in packages},
+                    'modules': modules,
+                }, f, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nReady to serve in {phases['total'] * 1000:.1f} ms "
+            f"({phases['process'] * 1000:.1f} ms including interpreter start and exit)"
+        ))
+
+    def run_once(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError('Startup failed:\n' + '\n'.join(errors[-20:]))
+
+        # The settings module may print; the timings are the last line
+        phases = json.loads(result.stdout.splitlines()[-1])
+        phases['process'] = elapsed
+        return {'phases': phases, 'modules': parse_importtime(result.stderr)}
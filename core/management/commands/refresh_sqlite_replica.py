@@ -0,0 +1,43 @@
+"""
+Copy the primary SQLite database into the local replica file
+
+Usage:
+    DB_REPLICA_NAME=replica.sqlite3 python manage.py refresh_sqlite_replica
+
+Uses SQLite's online backup API, so the primary stays writable while the
+copy runs. Run it periodically (or from cron) to emulate replication lag.
+"""
+
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Refresh the SQLite replica stand-in (DB_REPLICA_NAME) from the primary database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Pages copied per step; the primary is only locked during a step')
+
+    def handle(self, *args, **options):
+        if not settings.DB_REPLICA_NAME:
+            raise CommandError('DB_REPLICA_NAME is not set')
+
+        primary_name = str(settings.DATABASES['default']['NAME'])
+        started = time.perf_counter()
+
+        source = sqlite3.connect(primary_name)
+        target = sqlite3.connect(settings.DB_REPLICA_NAME)
+        try:
+            source.backup(target, pages=options['pages'])
+        finally:
+            target.close()
+            source.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Replica {settings.DB_REPLICA_NAME} refreshed from {primary_name} "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,422 @@
+"""
+Counters, gauges and histograms, exported in the Prometheus text format
+
+All metrics are declared at the bottom of this module, with their label
+values and histogram buckets fixed up front. That gives every process the
+same layout: a flat array of float64 slots, one per counter or gauge
+value and, per histogram, one per bucket plus one for the sum. Recording
+is a lock and an index into that array, well under a microsecond.
+
+With METRICS_DIR set, each process keeps its array in an mmap'd file
+<METRICS_DIR>/metrics-<pid>.db and GET /metrics sums the files of all
+workers: counters and histograms over every file, since the work of a
+worker that has exited still happened, gauges over live processes only.
+Empty the directory when the server is (re)started. Without METRICS_DIR
+the array lives in process memory and /metrics reports this process only.
+"""
+
+import functools
+import hashlib
+import itertools
+import math
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+# Latency buckets in seconds, from 1 ms to 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# A file starts with the layout digest, then the float64 slots
+HEADER_SIZE = 8
+FILE_PATTERN = re.compile(r'^metrics-(\d+)\.db$')
+
+
+class Registry:
+    """Layout and storage of the declared metrics"""
+
+    def __init__(self):
+        self.metrics = []
+        self.size = 0
+        self.values = memoryview(bytearray()).cast('d')
+        self.lock = threading.Lock()
+        self.directory = None
+        self.file = None
+
+    def register(self, metric):
+        """Give a metric its slots; returns the offset of the first one"""
+        if self.directory:
+            raise RuntimeError('Metrics must be declared in core.metrics, before the registry is opened')
+        with self.lock:
+            offset = self.size
+            self.size += metric.slots
+            values = memoryview(bytearray(8 * self.size)).cast('d')
+            values[:offset] = self.values
+            self.values = values
+            self.metrics.append(metric)
+        return offset
+
+    @property
+    def digest(self):
+        """Fingerprint of the layout; files with another layout are ignored"""
+        layout = '\n'.join(metric.describe() for metric in self.metrics)
+        return hashlib.sha1(layout.encode()).digest()[:HEADER_SIZE]
+
+    def open(self, directory):
+        """Move this process's values into an mmap'd file in directory"""
+        if not directory:
+            return
+        first = self.directory is None
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'metrics-{os.getpid()}.db')
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # A file left by an exited process with the same pid starts over
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, HEADER_SIZE + 8 * self.size)
+            self.file = mmap.mmap(fd, HEADER_SIZE + 8 * self.size)
+        finally:
+            os.close(fd)
+        self.file[:HEADER_SIZE] = self.digest
+        self.values = memoryview(self.file)[HEADER_SIZE:].cast('d')
+
+        if first:
+            os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        """A forked worker records into its own file, starting from zero"""
+        self.lock = threading.Lock()
+        if self.directory:
+            self.open(self.directory)
+
+    def collect(self):
+        """
+        Current values, summed over the processes sharing METRICS_DIR
+
+        Returns:
+            array of float64, in the layout of self.metrics
+        """
+        with self.lock:
+            own = array('d', self.values)
+        if not self.directory:
+            return own
+
+        # Slots of gauges are only summed for running processes
+        gauge_slots = [
+            (metric.offset, metric.offset + metric.slots)
+            for metric in self.metrics if metric.kind == 'gauge'
+        ]
+        totals = array('d', bytes(8 * self.size))
+        digest = self.digest
+        for filename in os.listdir(self.directory):
+            match = FILE_PATTERN.match(filename)
+            if not match:
+                continue
+            pid = int(match.group(1))
+            if pid == os.getpid():
+                values = own
+            else:
+                try:
+                    with open(os.path.join(self.directory, filename), 'rb') as f:
+                        data = f.read(HEADER_SIZE + 8 * self.size)
+                except OSError:
+                    continue
+                if data[:HEADER_SIZE] != digest or len(data) != HEADER_SIZE + 8 * self.size:
+                    # Written by another version of the code
+                    continue
+                values = array('d', data[HEADER_SIZE:])
+                if not is_running(pid):
+                    for start, end in gauge_slots:
+                        values[start:end] = array('d', bytes(8 * (end - start)))
+            for index, value in enumerate(values):
+                totals[index] += value
+        return totals
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """
+    A named metric with a fixed set of label values
+
+    labels maps each label name to its allowed values; there is one child
+    per combination, reached with labels(*values). Unlabelled metrics are
+    recorded on directly.
+    """
+    kind = None
+    child_class = None
+    child_slots = 1
+
+    def __init__(self, name, documentation, labels=None, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels or {})
+        self.combinations = list(itertools.product(*(labels or {}).values()))
+        self.slots = len(self.combinations) * self.child_slots
+        self.registry = registry
+        self.offset = registry.register(self)
+        self.children = {
+            values: self.child_class(self, self.offset + index * self.child_slots)
+            for index, values in enumerate(self.combinations)
+        }
+        self.default = self.children.get(())
+
+    def labels(self, *values):
+        try:
+            return self.children[values]
+        except KeyError:
+            raise ValueError(f"{self.name} has no labels {values}, declared: {self.combinations}") from None
+
+    def describe(self):
+        return f'{self.kind} {self.name} {self.combinations}'
+
+    def samples(self, values):
+        """(name suffix, labels, value) for the exposition format"""
+        for combination, child in self.children.items():
+            yield '', dict(zip(self.label_names, combination)), values[child.offset]
+
+
+class CounterChild:
+    __slots__ = ('registry', 'offset')
+
+    def __init__(self, metric, offset):
+        self.registry = metric.registry
+        self.offset = offset
+
+    def inc(self, amount=1.0):
+        registry = self.registry
+        with registry.lock:
+            registry.values[self.offset] += amount
+
+
+class Counter(Metric):
+    """A total that only goes up, e.g. bookings created"""
+    kind = 'counter'
+    child_class = CounterChild
+
+    def inc(self, amount=1.0):
+        self.default.inc(amount)
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        registry = self.registry
+        with registry.lock:
+            registry.values[self.offset] = value
+
+    def track_in_progress(self):
+        """Context manager counting the blocks currently running"""
+        return InProgress(self)
+
+
+class InProgress:
+    __slots__ = ('gauge',)
+
+    def __init__(self, gauge):
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.gauge.inc()
+
+    def __exit__(self, *exc_info):
+        self.gauge.dec()
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. transactions in progress"""
+    kind = 'gauge'
+    child_class = GaugeChild
+
+    def inc(self, amount=1.0):
+        self.default.inc(amount)
+
+    def dec(self, amount=1.0):
+        self.default.dec(amount)
+
+    def set(self, value):
+        self.default.set(value)
+
+    def track_in_progress(self):
+        return self.default.track_in_progress()
+
+
+class HistogramChild:
+    __slots__ = ('registry', 'offset', 'upper_bounds', 'sum_offset')
+
+    def __init__(self, metric, offset):
+        self.registry = metric.registry
+        self.offset = offset
+        self.upper_bounds = metric.upper_bounds
+        self.sum_offset = offset + len(metric.upper_bounds)
+
+    def observe(self, value):
+        # Slots hold per-bucket counts; they are made cumulative on export
+        index = self.offset + bisect_left(self.upper_bounds, value)
+        registry = self.registry
+        with registry.lock:
+            values = registry.values
+            values[index] += 1.0
+            values[self.sum_offset] += value
+
+    def time(self):
+        """Observe the seconds spent in a block, or in every call of a function"""
+        return Timer(self)
+
+
+class Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+    def __call__(self, func):
+        observe = self.histogram.observe
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - started)
+        return timed
+
+
+class Histogram(Metric):
+    """Observations counted in fixed buckets, e.g. request latency"""
+    kind = 'histogram'
+    child_class = HistogramChild
+
+    def __init__(self, name, documentation, labels=None, buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.upper_bounds = tuple(sorted(map(float, buckets))) + (math.inf,)
+        self.child_slots = len(self.upper_bounds) + 1
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value):
+        self.default.observe(value)
+
+    def time(self):
+        return self.default.time()
+
+    def describe(self):
+        return f'{super().describe()} {self.upper_bounds}'
+
+    def samples(self, values):
+        for combination, child in self.children.items():
+            labels = dict(zip(self.label_names, combination))
+            count = 0.0
+            for index, bound in enumerate(self.upper_bounds):
+                count += values[child.offset + index]
+                yield '_bucket', {**labels, 'le': format_value(bound)}, count
+            yield '_count', labels, count
+            yield '_sum', labels, values[child.sum_offset]
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def render(registry=REGISTRY):
+    """All metrics in the Prometheus text exposition format"""
+    values = registry.collect()
+    lines = []
+    for metric in registry.metrics:
+        lines.append(f'# HELP {metric.name} {escape(metric.documentation)}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for suffix, labels, value in metric.samples(values):
+            if labels:
+                label_text = ','.join(f'{name}="{escape(label)}"' for name, label in labels.items())
+                lines.append(f'{metric.name}{suffix}{{{label_text}}} {format_value(value)}')
+            else:
+                lines.append(f'{metric.name}{suffix} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== BOOKING METRICS ====================
+
+AVAILABILITY_CHECK_SECONDS = Histogram(
+    'booking_availability_check_seconds',
+    'Time to compute the available tables of a restaurant (BookingService.get_available_tables)'
+)
+
+BOOKING_CREATE_SECONDS = Histogram(
+    'booking_create_seconds',
+    'Time to create a booking, including the table lock (BookingService.create_booking)'
+)
+
+BOOKING_ATTEMPTS = Counter(
+    'booking_attempts_total',
+    'Booking attempts by outcome; conflict means the slot was already taken',
+    labels={'outcome': ('created', 'conflict', 'rejected', 'lock_timeout', 'error')}
+)
+
+BOOKING_SEARCH_SECONDS = Histogram(
+    'booking_search_seconds',
+    'Time to search a restaurant\'s bookings by guest name, email or phone (BookingService.search_bookings)'
+)
+
+BOOKING_TRANSACTIONS_IN_PROGRESS = Gauge(
+    'booking_transactions_in_progress',
+    'Booking transactions holding or waiting for the table lock'
+)
+
+BOOKINGS_CANCELLED = Counter(
+    'bookings_cancelled_total',
+    'Bookings cancelled by restaurants'
+)
+
+PUBLIC_REQUEST_SECONDS = Histogram(
+    'public_booking_request_seconds',
+    'Time spent in the public booking views, from validation to serialization',
+    labels={'endpoint': ('availability', 'book')}
+)
+
+PUBLIC_THROTTLED = Counter(
+    'public_throttled_total',
+    'Public requests refused by a throttle',
+    labels={'scope': ('public_read', 'public_availability', 'public_book')}
+)
+
+QR_CACHE_REQUESTS = Counter(
+    'qr_cache_requests_total',
+    'QR code image lookups in the rendered image cache',
+    labels={'result': ('hit', 'miss')}
+)
@@ -0,0 +1,188 @@
+"""
+Core middleware
+"""
+
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .db_routers import has_written_to_primary, reset_primary_pin, restore_primary_pin
+from .instrumentation import RequestProfile, record, server_timing
+from .profiling import is_valid_token, start_profile
+from .tracing import start_trace, trace_queries
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Per-request "read your writes" scope for PrimaryReplicaRouter
+
+    Unsafe methods (POST/PUT/PATCH/DELETE) run entirely on the primary.
+    After a request writes, a short-lived cookie pins the same client to
+    the primary for DATABASE_REPLICA_PIN_SECONDS, covering replica lag on
+    the page load that follows, e.g. the booking list after a cancellation.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = (
+            request.method not in SAFE_METHODS
+            or settings.DATABASE_REPLICA_PIN_COOKIE in request.COOKIES
+        )
+        tokens = reset_primary_pin(pinned)
+        try:
+            response = self.get_response(request)
+            if has_written_to_primary():
+                response.set_cookie(
+                    settings.DATABASE_REPLICA_PIN_COOKIE,
+                    '1',
+                    max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax'
+                )
+            return response
+        finally:
+            restore_primary_pin(tokens)
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Query count, SQL time, slowest statement and view time per request
+
+    A fraction of requests is measured: INSTRUMENTATION_SAMPLE_RATES per
+    URL name (e.g. 'bookings:create_booking'), INSTRUMENTATION_SAMPLE_RATE
+    for the rest. Unsampled requests cost one random() call; with every
+    rate at 0 the middleware removes itself at startup.
+
+    Place it first in MIDDLEWARE so the total time covers the others.
+    Queries run while a streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.default_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        self.rates = settings.INSTRUMENTATION_SAMPLE_RATES
+        if not self.default_rate and not any(self.rates.values()):
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+
+        profile = getattr(request, '_instrumentation', None)
+        if profile is None:
+            return response
+
+        result = profile.finish(request, response, started)
+        record(result)
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(result)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        rate = self.rates.get(view_name, self.default_rate)
+        if rate and random.random() < rate:
+            request._instrumentation = RequestProfile(view_name)
+
+
+class RequestProfilingMiddleware:
+    """
+    Run single requests under cProfile and tracemalloc (see core.profiling)
+
+    A request is profiled when it carries a valid token in the
+    X-Profile-Token header or the profile_token query parameter, or when
+    its URL name is drawn by PROFILING_SAMPLE_RATES. The artifact name is
+    returned in the X-Profile-Id response header. Without PROFILING_ENABLED
+    the middleware removes itself at startup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rates = settings.PROFILING_SAMPLE_RATES
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return response
+
+        try:
+            response['X-Profile-Id'] = profile.finish(request, response)
+        except Exception:
+            # A full disk must not turn into a failed request
+            logger.exception("Could not save the profile of %s", request.path)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        token = request.headers.get('X-Profile-Token') or request.GET.get('profile_token')
+        view_name = request.resolver_match.view_name
+
+        if token:
+            if not is_valid_token(token):
+                return None
+            trigger = 'token'
+        else:
+            rate = self.rates.get(view_name)
+            if not rate or random.random() >= rate:
+                return None
+            trigger = 'sample'
+
+        request._profile = start_profile(view_name, trigger)
+        return None
+
+
+class TracingMiddleware:
+    """
+    Root span for a sample of requests (see core.tracing)
+
+    TRACING_SAMPLE_RATES per URL name, TRACING_SAMPLE_RATE for the rest;
+    with every rate at 0 the middleware removes itself at startup. Sampled
+    requests get a span per SQL statement and their trace id in the
+    X-Trace-Id response header. A view that raises marks the root span
+    with the exception's name.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.default_rate = settings.TRACING_SAMPLE_RATE
+        self.rates = settings.TRACING_SAMPLE_RATES
+        if not self.default_rate and not any(self.rates.values()):
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        root = getattr(request, '_trace', None)
+        if root is None:
+            return response
+
+        request._trace_queries.close()
+        root.set_attribute('status', response.status_code)
+        root.__exit__(None, None, None)
+        response['X-Trace-Id'] = root.trace.trace_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        rate = self.rates.get(view_name, self.default_rate)
+        if rate and random.random() < rate:
+            request._trace = start_trace(f'{request.method} {view_name}', path=request.path)
+            request._trace.__enter__()
+            request._trace_queries = trace_queries()
+
+    def process_exception(self, request, exception):
+        root = getattr(request, '_trace', None)
+        if root is not None:
+            root.error = type(exception).__name__
@@ -4,6 +4,7 @@ Core models - Custom User model with role-based authentication
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.urls import reverse
 
 
 class User(AbstractUser):
@@ -51,6 +52,15 @@ class User(AbstractUser):
     def is_customer(self):
         return self.role == 'CUSTOMER'
 
+    @property
+    def dashboard_url(self):
+        """Page the user lands on after logging in"""
+        if self.is_admin:
+            return reverse('core:admin_dashboard')
+        if self.is_owner:
+            return reverse('core:owner_dashboard')
+        return reverse('core:login_page')
+
     def has_restaurant(self):
         """Check if owner has a restaurant"""
         if self.is_owner:
@@ -0,0 +1,170 @@
+"""
+On-demand CPU and memory profiling of single requests
+
+RequestProfilingMiddleware (core.middleware) runs a request under cProfile
+and tracemalloc when it carries a valid profiling token (X-Profile-Token
+header or profile_token query parameter), or when its URL name is sampled
+through PROFILING_SAMPLE_RATES. Tokens are signed, expire after
+PROFILING_TOKEN_MAX_AGE seconds and are handed out to staff on the admin
+page /admin/profiles/, which also lists and serves the artifacts.
+
+Each profile is written to PROFILING_DIR as three files sharing a name:
+    <name>.prof  pstats dump (snakeviz, `python -m pstats`)
+    <name>.txt   readable report: hottest functions, top allocations by line
+    <name>.json  request metadata, used for the admin listing
+Only the newest PROFILING_MAX_PROFILES profiles are kept.
+
+tracemalloc traces the whole process, so one request is profiled at a
+time per process; requests arriving meanwhile run unprofiled.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+TOKEN_SALT = 'core.profiling'
+
+# Artifact names, as written by RequestProfile.save()
+NAME_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}-[\w.-]+-[0-9a-f]{8}$')
+
+_lock = threading.Lock()
+
+
+def make_token():
+    """Signed token enabling profiling for PROFILING_TOKEN_MAX_AGE seconds"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(uuid.uuid4().hex)
+
+
+def is_valid_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class RequestProfile:
+    """cProfile and tracemalloc measurements of one request"""
+
+    def __init__(self, view_name, trigger):
+        self.view_name = view_name
+        self.trigger = trigger
+        # Leave tracing on afterwards if someone else started it
+        self.stop_tracing = not tracemalloc.is_tracing()
+        if self.stop_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.snapshot = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def finish(self, request, response):
+        """Stop profiling, write the artifacts and return their name"""
+        try:
+            self.profiler.disable()
+            wall = time.perf_counter() - self.started
+            allocations = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if self.stop_tracing:
+                tracemalloc.stop()
+            _lock.release()
+
+        metadata = {
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': self.view_name,
+            'status': response.status_code,
+            'wall_ms': round(wall * 1000, 3),
+            'peak_kb': round(peak / 1024, 1),
+            'trigger': self.trigger,
+        }
+        return self.save(metadata, allocations)
+
+    def save(self, metadata, allocations):
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        view = re.sub(r'[^\w.-]', '_', self.view_name)
+        name = f"{timezone.now():%Y%m%dT%H%M%S}-{view}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(directory, name)
+
+        self.profiler.dump_stats(f'{path}.prof')
+
+        report = io.StringIO()
+        report.write(f"{metadata['method']} {metadata['path']} -> {metadata['status']}\n")
+        report.write(
+            f"view {metadata['view']}, trigger {metadata['trigger']}, "
+            f"wall {metadata['wall_ms']} ms, peak traced memory {metadata['peak_kb']} KiB\n\n"
+        )
+        report.write('== CPU, by cumulative time ==\n')
+        pstats.Stats(self.profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        report.write('== Allocations still held at the end, by line ==\n')
+        for stat in allocations[:25]:
+            report.write(f'{stat}\n')
+        with open(f'{path}.txt', 'w') as f:
+            f.write(report.getvalue())
+
+        with open(f'{path}.json', 'w') as f:
+            json.dump({'name': name, **metadata}, f)
+
+        prune_profiles()
+        return name
+
+
+def start_profile(view_name, trigger):
+    """A running RequestProfile, or None if another request is being profiled"""
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        return RequestProfile(view_name, trigger)
+    except BaseException:
+        _lock.release()
+        raise
+
+
+def list_profiles():
+    """Metadata of the stored profiles, newest first"""
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if filename.endswith('.json'):
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                # Being written or pruned by another process
+                continue
+    return profiles
+
+
+def profile_path(name, extension):
+    """Path of an artifact, or None for names that are not artifacts"""
+    if not NAME_PATTERN.match(name) or extension not in ('prof', 'txt'):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, f'{name}.{extension}')
+    return path if os.path.exists(path) else None
+
+
+def prune_profiles():
+    """Delete all but the newest PROFILING_MAX_PROFILES profiles"""
+    for profile in list_profiles()[settings.PROFILING_MAX_PROFILES:]:
+        for extension in ('json', 'prof', 'txt'):
+            try:
+                os.remove(os.path.join(settings.PROFILING_DIR, f"{profile['name']}.{extension}"))
+            except FileNotFoundError:
+                pass
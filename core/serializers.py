@@ -3,23 +3,22 @@ Core serializers for authentication
 """
 
 from rest_framework import serializers
-from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import User
 from restaurants.models import Restaurant
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
-    """Serializer for UserProfile"""
+    """A user's role and contact fields, nested as `profile`"""
 
     class Meta:
-        model = UserProfile
-        fields = ['role', 'phone', 'avatar', 'is_admin', 'is_owner', 'dashboard_url']
+        model = User
+        fields = ['role', 'phone', 'is_admin', 'is_owner', 'dashboard_url']
         read_only_fields = ['is_admin', 'is_owner', 'dashboard_url']
 
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for User with profile"""
-    profile = UserProfileSerializer(read_only=True)
+    profile = UserProfileSerializer(source='*', read_only=True)
 
     class Meta:
         model = User
@@ -100,14 +99,8 @@ class SignupSerializer(serializers.Serializer):
                 'zip_code': validated_data.pop('restaurant_zip'),
             }
 
-        # Create user
-        user = User.objects.create_user(**validated_data)
-
-        # Update profile with role
-        profile = user.profile
-        profile.role = role
-        profile.phone = phone
-        profile.save()
+        # Create user with role
+        user = User.objects.create_user(role=role.upper(), phone=phone, **validated_data)
 
         # Create restaurant if owner
         if role == 'owner' and restaurant_data:
@@ -0,0 +1,227 @@
+"""
+Restaurant-based database sharding
+
+Every restaurant's tables and bookings are independent, so they live on
+one of the shard databases listed in settings.DATABASE_SHARDS. The
+Restaurant rows themselves (and users) stay in the 'default' database,
+which acts as the catalog: it is where owner and qr_code_id lookups
+happen, and Restaurant.shard records which shard holds the rest.
+
+Queries on sharded models have no restaurant to route on unless they
+carry an instance hint, so code that filters them must say where to go:
+
+    Booking.objects.using(db_for_restaurant(restaurant)).filter(...)
+
+db_for_restaurant() returns None when sharding is off, which leaves the
+choice to the other routers (e.g. the read replica router).
+"""
+
+import zlib
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.utils import timezone
+
+
+def sharding_enabled():
+    return bool(settings.DATABASE_SHARDS)
+
+
+def is_sharded_model(model):
+    return model._meta.label in settings.DATABASE_SHARDED_MODELS
+
+
+def default_shard(qr_code_id):
+    """Stable initial placement of a restaurant by its public id"""
+    shards = settings.DATABASE_SHARDS
+    return shards[zlib.crc32(str(qr_code_id).encode()) % len(shards)]
+
+
+def db_for_restaurant(restaurant):
+    """
+    Database alias holding a restaurant's tables and bookings
+
+    Args:
+        restaurant: Restaurant instance
+
+    Returns:
+        Shard alias, or None when sharding is disabled
+    """
+    if not sharding_enabled():
+        return None
+    return restaurant.shard or default_shard(restaurant.qr_code_id)
+
+
+def db_for_instance(instance):
+    """
+    Database alias for queries related to an already loaded sharded row,
+    e.g. bookings of a Table. None when sharding is disabled.
+    """
+    if not sharding_enabled():
+        return None
+    return instance._state.db
+
+
+def shard_databases():
+    """
+    Databases holding sharded rows, for jobs that walk all of them
+
+    Every shard, or just 'default' (never a read replica) when sharding
+    is off.
+    """
+    return settings.DATABASE_SHARDS or [DEFAULT_DB_ALIAS]
+
+
+def sharded_models():
+    """Sharded model classes with their restaurant lookup, in copy order"""
+    return [
+        (apps.get_model(label), lookup)
+        for label, lookup in settings.DATABASE_SHARDED_MODELS.items()
+    ]
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet for sharded models
+
+    create() without using() routes the new row by its restaurant instead of
+    falling back to 'default', so ModelSerializer.save() works unchanged.
+    update() stamps updated_at like save() does: moving a restaurant to
+    another shard catches up on rows changed during the copy by that
+    timestamp (see move_restaurant_shard).
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None or not sharding_enabled():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        # save() passes the instance as a router hint
+        obj.save(force_insert=True)
+        return obj
+
+    def update(self, **kwargs):
+        if 'updated_at' not in kwargs and any(
+            field.name == 'updated_at' for field in self.model._meta.concrete_fields
+        ):
+            kwargs['updated_at'] = timezone.now()
+        return super().update(**kwargs)
+
+
+class RestaurantShardRouter:
+    """
+    Route sharded models (settings.DATABASE_SHARDED_MODELS) to the shard
+    of the restaurant they belong to, using instance hints
+
+    Returns None for everything else, so the next router (or 'default')
+    decides. Catalog models are only migrated on 'default'; sharded models
+    are migrated everywhere.
+    """
+
+    def _db_for_hints(self, hints):
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+
+        if instance._meta.label == 'restaurants.Restaurant':
+            return db_for_restaurant(instance)
+
+        if not is_sharded_model(type(instance)):
+            return None
+
+        # Follow the restaurant lookup (e.g. booking__restaurant) until a
+        # related row already loaded from a shard, or the restaurant, is found
+        obj = instance
+        for name in settings.DATABASE_SHARDED_MODELS[instance._meta.label].split('__'):
+            if obj._state.db in settings.DATABASE_SHARDS:
+                return obj._state.db
+            obj = getattr(obj, name, None)
+            if obj is None:
+                return None
+        return db_for_restaurant(obj)
+
+    def _db_for_catalog(self, hints):
+        # Django falls back to the hint instance's database, which for e.g.
+        # booking.restaurant would be the shard; catalog rows live in 'default'
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.DATABASE_SHARDS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        if is_sharded_model(model):
+            return self._db_for_hints(hints)
+        return self._db_for_catalog(hints)
+
+    def db_for_write(self, model, **hints):
+        if is_sharded_model(model):
+            return self._db_for_hints(hints)
+        return self._db_for_catalog(hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Sharded rows may point at catalog rows in 'default'
+        if is_sharded_model(type(obj1)) or is_sharded_model(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in settings.DATABASE_SHARDS:
+            return None
+        if model_name is None:
+            # RunPython/RunSQL operations opt in with hints={'sharded': True}
+            return hints.get('sharded', False)
+        return f"{app_label}.{model_name}".lower() in {
+            label.lower() for label in settings.DATABASE_SHARDED_MODELS
+        }
+
+
+def shard_id_start(using):
+    """First primary key of a shard's range (see reserve_shard_id_ranges)"""
+    return (settings.DATABASE_SHARDS.index(using) + 1) * settings.DATABASE_SHARD_ID_RANGE
+
+
+def reserve_shard_id_ranges(using, **kwargs):
+    """
+    post_migrate handler giving each shard its own primary key range
+
+    Rows keep their ids when a restaurant moves between shards, so ids
+    must not collide across shards. shard_<i> allocates ids from
+    (i + 1) * DATABASE_SHARD_ID_RANGE onwards (SQLite AUTOINCREMENT sequences).
+    """
+    if using not in settings.DATABASE_SHARDS:
+        return
+
+    offset = shard_id_start(using)
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model, _ in sharded_models():
+            table = model._meta.db_table
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, offset])
+            elif row[0] < offset:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [offset, table])
+
+
+def restore_id_sequence(model, using):
+    """
+    Point a shard's id sequence for model back into the shard's own range
+
+    Rows copied in from another shard keep their ids, and SQLite moves the
+    AUTOINCREMENT sequence past the largest id inserted, into the other
+    shard's range. Call in the same transaction as the insert, so that no
+    row is allocated from the wrong range in between.
+    """
+    start = shard_id_start(using)
+    connection = connections[using]
+    table = model._meta.db_table
+    pk = model._meta.pk.column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE sqlite_sequence SET seq = ('
+            f'SELECT COALESCE(MAX({connection.ops.quote_name(pk)}), %s) FROM {connection.ops.quote_name(table)} '
+            f'WHERE {connection.ops.quote_name(pk)} >= %s AND {connection.ops.quote_name(pk)} < %s'
+            f') WHERE name = %s',
+            [start, start, start + settings.DATABASE_SHARD_ID_RANGE, table]
+        )
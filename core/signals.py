@@ -0,0 +1,41 @@
+"""
+Signal handlers for the core app
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from .sharding import reserve_shard_id_ranges
+from .slow_queries import log_slow_queries
+
+
+def apply_sqlite_pragmas(cursor, pragmas):
+    """Run PRAGMA statements on a DB-API cursor"""
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Apply settings.SQLITE_PRAGMAS to each new SQLite connection"""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor, settings.SQLITE_PRAGMAS)
+
+
+@receiver(connection_created)
+def install_slow_query_log(sender, connection, **kwargs):
+    """Time every statement on the connection (see core.slow_queries)"""
+    # Once per connection: the signal fires again on every reconnect, and
+    # wrappers outlive the underlying database connection
+    if not settings.SLOW_QUERY_THRESHOLD_MS or log_slow_queries in connection.execute_wrappers:
+        return
+    # First, not last: connections open lazily, possibly inside a
+    # connection.execute_wrapper() block, which pops the last wrapper
+    connection.execute_wrappers.insert(0, log_slow_queries)
+
+
+post_migrate.connect(reserve_shard_id_ranges, dispatch_uid='reserve_shard_id_ranges')
@@ -0,0 +1,202 @@
+"""
+Slow-query log with EXPLAIN QUERY PLAN capture
+
+Every database connection gets the log_slow_queries execute wrapper (see
+core.signals). Statements slower than SLOW_QUERY_THRESHOLD_MS are logged
+on the 'core.slow_queries' logger and grouped by their normalized SQL,
+so one query shape run with many different parameters is one entry with
+counts and latency percentiles. The first time a shape is seen, its query
+plan is captured on a background thread, off the request path.
+
+Transaction control statements are not timed: a slow BEGIN IMMEDIATE is
+a wait for another writer's lock (core.transactions), not a query to
+tune, and has no plan.
+
+Groups are kept in memory per process; staff see them in the admin at
+/admin/slow-queries/ and as JSON at GET /api/admin/slow-queries/.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger('core.slow_queries')
+
+# Longest SQL kept per group and per log line
+MAX_SQL_LENGTH = 2000
+
+_groups = OrderedDict()
+_lock = threading.Lock()
+_local = threading.local()
+_executor = None
+
+_IN_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+_TRANSACTION_CONTROL = re.compile(r'\s*(?:BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """
+    SQL shape shared by every run of a query, whatever its parameters
+
+    Literals become ?, and IN lists of any length become IN (...), so a
+    lookup of 3 ids and one of 300 are the same shape.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql.replace('%s', '?'))
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class SlowQueryGroup:
+    """Statistics of one slow query shape"""
+
+    def __init__(self, fingerprint, sql, alias):
+        self.fingerprint = fingerprint
+        self.sql = sql
+        self.alias = alias
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Recent durations only, so percentiles follow current behaviour
+        self.samples = deque(maxlen=settings.SLOW_QUERY_SAMPLES)
+        self.first_seen = self.last_seen = timezone.now()
+        self.plan = None
+        self.full_scan = None
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.samples.append(duration)
+        self.last_seen = timezone.now()
+
+    def percentile(self, fraction):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def as_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'alias': self.alias,
+            'sql': self.sql,
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'p50_ms': round(self.percentile(0.50) * 1000, 3),
+            'p95_ms': round(self.percentile(0.95) * 1000, 3),
+            'p99_ms': round(self.percentile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'first_seen': self.first_seen.isoformat(),
+            'last_seen': self.last_seen.isoformat(),
+            'plan': self.plan,
+            'full_scan': self.full_scan,
+        }
+
+
+def get_executor():
+    """Single background thread running EXPLAIN, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+    return _executor
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    """Database execute wrapper recording statements over the threshold"""
+    if _TRANSACTION_CONTROL.match(sql):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold and duration * 1000 >= threshold and not getattr(_local, 'explaining', False):
+            record_slow_query(context['connection'], sql, None if many else params, duration)
+
+
+def record_slow_query(connection, sql, params, duration):
+    normalized = normalize_sql(sql)
+    fingerprint = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+    with _lock:
+        group = _groups.get(fingerprint)
+        is_new = group is None
+        if is_new:
+            if len(_groups) >= settings.SLOW_QUERY_MAX_GROUPS:
+                # Forget the shape that has not been slow for longest
+                _groups.popitem(last=False)
+            group = _groups[fingerprint] = SlowQueryGroup(
+                fingerprint, normalized[:MAX_SQL_LENGTH], connection.alias
+            )
+        else:
+            _groups.move_to_end(fingerprint)
+        group.add(duration)
+
+    logger.warning(json.dumps({
+        'fingerprint': fingerprint,
+        'alias': connection.alias,
+        'ms': round(duration * 1000, 3),
+        'sql': sql[:MAX_SQL_LENGTH],
+    }))
+
+    # Batch statements (executemany) have no single parameter set to explain
+    if is_new and params is not None and connection.vendor == 'sqlite':
+        get_executor().submit(capture_plan, group, connection.alias, sql, params)
+
+
+def capture_plan(group, alias, sql, params):
+    """
+    Run EXPLAIN QUERY PLAN for a group's first slow statement
+
+    Runs on the background thread, with its own connection to the
+    database. The plan is rendered as SQLite's indented tree.
+    """
+    _local.explaining = True
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            rows = cursor.fetchall()
+    except Exception as e:
+        group.plan = f'EXPLAIN failed: {e}'
+        return
+    finally:
+        _local.explaining = False
+        connection.close()
+
+    # Rows are (id, parent, notused, detail); children follow their parent
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    group.plan = '\n'.join(lines)
+    # "SCAN bookings_booking" without "USING ... INDEX" reads the whole table
+    group.full_scan = any(
+        line.lstrip().startswith('SCAN ') and 'USING' not in line
+        for line in lines
+    )
+
+
+def slow_query_groups():
+    """Recorded groups, largest total time first"""
+    with _lock:
+        groups = [group.as_dict() for group in _groups.values()]
+    return sorted(groups, key=lambda group: group['total_ms'], reverse=True)
+
+
+def clear_slow_queries():
+    with _lock:
+        _groups.clear()
@@ -0,0 +1,51 @@
+"""
+Test runner for the project's databases
+
+With DB_REPLICA_NAME set, tests make the replica a mirror of the primary
+(TEST['MIRROR']): both aliases open the same shared-cache in-memory
+database. The replica's connection is switched to read_uncommitted so it
+sees the test's uncommitted rows; otherwise its reads (Django's
+constraint checks at the end of each TestCase) fail with "database table
+is locked".
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.test.runner import DiscoverRunner
+
+
+def replica_is_primary():
+    """Whether the replica alias opens the primary database itself"""
+    replica = connections.settings.get(settings.DATABASE_REPLICA_ALIAS)
+    return replica is not None and replica['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+
+
+def read_mirrored_primary(sender, connection, **kwargs):
+    """Let a replica that mirrors the primary read its open transaction"""
+    if connection.vendor != 'sqlite' or connection.alias != settings.DATABASE_REPLICA_ALIAS:
+        return
+    if replica_is_primary():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA read_uncommitted = ON')
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Statements that happen to be slow on a loaded CI machine would
+        # print to the test output; tests capture the log with assertLogs
+        slow_query_logger = logging.getLogger('core.slow_queries')
+        self._slow_query_level = slow_query_logger.level
+        slow_query_logger.setLevel(logging.ERROR)
+
+    def teardown_test_environment(self, **kwargs):
+        logging.getLogger('core.slow_queries').setLevel(self._slow_query_level)
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        connection_created.connect(read_mirrored_primary, dispatch_uid='read_mirrored_primary')
+        return super().setup_databases(**kwargs)
@@ -1,3 +1,621 @@
-from django.test import TestCase
+"""
+Tests for the core app's throttles, QR code settings, shard routing,
+replica routing, SQLite transaction mode, metrics, the slow-query log and
+request profiling and the startup profile
+"""
 
-# Create your tests here.
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import tracemalloc
+from array import array
+from datetime import time, timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings.models import Booking, Guest
+from restaurants.models import Restaurant, Table
+from . import metrics, profiling, slow_queries
+from .checks import check_qr_error_correction
+from .management.commands.profile_startup import PHASES, package_totals, parse_importtime
+from .db_routers import PrimaryReplicaRouter, is_pinned_to_primary, reset_primary_pin, restore_primary_pin
+from .db_backends.sqlite3.base import DatabaseWrapper
+from .middleware import ReplicaPinningMiddleware
+from .sharding import db_for_restaurant, shard_id_start
+from .throttling import RestaurantRateThrottle
+from .transactions import write_atomic
+from .utils import qr_code_key, render_qr_code
+
+
+class FixedClockThrottle(RestaurantRateThrottle):
+    scope = 'public_book'
+    rate = '10/min'
+    now = 0.0
+
+    def timer(self):
+        return self.now
+
+
+class RestaurantRateThrottleTests(SimpleTestCase):
+    """Sliding-window estimate: previous * (1 - elapsed fraction) + current"""
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+
+    def allowed(self, now, restaurant='a', count=1):
+        """How many of `count` requests at `now` seconds are let through"""
+        view = SimpleNamespace(kwargs={'qr_code_id': restaurant})
+        allowed = 0
+        for _ in range(count):
+            self.throttle = FixedClockThrottle()
+            self.throttle.now = now
+            allowed += self.throttle.allow_request(self.request, view)
+        return allowed
+
+    def test_limit_within_a_window(self):
+        self.assertEqual(self.allowed(0, count=12), 10)
+        # Throttled until the window ends
+        self.assertEqual(self.throttle.wait(), 60)
+
+    def test_previous_window_is_weighted_by_the_time_left(self):
+        self.assertEqual(self.allowed(0, count=10), 10)
+        # A quarter into the next window: 10 * 0.75 + current < 10
+        self.assertEqual(self.allowed(75, count=5), 3)
+        # 7.5 + 3 requests: under the limit once 10 * (1 - f) + 3 < 10
+        self.assertAlmostEqual(self.throttle.wait(), 3)
+        self.assertEqual(self.allowed(79), 1)
+
+    def test_windows_two_apart_do_not_count(self):
+        self.assertEqual(self.allowed(0, count=10), 10)
+        self.assertEqual(self.allowed(125, count=12), 10)
+
+    def test_restaurants_have_separate_budgets(self):
+        self.assertEqual(self.allowed(0, restaurant='a', count=10), 10)
+        self.assertEqual(self.allowed(0, restaurant='a'), 0)
+        self.assertEqual(self.allowed(0, restaurant='b', count=10), 10)
+
+
+class QRErrorCorrectionTests(SimpleTestCase):
+
+    def test_unknown_level_names_the_allowed_ones(self):
+        for render in (qr_code_key, render_qr_code):
+            with self.assertRaisesMessage(ValueError, "must be one of L, M, Q, H, not 'X'"):
+                render('https://example.com', error_correction='X')
+
+    @override_settings(QR_ERROR_CORRECTION='medium')
+    def test_unknown_setting_fails_the_system_check(self):
+        self.assertEqual([error.id for error in check_qr_error_correction(None)], ['core.E001'])
+        with self.assertRaisesMessage(ValueError, "not 'medium'"):
+            qr_code_key('https://example.com')
+
+    @override_settings(QR_ERROR_CORRECTION='H')
+    def test_known_setting_passes(self):
+        self.assertEqual(check_qr_error_correction(None), [])
+        self.assertTrue(render_qr_code('https://example.com').startswith(b'\x89PNG'))
+
+
+class TransactionModeTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.name = f'{directory.name}/db.sqlite3'
+
+    def connect(self, name, **options):
+        connection = DatabaseWrapper({
+            **settings.DATABASES[DEFAULT_DB_ALIAS],
+            'NAME': name,
+            'OPTIONS': {'timeout': 0.1, **options},
+        })
+        self.addCleanup(connection.close)
+        return connection
+
+    def begin(self, connection):
+        """Start a transaction the way transaction.atomic() does on SQLite"""
+        connection.ensure_connection()
+        connection._start_transaction_under_autocommit()
+        self.addCleanup(connection.connection.rollback)
+
+    def test_immediate_transactions_take_the_write_lock_at_begin(self):
+        first, second = (self.connect(self.name, transaction_mode='IMMEDIATE') for _ in range(2))
+        self.begin(first)
+        # Nothing written yet, the lock is already held
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            self.begin(second)
+
+    def test_deferred_transactions_only_lock_on_write(self):
+        first, second = self.connect(self.name), self.connect(self.name)
+        self.begin(first)
+        self.begin(second)
+
+    def test_begin_mode_overrides_the_option(self):
+        first, second = self.connect(self.name), self.connect(self.name)
+        first.begin_mode = second.begin_mode = 'IMMEDIATE'
+        self.begin(first)
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            self.begin(second)
+
+    def test_unknown_mode_is_rejected(self):
+        connection = self.connect(':memory:', transaction_mode='LAZY')
+        with self.assertRaisesMessage(ImproperlyConfigured, "not 'LAZY'"):
+            self.begin(connection)
+
+
+class WriteAtomicTests(TransactionTestCase):
+    """Only write_atomic() blocks take the write lock at BEGIN"""
+
+    def begin_statements(self, block):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            with block():
+                Booking.objects.exists()
+        return [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+
+    def test_write_atomic_begins_immediate(self):
+        self.assertEqual(self.begin_statements(write_atomic), ['BEGIN IMMEDIATE'])
+
+    def test_other_transactions_stay_deferred(self):
+        self.assertEqual(self.begin_statements(transaction.atomic), ['BEGIN'])
+        # Nested blocks join the open transaction
+        with write_atomic():
+            self.assertEqual(self.begin_statements(write_atomic), [])
+        self.assertIsNone(connections[DEFAULT_DB_ALIAS].begin_mode)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Read your writes: reads leave the replica once the client has written"""
+    router = PrimaryReplicaRouter()
+    replica = settings.DATABASE_REPLICA_ALIAS
+
+    def setUp(self):
+        self.addCleanup(restore_primary_pin, reset_primary_pin())
+
+    def reads_from(self):
+        return self.router.db_for_read(Booking)
+
+    def request(self, method='get', cookies=None, view=None):
+        """Run a request through ReplicaPinningMiddleware, noting where `view` read"""
+        seen = {}
+
+        def get_response(request):
+            if view:
+                view()
+            seen['reads_from'] = self.reads_from()
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        response = ReplicaPinningMiddleware(get_response)(request)
+        return seen['reads_from'], response
+
+    def test_reads_follow_the_first_write_to_the_primary(self):
+        self.assertEqual(self.reads_from(), self.replica)
+        self.assertEqual(self.router.db_for_write(Booking), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.reads_from(), DEFAULT_DB_ALIAS)
+
+    def test_reads_in_a_primary_transaction_stay_on_the_primary(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(self.reads_from(), DEFAULT_DB_ALIAS)
+
+    def test_safe_requests_read_from_the_replica(self):
+        reads_from, response = self.request()
+        self.assertEqual(reads_from, self.replica)
+        self.assertNotIn(settings.DATABASE_REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_unsafe_requests_read_from_the_primary(self):
+        self.assertEqual(self.request('post')[0], DEFAULT_DB_ALIAS)
+
+    def test_a_write_pins_the_client_for_a_while(self):
+        reads_from, response = self.request(view=lambda: self.router.db_for_write(Booking))
+        self.assertEqual(reads_from, DEFAULT_DB_ALIAS)
+        cookie = response.cookies[settings.DATABASE_REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.DATABASE_REPLICA_PIN_SECONDS)
+
+        # The client's next page load, e.g. the list it just changed
+        reads_from, _ = self.request(cookies={settings.DATABASE_REPLICA_PIN_COOKIE: '1'})
+        self.assertEqual(reads_from, DEFAULT_DB_ALIAS)
+
+    def test_pins_end_with_their_request(self):
+        self.request('post', view=lambda: self.router.db_for_write(Booking))
+        self.assertFalse(is_pinned_to_primary())
+        self.assertEqual(self.request()[0], self.replica)
+
+
+@skipUnless(len(settings.DATABASE_SHARDS) >= 2, 'Needs two shards (DB_SHARDS=2)')
+class RestaurantShardRouterTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        self.restaurant = Restaurant.objects.create(
+            owner=owner,
+            name='Budget Bistro',
+            email='bistro@example.com',
+            phone='5550000000',
+            address='1 Main Street',
+            city='Springfield',
+            state='IL',
+            zip_code='62701'
+        )
+        self.shard = db_for_restaurant(self.restaurant)
+
+    def in_range(self, obj):
+        start = shard_id_start(obj._state.db)
+        return start < obj.pk < start + settings.DATABASE_SHARD_ID_RANGE
+
+    def test_restaurant_stays_in_the_catalog(self):
+        self.assertIn(self.restaurant.shard, settings.DATABASE_SHARDS)
+        self.assertEqual(self.restaurant._state.db, DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(self.shard, 'restaurants', model_name='restaurant'))
+        self.assertTrue(router.allow_migrate(self.shard, 'bookings', model_name='booking'))
+
+    def test_rows_follow_their_restaurant(self):
+        table = Table.objects.create(restaurant=self.restaurant, table_number='1', capacity=4)
+        booking = Booking.objects.create(
+            restaurant=self.restaurant,
+            table=table,
+            customer_name='Jane Guest',
+            customer_email='jane@example.com',
+            customer_phone='5551234567',
+            party_size=2,
+            booking_date=timezone.localdate() + timedelta(days=1),
+            booking_time=time(19)
+        )
+        self.assertEqual((table._state.db, booking._state.db), (self.shard, self.shard))
+        self.assertEqual(Guest.objects.using(self.shard).get().pk, booking.guest_id)
+
+        # Related rows load from the shard, the restaurant from the catalog
+        booking = Booking.objects.using(self.shard).get(pk=booking.pk)
+        self.assertEqual(booking.table._state.db, self.shard)
+        self.assertEqual(booking.restaurant._state.db, DEFAULT_DB_ALIAS)
+        self.assertEqual(list(table.bookings.all()), [booking])
+
+    def test_new_rows_take_ids_from_the_shards_range(self):
+        single = Table.objects.create(restaurant=self.restaurant, table_number='1', capacity=4)
+        bulk = Table.objects.using(self.shard).bulk_create([
+            Table(restaurant=self.restaurant, table_number=str(number), capacity=4) for number in (2, 3, 4)
+        ])
+        self.assertTrue(all(self.in_range(table) for table in [single, *bulk]))
+        self.assertEqual(len({table.pk for table in [single, *bulk]}), 4)
+        self.assertEqual(
+            sorted(Table.objects.using(self.shard).values_list('pk', flat=True)),
+            sorted(table.pk for table in [single, *bulk])
+        )
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    """Values of the processes sharing METRICS_DIR, as /metrics reports them"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        self.registry = metrics.Registry()
+        self.jobs = metrics.Counter(
+            'jobs_total', 'Jobs run', labels={'result': ('ok', 'failed')}, registry=self.registry
+        )
+        self.running = metrics.Gauge('jobs_running', 'Jobs running', registry=self.registry)
+        self.seconds = metrics.Histogram('job_seconds', 'Job time', buckets=(0.1, 1), registry=self.registry)
+        self.registry.open(self.directory)
+
+        self.jobs.labels('ok').inc(2)
+        self.running.set(3)
+        for seconds in (0.0625, 0.5, 4):
+            self.seconds.observe(seconds)
+
+    def write_process(self, pid, values, digest=None):
+        """A metrics file as another worker would leave it"""
+        with open(os.path.join(self.directory, f'metrics-{pid}.db'), 'wb') as f:
+            f.write((digest or self.registry.digest) + array('d', values).tobytes())
+
+    def rendered(self, running=True):
+        with mock.patch.object(metrics, 'is_running', return_value=running):
+            lines = metrics.render(self.registry).splitlines()
+        return {line.rsplit(' ', 1)[0]: line.rsplit(' ', 1)[1] for line in lines if not line.startswith('#')}
+
+    def test_counters_gauges_and_histograms_are_summed(self):
+        # jobs_total ok/failed, jobs_running, job_seconds buckets 0.1/1/+Inf and sum
+        self.write_process(os.getpid() + 1, [1, 4, 2, 1, 0, 0, 0.0625])
+        self.assertEqual(self.rendered(), {
+            'jobs_total{result="ok"}': '3',
+            'jobs_total{result="failed"}': '4',
+            'jobs_running': '5',
+            'job_seconds_bucket{le="0.1"}': '2',
+            'job_seconds_bucket{le="1"}': '3',
+            'job_seconds_bucket{le="+Inf"}': '4',
+            'job_seconds_count': '4',
+            'job_seconds_sum': '4.625',
+        })
+
+    def test_gauges_of_exited_processes_are_dropped(self):
+        self.write_process(os.getpid() + 1, [1, 4, 2, 1, 0, 0, 0.0625])
+        rendered = self.rendered(running=False)
+        self.assertEqual(rendered['jobs_running'], '3')
+        # Their work still happened
+        self.assertEqual(rendered['jobs_total{result="ok"}'], '3')
+        self.assertEqual(rendered['job_seconds_count'], '4')
+
+    def test_files_with_another_layout_are_skipped(self):
+        self.write_process(os.getpid() + 1, [1, 4, 2, 1, 0, 0, 0.0625], digest=b'\0' * metrics.HEADER_SIZE)
+        self.write_process(os.getpid() + 2, [1, 4, 2])
+        self.assertEqual(self.rendered()['jobs_total{result="ok"}'], '2')
+        self.assertEqual(list(self.registry.collect()), [2, 0, 3, 1, 1, 1, 4.5625])
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsViewTests(TestCase):
+
+    def get(self, **headers):
+        return self.client.get(reverse('metrics'), headers=headers)
+
+    def test_bearer_token(self):
+        response = self.get(Authorization='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'# TYPE booking_attempts_total counter', response.content)
+
+        self.assertEqual(self.get(Authorization='Bearer wrong').status_code, 403)
+        self.assertEqual(self.get().status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_configured_accepts_no_bearer(self):
+        self.assertEqual(self.get(Authorization='Bearer ').status_code, 403)
+
+    def test_staff_session(self):
+        user = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        self.client.force_login(user)
+        self.assertEqual(self.get().status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.get().status_code, 200)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=100)
+class SlowQueryLogTests(TestCase):
+    indexed = 'SELECT "id" FROM "restaurants_restaurant" WHERE "qr_code_id" = %s'
+    unindexed = 'SELECT "id" FROM "restaurants_restaurant" WHERE "description" = %s'
+
+    def setUp(self):
+        slow_queries.clear_slow_queries()
+        self.addCleanup(slow_queries.clear_slow_queries)
+
+    def run_query(self, sql, params, seconds, many=False):
+        """Run sql through the wrapper as if it took `seconds`"""
+        execute = mock.Mock()
+        with mock.patch.object(slow_queries.time, 'perf_counter', side_effect=[0, seconds]):
+            slow_queries.log_slow_queries(execute, sql, params, many, {'connection': connections[DEFAULT_DB_ALIAS]})
+        execute.assert_called_once_with(sql, params, many, mock.ANY)
+        # Plans are captured on the background thread
+        slow_queries.get_executor().submit(lambda: None).result()
+
+    def test_only_statements_over_the_threshold_are_recorded(self):
+        self.run_query(self.indexed, ['a'], 0.099)
+        self.assertEqual(slow_queries.slow_query_groups(), [])
+
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.run_query(self.indexed, ['a'], 0.1)
+        self.assertIn('"ms": 100.0', logs.output[0])
+        [group] = slow_queries.slow_query_groups()
+        self.assertEqual((group['count'], group['max_ms']), (1, 100.0))
+
+    def test_transaction_control_is_not_recorded(self):
+        # A slow BEGIN IMMEDIATE waited for another writer's lock
+        for sql in ('BEGIN IMMEDIATE', 'SAVEPOINT "s1"', 'RELEASE SAVEPOINT "s1"', 'ROLLBACK', 'COMMIT'):
+            self.run_query(sql, None, 5)
+        self.assertEqual(slow_queries.slow_query_groups(), [])
+
+    def test_runs_of_one_shape_share_a_group(self):
+        with self.assertLogs('core.slow_queries', 'WARNING'):
+            for seconds in (0.25, 0.5, 0.125):
+                self.run_query(self.indexed, [str(seconds)], seconds)
+        [group] = slow_queries.slow_query_groups()
+        self.assertEqual(group['count'], 3)
+        self.assertEqual((group['total_ms'], group['p50_ms'], group['max_ms']), (875.0, 250.0, 500.0))
+        self.assertEqual(group['sql'], 'SELECT "id" FROM "restaurants_restaurant" WHERE "qr_code_id" = ?')
+
+    def test_fingerprints_ignore_literals_and_in_list_lengths(self):
+        shapes = {
+            slow_queries.normalize_sql(sql) for sql in (
+                'SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = %s',
+                "SELECT * FROM t WHERE id IN (1,2) AND name = 'O''Brien'",
+                'SELECT *\n  FROM t  WHERE id IN (?) AND name = ?',
+            )
+        }
+        self.assertEqual(shapes, {'SELECT * FROM t WHERE id IN (...) AND name = ?'})
+        self.assertNotEqual(
+            slow_queries.normalize_sql('SELECT * FROM t WHERE id = 1'),
+            slow_queries.normalize_sql('SELECT * FROM u WHERE id = 1')
+        )
+
+    def test_plan_is_captured_once_per_shape(self):
+        with self.assertLogs('core.slow_queries', 'WARNING'):
+            self.run_query(self.indexed, ['a'], 0.2)
+            self.run_query(self.unindexed, ['a'], 0.2)
+            with mock.patch.object(slow_queries, 'capture_plan') as capture_plan:
+                self.run_query(self.unindexed, ['b'], 0.2)
+            capture_plan.assert_not_called()
+
+        plans = {group['sql']: group for group in slow_queries.slow_query_groups()}
+        indexed = plans[slow_queries.normalize_sql(self.indexed)]
+        self.assertRegex(indexed['plan'], r'^SEARCH restaurants_restaurant USING (COVERING )?INDEX')
+        self.assertFalse(indexed['full_scan'])
+        unindexed = plans[slow_queries.normalize_sql(self.unindexed)]
+        self.assertEqual(unindexed['plan'], 'SCAN restaurants_restaurant')
+        self.assertTrue(unindexed['full_scan'])
+
+    def test_batches_are_not_explained(self):
+        with self.assertLogs('core.slow_queries', 'WARNING'):
+            self.run_query(self.indexed, [['a'], ['b']], 0.2, many=True)
+        [group] = slow_queries.slow_query_groups()
+        self.assertIsNone(group['plan'])
+
+    def test_reconnecting_installs_the_wrapper_once(self):
+        # A file database: closing an in-memory one is ignored
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connection = type(connections[DEFAULT_DB_ALIAS])({
+            **connections[DEFAULT_DB_ALIAS].settings_dict, 'NAME': f'{directory.name}/db.sqlite3'
+        })
+        self.addCleanup(connection.close)
+        connection.ensure_connection()
+        connection.close()
+        # Reopened inside another wrapper's block, which pops its own on exit
+        with connection.execute_wrapper(mock.Mock()):
+            connection.ensure_connection()
+            connection.close()
+            connection.ensure_connection()
+        self.assertEqual(connection.execute_wrappers, [slow_queries.log_slow_queries])
+
+
+@override_settings(
+    PROFILING_ENABLED=True,
+    MIDDLEWARE=['core.middleware.RequestProfilingMiddleware', *settings.MIDDLEWARE],
+)
+class RequestProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.staff = users.create_user(username='staff', password='pass', role='ADMIN', is_staff=True)
+        cls.owner = users.create_user(username='owner', password='pass', role='OWNER')
+        cls.restaurant = Restaurant.objects.create(
+            owner=cls.owner, name='Budget Bistro', email='bistro@example.com', phone='5550000000',
+            address='1 Main Street', city='Springfield', state='IL', zip_code='62701'
+        )
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILING_DIR=directory.name))
+
+    def get(self, **headers):
+        return self.client.get(reverse('restaurants:public_info', args=[self.restaurant.qr_code_id]), headers=headers)
+
+    def token(self, user):
+        self.client.force_login(user)
+        response = self.client.get(reverse('admin_profiles'))
+        self.client.logout()
+        return response.context['token'] if response.status_code == 200 else None
+
+    def test_staff_token_profiles_a_request(self):
+        response = self.get(**{'X-Profile-Token': self.token(self.staff)})
+        self.assertEqual(response.status_code, 200)
+
+        [profile] = profiling.list_profiles()
+        self.assertEqual(response['X-Profile-Id'], profile['name'])
+        self.assertEqual(
+            (profile['view'], profile['trigger'], profile['status']),
+            ('restaurants:public_info', 'token', 200)
+        )
+        stats = pstats.Stats(profiling.profile_path(profile['name'], 'prof'))
+        self.assertIn('public_restaurant_info', {function for _, _, function in stats.stats})
+        with open(profiling.profile_path(profile['name'], 'txt')) as f:
+            self.assertIn('== Allocations still held at the end, by line ==', f.read())
+
+    def test_only_staff_get_tokens(self):
+        self.assertIsNone(self.token(self.owner))
+        for token in ('forged', self.token(self.staff) + 'x'):
+            self.assertNotIn('X-Profile-Id', self.get(**{'X-Profile-Token': token}))
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_tokens_expire(self):
+        token = self.token(self.staff)
+        expired = timezone.now().timestamp() + settings.PROFILING_TOKEN_MAX_AGE + 1
+        with mock.patch('django.core.signing.time.time', return_value=expired):
+            self.assertNotIn('X-Profile-Id', self.get(**{'X-Profile-Token': token}))
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_nothing_is_profiled_unless_enabled(self):
+        token = profiling.make_token()
+        self.assertNotIn('X-Profile-Id', self.get(**{'X-Profile-Token': token}))
+        self.assertEqual(profiling.list_profiles(), [])
+
+    @override_settings(PROFILING_SAMPLE_RATES={'restaurants:public_info': 1.0})
+    def test_sampled_views_are_profiled_without_a_token(self):
+        self.assertIn('X-Profile-Id', self.get())
+        self.assertEqual(profiling.list_profiles()[0]['trigger'], 'sample')
+
+    def test_profilers_are_switched_off_afterwards(self):
+        token = self.token(self.staff)
+        for _ in range(2):
+            self.assertIn('X-Profile-Id', self.get(**{'X-Profile-Token': token}))
+            self.assertFalse(tracemalloc.is_tracing())
+            self.assertIsNone(sys.getprofile())
+
+        # Tracing someone else started keeps running
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        self.assertIn('X-Profile-Id', self.get(**{'X-Profile-Token': token}))
+        self.assertTrue(tracemalloc.is_tracing())
+
+    def test_one_request_is_profiled_at_a_time(self):
+        busy = threading.Lock()
+        busy.acquire()
+        with mock.patch.object(profiling, '_lock', busy):
+            response = self.get(**{'X-Profile-Token': self.token(self.staff)})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+
+class ProfileStartupTests(SimpleTestCase):
+    """`manage.py profile_startup`, which starts a worker in a subprocess"""
+
+    IMPORTTIME = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |     _io\n'
+        'import time:      2500 |       4000 |   django.db.models\n'
+        'import time:      1500 |       1500 |     django.db\n'
+        'import time:       800 |        800 | bookings.models\n'
+        'Traceback lines and prints are ignored\n'
+    )
+
+    def test_importtime_output_is_parsed(self):
+        modules = parse_importtime(self.IMPORTTIME)
+        self.assertEqual([module['module'] for module in modules], ['_io', 'django.db.models', 'django.db', 'bookings.models'])
+        self.assertEqual(modules[1], {'module': 'django.db.models', 'self_ms': 2.5, 'cumulative_ms': 4.0, 'depth': 2})
+        self.assertEqual([module['depth'] for module in modules], [3, 2, 3, 1])
+        self.assertEqual(package_totals(modules), [('django', 4.0), ('bookings', 0.8), ('_io', 0.12)])
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'startup.json')
+            stdout = io.StringIO()
+            call_command('profile_startup', repeat=1, top=3, output=output, stdout=stdout)
+            with open(output) as f:
+                report = json.load(f)
+
+        self.assertEqual(list(report['phases_ms']), PHASES)
+        self.assertLessEqual(report['phases_ms']['total'], report['phases_ms']['process'])
+        self.assertIn('django', report['packages_ms'])
+        self.assertIn('bookings.views', [module['module'] for module in report['modules']])
+
+        stdout = stdout.getvalue()
+        for heading in ['Startup phases (fastest of 1 runs)', 'Slowest imports, cumulative', 'Slowest imports, self',
+                        'Import time per package', 'Ready to serve in']:
+            self.assertIn(heading, stdout)
+        self.assertEqual(len(stdout.split('Import time per package:\n')[1].splitlines()), 3 + 2)
+
+    def test_failed_startup_is_a_command_error(self):
+        failed = SimpleNamespace(returncode=1, stdout='', stderr='import time:   1 |   1 | os\nImproperlyConfigured: no SECRET_KEY\n')
+        with mock.patch('core.management.commands.profile_startup.subprocess.run', return_value=failed):
+            with self.assertRaisesMessage(CommandError, 'Startup failed:\nImproperlyConfigured: no SECRET_KEY'):
+                call_command('profile_startup', repeat=1, stdout=io.StringIO())
@@ -0,0 +1,98 @@
+"""
+Throttles for the public QR booking endpoints
+"""
+
+from rest_framework.throttling import SimpleRateThrottle
+
+from .metrics import PUBLIC_THROTTLED
+
+
+class RestaurantRateThrottle(SimpleRateThrottle):
+    """
+    Sliding-window counter throttle keyed on (client IP, restaurant)
+
+    The restaurant's qr_code_id is part of the key, so each (IP,
+    restaurant) pair has its own budget: a client busy with one
+    restaurant's pages is not throttled on another's. Guests sharing the
+    venue Wi-Fi have the same IP and restaurant, and so share one budget,
+    which the public rates must leave room for. A cookie or device id
+    would not separate them safely: a throttled client can drop it and
+    start over.
+
+    Unlike SimpleRateThrottle, which stores a growing list of timestamps,
+    state is two integer counters per key: the current and the previous
+    fixed window. The request count over the last `duration` seconds is
+    estimated as previous * (1 - elapsed fraction) + current, which costs
+    one get_many and one add/incr on the cache regardless of the rate.
+
+    Subclasses set `scope`; rates come from DEFAULT_THROTTLE_RATES.
+    """
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+
+    def get_cache_key(self, request, view):
+        restaurant = view.kwargs.get('qr_code_id', '')
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': f"{restaurant}_{self.get_ident(request)}"
+        }
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        self.elapsed = (now % self.duration) / self.duration
+
+        current_key = f"{self.key}_{window}"
+        previous_key = f"{self.key}_{window - 1}"
+        counts = self.cache.get_many([current_key, previous_key])
+        self.current = counts.get(current_key, 0)
+        self.previous = counts.get(previous_key, 0)
+
+        if self.previous * (1 - self.elapsed) + self.current >= self.num_requests:
+            return self.throttle_failure()
+
+        # Counters live for two windows so the next window can still weigh them
+        if not self.cache.add(current_key, 1, self.duration * 2):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                self.cache.set(current_key, 1, self.duration * 2)
+
+        return self.throttle_success()
+
+    def throttle_success(self):
+        return True
+
+    def throttle_failure(self):
+        PUBLIC_THROTTLED.labels(self.scope).inc()
+        return False
+
+    def wait(self):
+        """Seconds until the weighted count drops back under the limit"""
+        if self.current >= self.num_requests or not self.previous:
+            return (1 - self.elapsed) * self.duration
+
+        # previous * (1 - f) + current < limit  =>  f > 1 - (limit - current) / previous
+        needed = 1 - (self.num_requests - self.current) / self.previous
+        return max(needed - self.elapsed, 0) * self.duration
+
+
+class PublicReadThrottle(RestaurantRateThrottle):
+    """Public restaurant info, tables and QR image"""
+    scope = 'public_read'
+
+
+class AvailabilityThrottle(RestaurantRateThrottle):
+    """Public availability checks"""
+    scope = 'public_availability'
+
+
+class BookingThrottle(RestaurantRateThrottle):
+    """Public booking creation"""
+    scope = 'public_book'
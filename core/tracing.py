@@ -0,0 +1,248 @@
+"""
+Lightweight span tracing within a request
+
+TracingMiddleware (core.middleware) opens a root span for a sample of
+requests: TRACING_SAMPLE_RATES per URL name, TRACING_SAMPLE_RATE for the
+rest. The current span is kept in a contextvar, so code called from the
+view opens child spans without passing anything around:
+
+    with tracing.span('booking.insert', table=table.id):
+        ...
+
+    @tracing.traced()
+    def get_available_tables(...):
+
+Outside a sampled request span() returns a shared no-op span, so untraced
+requests pay one contextvar lookup per instrumented call. Sampled requests
+also get a span per SQL statement (trace_queries) and for DRF validation
+and serialization (TracedSerializerMixin).
+
+When the root span ends, the trace's spans go to the exporter named by
+TRACING_EXPORTER: JSONLinesExporter (one JSON object per span, appended to
+TRACING_FILE) or InMemoryExporter for tests.
+"""
+
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL kept on a db.query span
+MAX_SQL_LENGTH = 1000
+
+_current = ContextVar('core.tracing.span', default=None)
+_exporter = None
+
+
+class Trace:
+    """The spans of one root span and its descendants"""
+    __slots__ = ('trace_id', 'spans')
+
+    def __init__(self):
+        self.trace_id = f'{random.getrandbits(128):032x}'
+        self.spans = []
+
+
+class Span:
+    """A timed operation; use as a context manager"""
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start', 'started', 'duration', 'error', 'token')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.duration = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _current.reset(self.token)
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            export(self.trace)
+
+    def as_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class NullSpan:
+    """Stands in for a span outside sampled requests"""
+    __slots__ = ()
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def start_trace(name, **attributes):
+    """Root span of a new trace, exported when it ends"""
+    return Span(Trace(), name, None, attributes)
+
+
+def span(name, **attributes):
+    """Child of the current span, or a no-op span outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        return NULL_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def current_span():
+    return _current.get()
+
+
+def traced(name=None):
+    """Decorator running each call of a function in a span (default name: its qualified name)"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_queries():
+    """
+    Wrap every database connection of the current thread so that each
+    statement gets a db.query span
+
+    Returns:
+        ExitStack: Close it to remove the wrappers
+    """
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(query_span))
+    return stack
+
+
+def query_span(execute, sql, params, many, context):
+    # Parameters are left out: spans hold no customer data
+    with span('db.query', alias=context['connection'].alias, sql=sql[:MAX_SQL_LENGTH], many=many):
+        return execute(sql, params, many, context)
+
+
+class TracedSerializerMixin:
+    """
+    Spans around validation and representation of a DRF serializer
+
+    For many=True, also set Meta.list_serializer_class = TracedListSerializer.
+    """
+
+    @property
+    def span_name(self):
+        return type(self).__name__
+
+    def is_valid(self, *, raise_exception=False):
+        with span(f'{self.span_name}.is_valid'):
+            return super().is_valid(raise_exception=raise_exception)
+
+    @property
+    def data(self):
+        with span(f'{self.span_name}.data'):
+            return super().data
+
+
+class TracedListSerializer(TracedSerializerMixin, serializers.ListSerializer):
+
+    @property
+    def span_name(self):
+        return f'{type(self.child).__name__}[]'
+
+
+class InMemoryExporter:
+    """Keeps finished spans in a list, for tests"""
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        with self.lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+
+
+class JSONLinesExporter:
+    """
+    Appends one JSON object per span to a file (default TRACING_FILE)
+
+    A trace is written with a single append, so the traces of several
+    worker processes can share the file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.TRACING_FILE
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(span.as_dict(), default=str) + '\n' for span in spans)
+        with self.lock, open(self.path, 'a') as f:
+            f.write(lines)
+
+
+def get_exporter():
+    """The TRACING_EXPORTER instance, created on first use"""
+    global _exporter
+    path = settings.TRACING_EXPORTER
+    if _exporter is None or _exporter[0] != path:
+        _exporter = (path, import_string(path)())
+    return _exporter[1]
+
+
+def export(trace):
+    # Spans end children first; export them in start order
+    spans = sorted(trace.spans, key=lambda span: span.started)
+    try:
+        get_exporter().export(spans)
+    except Exception:
+        # A broken exporter must not fail the traced request
+        logger.exception("Could not export trace %s", trace.trace_id)
@@ -0,0 +1,38 @@
+"""
+Write transactions that take SQLite's write lock at BEGIN
+
+A transaction that reads and then writes what it read (check a table is
+free, then book it) cannot rely on select_for_update(), which SQLite
+ignores, and with a plain BEGIN fails outright when another connection
+wrote in between. write_atomic() starts it with BEGIN IMMEDIATE: it
+waits up to the busy timeout for the write lock, and no other writer can
+change its reads before it commits.
+
+The cost is that the lock is held for the whole block, reads included,
+and every other writer on the database queues behind it. Read-only
+blocks, and blocks that write first, keep using transaction.atomic().
+"""
+
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+@contextmanager
+def write_atomic(using=None, savepoint=True):
+    """
+    transaction.atomic() that takes the write lock when it opens the transaction
+
+    Nested in an open transaction it is a plain atomic block: the
+    outermost block decided how the transaction began.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    # Backends other than core.db_backends.sqlite3 ignore the attribute
+    previous = getattr(connection, 'begin_mode', None)
+    connection.begin_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using, savepoint=savepoint):
+            connection.begin_mode = previous
+            yield
+    finally:
+        connection.begin_mode = previous
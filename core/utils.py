@@ -2,41 +2,195 @@
 Core utilities for the platform
 """
 
-import qrcode
+import hashlib
+import re
 from io import BytesIO
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 import base64
+from .metrics import QR_CACHE_REQUESTS
 
 
-def generate_qr_code(data, size=10, border=4):
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Names in qrcode.constants. qrcode, and Pillow behind it, take tens of
+# milliseconds to import, so they are only loaded on the first render.
+QR_ERROR_CORRECTION_LEVELS = {
+    'L': 'ERROR_CORRECT_L',
+    'M': 'ERROR_CORRECT_M',
+    'Q': 'ERROR_CORRECT_Q',
+    'H': 'ERROR_CORRECT_H',
+}
+
+
+def qr_error_correction(level=None):
     """
-    Generate QR code image from data
+    Error correction level to render with, QR_ERROR_CORRECTION by default
+
+    Unknown levels raise a ValueError naming the allowed ones, rather
+    than a KeyError from deep inside a render.
+    """
+    level = level or settings.QR_ERROR_CORRECTION
+    if level not in QR_ERROR_CORRECTION_LEVELS:
+        raise ValueError(
+            f"QR error correction must be one of {', '.join(QR_ERROR_CORRECTION_LEVELS)}, not {level!r}"
+        )
+    return level
+
+
+def qr_code_key(data, size=10, border=4, image_format='png', error_correction=None):
+    """
+    Build the content address of a QR code image
+
+    Every input that changes the rendered bytes is part of the hash, so
+    a key can be cached forever and reused as an ETag.
+
+    Returns:
+        Hex digest string
+    """
+    error_correction = qr_error_correction(error_correction)
+    payload = f"{data}|{size}|{border}|{error_correction}|{image_format}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_qr_code(data, size=10, border=4, image_format='png', error_correction=None):
+    """
+    Render a QR code image without touching the cache
 
     Args:
         data: URL or text to encode
-        size: Size of the QR code
-        border: Border size
+        size: Size of each QR box
+        border: Border size in boxes
+        image_format: 'png' or 'svg'
+        error_correction: 'L', 'M', 'Q' or 'H'
 
     Returns:
-        Base64 encoded image string
+        Image bytes
     """
+    error_correction = qr_error_correction(error_correction)
+
+    import qrcode
+    import qrcode.image.svg
+
     qr = qrcode.QRCode(
         version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        error_correction=getattr(qrcode.constants, QR_ERROR_CORRECTION_LEVELS[error_correction]),
         box_size=size,
         border=border,
     )
     qr.add_data(data)
     qr.make(fit=True)
 
-    img = qr.make_image(fill_color="black", back_color="white")
+    if image_format == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
 
-    # Convert to base64 for easy transmission
     buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
+    if image_format == 'svg':
+        img.save(buffer)
+    else:
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
 
-    return base64.b64encode(buffer.getvalue()).decode()
+
+def qr_code_storage_path(key, image_format='png'):
+    """Media storage path of a cached QR code image"""
+    return f"{settings.QR_CACHE_DIR}/{key[:2]}/{key}.{image_format}"
+
+
+def get_qr_code_image(data, size=10, border=4, image_format='png', error_correction=None):
+    """
+    Get a QR code image, rendering it only on a cache miss
+
+    Images are content-addressed by (data, size, border, error correction,
+    format) and stored in media storage, so repeated requests read the
+    rendered file instead of rebuilding the QR matrix.
+
+    Returns:
+        tuple: (image bytes, content key)
+    """
+    key = qr_code_key(data, size, border, image_format, error_correction)
+    content = read_cached_qr_code(key, image_format)
+    QR_CACHE_REQUESTS.labels('miss' if content is None else 'hit').inc()
+
+    if content is None:
+        content = render_qr_code(data, size, border, image_format, error_correction)
+        store_qr_code(key, image_format, content)
+    return content, key
+
+
+def read_cached_qr_code(key, image_format='png'):
+    """
+    Read a rendered QR code image from media storage
+
+    Returns:
+        Image bytes, or None on a cache miss
+    """
+    path = qr_code_storage_path(key, image_format)
+    if not default_storage.exists(path):
+        return None
+    with default_storage.open(path, 'rb') as cached:
+        return cached.read()
+
+
+def store_qr_code(key, image_format, content):
+    """Save a rendered QR code image to media storage under its key"""
+    path = qr_code_storage_path(key, image_format)
+    if not default_storage.exists(path):
+        saved = default_storage.save(path, ContentFile(content))
+        # Another process stored the same image first and storage picked a
+        # new name for ours; the key already has its image, drop the copy
+        if saved != path:
+            default_storage.delete(saved)
+
+
+def generate_qr_code(data, size=10, border=4):
+    """
+    Generate QR code image from data
+
+    Args:
+        data: URL or text to encode
+        size: Size of the QR code
+        border: Border size
+
+    Returns:
+        Base64 encoded image string
+    """
+    content, _ = get_qr_code_image(data, size, border, 'png')
+
+    # Convert to base64 for easy transmission
+    return base64.b64encode(content).decode()
+
+
+def restaurant_booking_full_url(restaurant):
+    """
+    Absolute booking page URL encoded in a restaurant's QR code
+
+    Args:
+        restaurant: Restaurant model instance
+
+    Returns:
+        URL string built from settings.QR_BASE_URL
+    """
+    return f"{settings.QR_BASE_URL.rstrip('/')}{restaurant.booking_url}"
+
+
+def table_booking_full_url(table):
+    """
+    Absolute deep link to a table's booking page encoded in table tents
+
+    Args:
+        table: Table model instance
+
+    Returns:
+        URL string built from settings.QR_BASE_URL
+    """
+    return f"{settings.QR_BASE_URL.rstrip('/')}{table.booking_url}"
 
 
 def generate_restaurant_qr(restaurant):
@@ -49,10 +203,33 @@ def generate_restaurant_qr(restaurant):
     Returns:
         Base64 encoded QR code image
     """
-    # In production, use full domain
-    # For now, use relative path
-    booking_url = f"http://localhost:8000/r/{restaurant.qr_code_id}/book"
-    return generate_qr_code(booking_url)
+    return generate_qr_code(restaurant_booking_full_url(restaurant))
+
+
+def normalize_phone(phone):
+    """
+    Digits of a phone number, whatever the formatting
+
+    Args:
+        phone: Phone number as typed, e.g. "+1 (555) 123-4567"
+
+    Returns:
+        String of digits, e.g. "15551234567"
+    """
+    return re.sub(r'[^0-9]', '', phone or '')
+
+
+def normalize_email(email):
+    """
+    Email address as compared between bookings
+
+    Args:
+        email: Address as typed, e.g. " Jane.Doe@Example.com"
+
+    Returns:
+        Lower-case address without surrounding spaces, e.g. "jane.doe@example.com"
+    """
+    return (email or '').strip().lower()
 
 
 def format_time_slot(time_obj):
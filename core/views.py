@@ -36,7 +36,7 @@ def signup_page(request):
 def owner_dashboard_page(request):
     """Render owner dashboard page"""
     # Check if user is owner
-    if not request.user.profile.is_owner:
+    if not request.user.is_owner:
         return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
     return render(request, 'dashboards/owner_dashboard.html')
 
@@ -46,7 +46,7 @@ def owner_dashboard_page(request):
 def admin_dashboard_page(request):
     """Render admin dashboard page"""
     # Check if user is admin
-    if not request.user.profile.is_admin:
+    if not request.user.is_admin:
         return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
     return render(request, 'dashboards/admin_dashboard.html')
 
@@ -75,7 +75,7 @@ def signup(request):
             'message': 'Registration successful',
             'token': token.key,
             'user': user_serializer.data,
-            'redirect_url': user.profile.dashboard_url
+            'redirect_url': user.dashboard_url
         }, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -106,7 +106,7 @@ def login(request):
             'message': 'Login successful',
             'token': token.key,
             'user': user_serializer.data,
-            'redirect_url': user.profile.dashboard_url
+            'redirect_url': user.dashboard_url
         })
 
     return Response({
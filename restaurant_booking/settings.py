@@ -3,6 +3,7 @@ Django settings for restaurant_booking project with role-based authentication
 """
 import os
 from pathlib import Path
+from decouple import config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -61,13 +62,95 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'restaurant_booking.wsgi.application'
 
+# Database profile: 'development' keeps SQLite defaults, 'production' enables
+# WAL, a busy timeout and persistent connections (see SQLITE_PRODUCTION_PRAGMAS)
+DB_PROFILE = config('DB_PROFILE', default='development')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # Lets booking writes take the write lock at BEGIN (core.transactions)
+        'ENGINE': 'core.db_backends.sqlite3',
+        'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
     }
 }
 
+# Applied to every new SQLite connection by core.signals
+SQLITE_PRODUCTION_PRAGMAS = {
+    # Readers no longer block on the writer (and vice versa)
+    'journal_mode': 'WAL',
+    # Durable across application crashes; fsync only at checkpoints in WAL mode
+    'synchronous': 'NORMAL',
+    # Wait for the write lock instead of failing with "database is locked"
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int),
+    # Negative values are KiB: 64 MiB page cache per connection
+    'cache_size': -config('SQLITE_CACHE_SIZE_KB', default=64000, cast=int),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'production':
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# Read replica: when DB_REPLICA_NAME is set, read-only traffic goes to it
+# through core.db_routers.PrimaryReplicaRouter. Locally, a second SQLite file
+# refreshed with `manage.py refresh_sqlite_replica` stands in for a replica.
+DATABASE_REPLICA_ALIAS = 'replica'
+DATABASE_REPLICA_PIN_COOKIE = 'pin_primary'
+DATABASE_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+DATABASE_ROUTERS = []
+
+DB_REPLICA_NAME = config('DB_REPLICA_NAME', default='')
+
+if DB_REPLICA_NAME:
+    DATABASES[DATABASE_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        # Opened read-only, so a misrouted write fails loudly
+        'NAME': f"file:{DB_REPLICA_NAME}?mode=ro",
+        'OPTIONS': {'uri': True},
+        # Tests read the same database the test writes went to
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS.append('core.db_routers.PrimaryReplicaRouter')
+    MIDDLEWARE.insert(0, 'core.middleware.ReplicaPinningMiddleware')
+
+# Lets a mirrored replica read the primary's open test transactions
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Restaurant sharding: DB_SHARDS=N adds shard_0..shard_N-1 SQLite databases.
+# Restaurants stay in 'default' (the catalog); the models below live on the
+# shard recorded in Restaurant.shard, found through the given lookup.
+DATABASE_SHARDED_MODELS = {
+    'restaurants.Table': 'restaurant',
+    'bookings.Guest': 'restaurant',
+    'bookings.Booking': 'restaurant',
+    'bookings.OutboxMessage': 'booking__restaurant',
+    'bookings.BookingArchive': 'restaurant',
+}
+# Primary keys are allocated per shard from (index + 1) * this range
+DATABASE_SHARD_ID_RANGE = 10 ** 12
+DATABASE_SHARDS = []
+
+DB_SHARDS = config('DB_SHARDS', default=0, cast=int)
+DB_SHARD_NAME = config('DB_SHARD_NAME', default=str(BASE_DIR / 'db_shard_{index}.sqlite3'))
+
+for index in range(DB_SHARDS):
+    alias = f'shard_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'ENGINE': 'core.db_backends.sqlite3_shard',
+        'NAME': DB_SHARD_NAME.format(index=index),
+    }
+    DATABASE_SHARDS.append(alias)
+
+if DATABASE_SHARDS:
+    DATABASE_ROUTERS.insert(0, 'core.sharding.RestaurantShardRouter')
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -107,6 +190,10 @@ REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
         'user': '1000/hour',
+        # Public QR endpoints, per (client IP, restaurant) - see core.throttling
+        'public_read': '120/min',
+        'public_availability': '60/min',
+        'public_book': '10/min',
     },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
@@ -135,4 +222,105 @@ DEFAULT_FROM_EMAIL = 'noreply@restaurantbooking.com'
 
 # Booking Settings
 BOOKING_DEFAULT_DURATION_HOURS = 2
-BOOKING_SLOT_INTERVAL_MINUTES = 30
\ No newline at end of file
+BOOKING_SLOT_INTERVAL_MINUTES = 30
+
+# Confirmed bookings are closed by `manage.py close_finished_bookings` once
+# they have ended plus a grace period: 'completed' or 'no_show'
+BOOKING_FINISHED_STATUS = config('BOOKING_FINISHED_STATUS', default='completed')
+BOOKING_FINISHED_GRACE_MINUTES = 30
+BOOKING_MAINTENANCE_CHUNK_SIZE = config('BOOKING_MAINTENANCE_CHUNK_SIZE', default=2000, cast=int)
+# Bookings older than this are moved to BookingArchive by `manage.py archive_bookings`
+BOOKING_ARCHIVE_AFTER_DAYS = config('BOOKING_ARCHIVE_AFTER_DAYS', default=365, cast=int)
+
+# Notification Settings
+# Emails are queued in the booking transaction and sent by `manage.py send_outbox`
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=100, cast=int)
+OUTBOX_MAX_ATTEMPTS = 5
+# Retry after 1, 2, 4, 8... minutes, capped at an hour
+OUTBOX_RETRY_BASE_SECONDS = 60
+OUTBOX_RETRY_MAX_SECONDS = 60 * 60
+# A claimed batch is not handed to another worker for this long; messages
+# of a worker that died are sent again after it
+OUTBOX_CLAIM_SECONDS = 5 * 60
+# Reminder lead times are fixed in bookings.notifications.REMINDERS;
+# `manage.py send_reminders` scans bookings in chunks of this size
+REMINDER_CHUNK_SIZE = config('REMINDER_CHUNK_SIZE', default=1000, cast=int)
+
+# Admin Settings
+# Filtered changelists over large tables count at most this many rows
+ADMIN_COUNT_LIMIT = 10000
+
+# Table Settings
+TABLE_BULK_MAX_ITEMS = 500
+
+# QR Code Settings
+# Absolute origin encoded in printed QR codes (no trailing slash)
+QR_BASE_URL = config('QR_BASE_URL', default='http://localhost:8000')
+# Error correction level: L (7%), M (15%), Q (25%) or H (30%)
+QR_ERROR_CORRECTION = config('QR_ERROR_CORRECTION', default='L')
+# Rendered images are stored under their content key, so they never go
+# stale; responses are revalidated by ETag after QR_CACHE_MAX_AGE seconds
+QR_CACHE_DIR = 'qr_codes'
+QR_CACHE_MAX_AGE = 60 * 60 * 24
+
+# Image Variant Settings
+# Logo/cover renditions are rendered on a background thread pool after upload
+IMAGE_VARIANTS_ASYNC = config('IMAGE_VARIANTS_ASYNC', default=True, cast=bool)
+IMAGE_VARIANT_WORKERS = config('IMAGE_VARIANT_WORKERS', default=2, cast=int)
+IMAGE_VARIANT_QUALITY = 80
+
+# Instrumentation Settings
+# Fraction of requests whose queries and timings are measured by
+# core.middleware.RequestInstrumentationMiddleware (0 = off)
+INSTRUMENTATION_SAMPLE_RATE = config('INSTRUMENTATION_SAMPLE_RATE', default=0.0, cast=float)
+# Per URL name overrides, e.g. {'bookings:create_booking': 1.0}
+INSTRUMENTATION_SAMPLE_RATES = {}
+# Measured requests kept in memory per process, for GET /api/admin/requests/
+INSTRUMENTATION_BUFFER_SIZE = config('INSTRUMENTATION_BUFFER_SIZE', default=500, cast=int)
+# Report timings to clients (and browser dev tools) in a Server-Timing header
+INSTRUMENTATION_SERVER_TIMING = config('INSTRUMENTATION_SERVER_TIMING', default=True, cast=bool)
+
+# Statements slower than this are logged and grouped, with their query plan,
+# by core.slow_queries (0 = off)
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=100, cast=float)
+# Distinct query shapes kept per process, and durations kept per shape
+SLOW_QUERY_MAX_GROUPS = 200
+SLOW_QUERY_SAMPLES = 100
+
+if INSTRUMENTATION_SAMPLE_RATE or any(INSTRUMENTATION_SAMPLE_RATES.values()):
+    MIDDLEWARE.insert(0, 'core.middleware.RequestInstrumentationMiddleware')
+
+# Profiling Settings
+# core.middleware.RequestProfilingMiddleware runs single requests under
+# cProfile and tracemalloc: staff get a token on /admin/profiles/
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+# Also profile this fraction of requests per URL name, e.g. {'bookings:booking_stats': 0.01}
+PROFILING_SAMPLE_RATES = {}
+PROFILING_TOKEN_MAX_AGE = 15 * 60
+# Artifacts directory; only the newest PROFILING_MAX_PROFILES are kept
+PROFILING_DIR = config('PROFILING_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILING_MAX_PROFILES = config('PROFILING_MAX_PROFILES', default=100, cast=int)
+
+if PROFILING_ENABLED:
+    MIDDLEWARE.insert(0, 'core.middleware.RequestProfilingMiddleware')
+
+# Metrics Settings
+# Directory of the per-process metric files summed by GET /metrics; empty
+# it on every server start. Without it each process reports only itself.
+METRICS_DIR = config('METRICS_DIR', default='')
+# Prometheus authenticates with "Authorization: Bearer <token>"; staff
+# sessions can read /metrics as well
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Tracing Settings
+# Fraction of requests traced by core.middleware.TracingMiddleware (0 = off)
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.0, cast=float)
+# Per URL name overrides, e.g. {'bookings:create_booking': 0.1}
+TRACING_SAMPLE_RATES = {}
+# core.tracing.JSONLinesExporter appends to TRACING_FILE;
+# core.tracing.InMemoryExporter keeps spans in memory (tests)
+TRACING_EXPORTER = config('TRACING_EXPORTER', default='core.tracing.JSONLinesExporter')
+TRACING_FILE = config('TRACING_FILE', default=str(BASE_DIR / 'traces.jsonl'))
+
+if TRACING_SAMPLE_RATE or any(TRACING_SAMPLE_RATES.values()):
+    MIDDLEWARE.insert(0, 'core.middleware.TracingMiddleware')
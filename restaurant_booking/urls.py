@@ -7,8 +7,17 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core import admin_views
+
 urlpatterns = [
-    # Django Admin
+    # Django Admin (custom pages first: the admin catches unknown URLs)
+    path('admin/slow-queries/', admin.site.admin_view(admin_views.slow_queries_page), name='admin_slow_queries'),
+    path('admin/profiles/', admin.site.admin_view(admin_views.profiles_page), name='admin_profiles'),
+    path(
+        'admin/profiles/<str:name>.<str:extension>',
+        admin.site.admin_view(admin_views.profile_download),
+        name='admin_profile_download'
+    ),
     path('admin/', admin.site.urls),
 
     # Core app (Auth & Dashboards)
@@ -19,6 +28,12 @@ urlpatterns = [
 
     # Bookings app
     path('', include('bookings.urls')),
+
+    # Staff diagnostics
+    path('api/admin/', include('core.admin_urls')),
+
+    # Prometheus scrape endpoint
+    path('metrics', admin_views.metrics, name='metrics'),
 ]
 
 # Serve media files in development
@@ -0,0 +1,200 @@
+"""
+Resized image variants for restaurant logos and cover images
+
+Uploads are served to phones on the public booking page, so each image
+gets thumbnail/mobile/desktop renditions in JPEG and WebP. Rendering
+runs on a background thread after the upload transaction commits; jobs
+still queued when the process stops are lost, and
+`manage.py generate_image_variants` renders whatever is missing.
+"""
+
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> maximum width in pixels (images are never upscaled)
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'mobile': 640,
+    'desktop': 1280,
+}
+
+# Output format -> (Pillow format, file extension)
+IMAGE_VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+}
+
+# Image field -> JSON field holding its variant paths
+IMAGE_FIELDS = {
+    'logo': 'logo_variants',
+    'cover_image': 'cover_image_variants',
+}
+
+_executor = None
+
+
+def get_executor():
+    """Shared worker pool for variant rendering, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='image-variants'
+        )
+    return _executor
+
+
+def variant_directory(restaurant_id, field_name, source_name):
+    """
+    Storage directory for the variants of one uploaded file
+
+    The source name is hashed into the path, so a replaced upload never
+    reuses (or overwrites) the renditions of the previous one.
+    """
+    digest = hashlib.sha1(source_name.encode()).hexdigest()[:12]
+    stem = PurePosixPath(source_name).stem[:40]
+    return f"restaurants/variants/{restaurant_id}/{field_name}/{stem}-{digest}"
+
+
+def render_variants(source, directory):
+    """
+    Render and store every variant of an open image file
+
+    Args:
+        source: File-like object with the original upload
+        directory: Storage directory to write variants into
+
+    Returns:
+        Dict of variant name -> {'width', 'height', format: storage path}
+    """
+    # Pillow is only needed here, on a background thread after an upload;
+    # importing it lazily keeps it out of worker startup
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            has_alpha = original.mode in ('LA', 'PA') or 'transparency' in original.info
+            original = original.convert('RGBA' if has_alpha else 'RGB')
+
+        variants = {}
+        for variant, max_width in IMAGE_VARIANTS.items():
+            image = original.copy()
+            if image.width > max_width:
+                height = round(image.height * max_width / image.width)
+                image = image.resize((max_width, height), Image.Resampling.LANCZOS)
+
+            variants[variant] = {'width': image.width, 'height': image.height}
+
+            for output_format, (pil_format, extension) in IMAGE_VARIANT_FORMATS.items():
+                frame = image
+                if pil_format == 'JPEG' and image.mode == 'RGBA':
+                    # JPEG has no alpha channel, flatten onto white
+                    frame = Image.new('RGB', image.size, (255, 255, 255))
+                    frame.paste(image, mask=image.getchannel('A'))
+
+                buffer = BytesIO()
+                if pil_format == 'JPEG':
+                    frame.save(buffer, pil_format, quality=settings.IMAGE_VARIANT_QUALITY,
+                               optimize=True, progressive=True)
+                else:
+                    frame.save(buffer, pil_format, quality=settings.IMAGE_VARIANT_QUALITY, method=4)
+
+                path = f"{directory}/{variant}.{extension}"
+                if default_storage.exists(path):
+                    default_storage.delete(path)
+                variants[variant][output_format] = default_storage.save(path, ContentFile(buffer.getvalue()))
+
+    return variants
+
+
+def variant_paths(variants):
+    """All storage paths referenced by a variants dict"""
+    return [
+        path
+        for variant in (variants or {}).values()
+        for output_format, path in variant.items()
+        if output_format in IMAGE_VARIANT_FORMATS
+    ]
+
+
+def delete_variants(variants, keep=()):
+    """Delete stored variant files but those in keep, ignoring ones that are already gone"""
+    for path in set(variant_paths(variants)) - set(keep):
+        try:
+            default_storage.delete(path)
+        except OSError:
+            logger.warning("Could not delete image variant %s", path)
+
+
+def generate_image_variants(restaurant_id, field_name, source_name):
+    """
+    Render variants for one upload and record them on the restaurant
+
+    The row is only updated if it still points at the same upload;
+    if the image was replaced meanwhile the fresh renditions are dropped.
+
+    Returns:
+        Dict of recorded variants, or None if rendering failed or the
+        image was replaced
+    """
+    from .models import Restaurant
+
+    try:
+        directory = variant_directory(restaurant_id, field_name, source_name)
+        with default_storage.open(source_name, 'rb') as source:
+            variants = render_variants(source, directory)
+
+        updated = Restaurant.objects.filter(
+            pk=restaurant_id,
+            **{field_name: source_name}
+        ).update(**{IMAGE_FIELDS[field_name]: variants})
+
+        if not updated:
+            delete_variants(variants)
+            return None
+        return variants
+    except Exception:
+        logger.exception("Image variant generation failed for restaurant %s %s", restaurant_id, field_name)
+        return None
+
+
+def _run_in_background(func, *args):
+    """Run a job on a pool thread and release its database connection"""
+    try:
+        func(*args)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_variants(restaurant_id, field_name, source_name):
+    """
+    Queue variant rendering once the current transaction commits
+
+    Runs inline when IMAGE_VARIANTS_ASYNC is off (tests, management commands).
+    """
+    def submit():
+        if settings.IMAGE_VARIANTS_ASYNC:
+            get_executor().submit(_run_in_background, generate_image_variants,
+                                  restaurant_id, field_name, source_name)
+        else:
+            generate_image_variants(restaurant_id, field_name, source_name)
+
+    transaction.on_commit(submit)
+
+
+def schedule_variant_cleanup(variants):
+    """Delete stale variants once the current transaction commits"""
+    paths = variant_paths(variants)
+    if paths:
+        transaction.on_commit(lambda: delete_variants(variants))
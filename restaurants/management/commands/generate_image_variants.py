@@ -0,0 +1,61 @@
+"""
+Render logo and cover image variants outside the upload path
+
+Variants are normally rendered on a background thread after an upload;
+jobs queued when a worker stops are lost, and images uploaded before
+variants existed never had any. This renders every image without
+variants, or every image with --all (e.g. after changing IMAGE_VARIANTS).
+
+Usage:
+    python manage.py generate_image_variants
+    python manage.py generate_image_variants --all
+    python manage.py generate_image_variants --restaurant 12 --restaurant 15
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from restaurants.images import IMAGE_FIELDS, delete_variants, generate_image_variants, variant_paths
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = 'Render missing (or all) logo and cover image variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Render images that already have variants too')
+        parser.add_argument('--restaurant', type=int, action='append', dest='restaurants',
+                            help='Only this restaurant id (repeatable)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        restaurants = Restaurant.objects.only('id', *IMAGE_FIELDS, *IMAGE_FIELDS.values()).order_by('id')
+        if options['restaurants']:
+            restaurants = restaurants.filter(id__in=options['restaurants'])
+
+        rendered = failed = 0
+        for restaurant in restaurants.iterator():
+            for field_name, variants_field in IMAGE_FIELDS.items():
+                source_name = getattr(restaurant, field_name).name
+                previous = getattr(restaurant, variants_field)
+                if not source_name or (previous and not options['all']):
+                    continue
+
+                # Inline rather than on the background pool, which would
+                # lose the jobs when this command exits
+                variants = generate_image_variants(restaurant.id, field_name, source_name)
+                if variants is None:
+                    failed += 1
+                    continue
+                rendered += 1
+
+                # Same directory as before, so only renditions no longer
+                # produced (e.g. of a removed size) are left to delete
+                delete_variants(previous, keep=variant_paths(variants))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{rendered} images rendered in {elapsed:.2f}s, {failed} failed or replaced meanwhile"
+        ))
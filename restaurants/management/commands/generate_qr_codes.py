@@ -0,0 +1,192 @@
+"""
+Bulk QR code generation for every active restaurant (and optionally table)
+
+Usage:
+    python manage.py generate_qr_codes --output qr_codes.zip
+    python manage.py generate_qr_codes --tables --image svg --output - > qr.zip
+    python manage.py generate_qr_codes --previous last_manifest.json --output changed.zip
+"""
+
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.sharding import db_for_restaurant
+from core.utils import (
+    QR_FORMATS,
+    qr_code_key,
+    qr_error_correction,
+    read_cached_qr_code,
+    render_qr_code,
+    restaurant_booking_full_url,
+    store_qr_code,
+    table_booking_full_url
+)
+from restaurants.models import Restaurant, Table
+
+
+def _render_job(job):
+    """Render one QR code in a worker process; returns (index, image bytes)"""
+    index, data, size, border, image_format, error_correction = job
+    return index, render_qr_code(data, size, border, image_format, error_correction)
+
+
+class Command(BaseCommand):
+    help = 'Generate QR codes for all active restaurants into a ZIP archive with a manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='qr_codes.zip',
+                            help="ZIP file to write, or '-' to stream to stdout")
+        parser.add_argument('--tables', action='store_true',
+                            help='Also generate a deep-link code for every active table')
+        parser.add_argument('--image', choices=list(QR_FORMATS), default='png')
+        parser.add_argument('--size', type=int, default=10, help='Module size in pixels (1-40)')
+        parser.add_argument('--border', type=int, default=4, help='Quiet zone in modules (0-10)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Render processes (default: CPU count)')
+        parser.add_argument('--previous', default=None,
+                            help='Manifest of an earlier run; codes with the same hash are left out')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        image_format = options['image']
+        size = options['size']
+        border = options['border']
+        # Same bounds as the /qr/ endpoint
+        if not (1 <= size <= 40 and 0 <= border <= 10):
+            raise CommandError('--size must be 1-40 and --border 0-10')
+        try:
+            error_correction = qr_error_correction()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        entries = self.collect_entries(options['tables'], image_format)
+        previous_keys = self.load_previous_keys(options['previous'])
+
+        # Resolve every code against the content-addressed cache first;
+        # only misses are sent to the process pool
+        to_write = []
+        to_render = []
+        for entry in entries:
+            entry['key'] = qr_code_key(entry['url'], size, border, image_format, error_correction)
+            if previous_keys.get(entry['file']) == entry['key']:
+                entry['status'] = 'unchanged'
+                continue
+            content = read_cached_qr_code(entry['key'], image_format)
+            if content is None:
+                entry['status'] = 'rendered'
+                to_render.append(entry)
+            else:
+                entry['status'] = 'cached'
+                to_write.append((entry, content))
+
+        output = options['output']
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        # PNG is already deflated; only SVG benefits from compression
+        compression = zipfile.ZIP_DEFLATED if image_format == 'svg' else zipfile.ZIP_STORED
+
+        try:
+            with zipfile.ZipFile(stream, 'w', compression=compression) as archive:
+                for entry, content in to_write:
+                    archive.writestr(entry['file'], content)
+
+                if to_render:
+                    jobs = [
+                        (index, entry['url'], size, border, image_format, error_correction)
+                        for index, entry in enumerate(to_render)
+                    ]
+                    workers = options['workers'] or os.cpu_count() or 1
+                    chunksize = max(1, len(jobs) // (workers * 8))
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        for index, content in pool.map(_render_job, jobs, chunksize=chunksize):
+                            entry = to_render[index]
+                            store_qr_code(entry['key'], image_format, content)
+                            archive.writestr(entry['file'], content)
+
+                manifest = {
+                    'generated_at': timezone.now().isoformat(),
+                    'base_url': settings.QR_BASE_URL,
+                    'image': image_format,
+                    'size': size,
+                    'border': border,
+                    'error_correction': error_correction,
+                    'codes': entries,
+                }
+                archive.writestr('manifest.json', json.dumps(manifest, indent=2),
+                                 compress_type=zipfile.ZIP_DEFLATED)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        counts = {'rendered': 0, 'cached': 0, 'unchanged': 0}
+        for entry in entries:
+            counts[entry['status']] += 1
+
+        # Keep stdout clean when the archive itself is streamed there
+        report = self.stderr if output == '-' else self.stdout
+        report.write(self.style.SUCCESS(
+            f"{len(entries)} codes in {elapsed:.2f}s "
+            f"({len(entries) / elapsed if elapsed else 0:.0f} codes/s): "
+            f"{counts['rendered']} rendered, {counts['cached']} from cache, "
+            f"{counts['unchanged']} unchanged"
+        ))
+
+    def collect_entries(self, include_tables, image_format):
+        """Build one manifest entry per code without per-row queries"""
+        entries = []
+        restaurants = Restaurant.objects.filter(is_active=True).only('id', 'name', 'qr_code_id', 'shard')
+        by_id = {}
+
+        for restaurant in restaurants.iterator():
+            by_id[restaurant.id] = restaurant
+            entries.append({
+                'file': f"{restaurant.qr_code_id}/restaurant.{image_format}",
+                'restaurant_id': restaurant.id,
+                'restaurant_name': restaurant.name,
+                'table_id': None,
+                'table_number': None,
+                'url': restaurant_booking_full_url(restaurant),
+            })
+
+        if include_tables:
+            # Tables may live on shard databases apart from their restaurant,
+            # so read them per database and attach the restaurant from memory
+            for db in settings.DATABASE_SHARDS or [None]:
+                tables = Table.objects.using(db).filter(is_active=True).only(
+                    'id', 'table_number', 'restaurant_id'
+                )
+                for table in tables.iterator():
+                    restaurant = by_id.get(table.restaurant_id)
+                    # Skip inactive restaurants and rows left behind by a shard move
+                    if restaurant is None or db not in (None, db_for_restaurant(restaurant)):
+                        continue
+                    table.restaurant = restaurant
+                    entries.append({
+                        'file': f"{restaurant.qr_code_id}/table-{table.id}.{image_format}",
+                        'restaurant_id': restaurant.id,
+                        'restaurant_name': restaurant.name,
+                        'table_id': table.id,
+                        'table_number': table.table_number,
+                        'url': table_booking_full_url(table),
+                    })
+
+        return entries
+
+    def load_previous_keys(self, path):
+        """Map file name -> content key from an earlier manifest"""
+        if not path:
+            return {}
+        try:
+            with open(path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read previous manifest: {e}")
+        return {code['file']: code['key'] for code in manifest.get('codes', [])}
@@ -0,0 +1,188 @@
+"""
+Move one restaurant's tables and bookings to another shard while it stays online
+
+Usage:
+    DB_SHARDS=4 python manage.py move_restaurant_shard <restaurant id or qr_code_id> shard_2
+
+1. Copy every row to the target shard while the source keeps taking writes.
+2. Take the source shard's write lock, copy what changed during step 1,
+   drop rows deleted meanwhile, and point Restaurant.shard at the target.
+   Bookings are only blocked for the duration of this step. Changes are
+   found by updated_at, which save() and ShardedQuerySet.update() set;
+   writes that bypass both (raw SQL) must set it themselves.
+3. Wait for requests that loaded the restaurant before the switch, copy
+   anything they still wrote to the source, then delete the source rows.
+"""
+
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from core.sharding import db_for_restaurant, restore_id_sequence, sharded_models
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = "Move a restaurant's tables and bookings to another shard database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurant', help='Restaurant id or qr_code_id')
+        parser.add_argument('target', help='Shard alias, e.g. shard_1')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--drain-seconds', type=float, default=5.0,
+                            help='Time given to in-flight requests after the switch')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_SHARDS:
+            raise CommandError('Sharding is disabled (DB_SHARDS is 0)')
+
+        target = options['target']
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(f"Unknown shard '{target}', expected one of {', '.join(settings.DATABASE_SHARDS)}")
+
+        restaurant = self.get_restaurant(options['restaurant'])
+        source = db_for_restaurant(restaurant)
+        if source == target:
+            raise CommandError(f"{restaurant.name} is already on {target}")
+
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        models = sharded_models()
+
+        # Phase 1: bulk copy while the source stays writable
+        copy_started = timezone.now()
+        for model, lookup in reversed(models):
+            # Leftovers of an earlier, interrupted move
+            self.filter(model, lookup, restaurant, target).delete()
+        copied = sum(self.copy_rows(model, lookup, restaurant, source, target) for model, lookup in models)
+
+        # Phase 2: catch up and switch under the source write lock
+        switched_at = timezone.now()
+        with transaction.atomic(using=source):
+            self.lock(source, models)
+            delta = sum(
+                self.copy_rows(model, lookup, restaurant, source, target, since=copy_started)
+                for model, lookup in models
+            )
+            removed = sum(
+                self.remove_deleted(model, lookup, restaurant, source, target)
+                for model, lookup in reversed(models)
+            )
+            Restaurant.objects.filter(pk=restaurant.pk).update(shard=target)
+
+        # Phase 3: sweep late writes, then clean up the source
+        time.sleep(options['drain_seconds'])
+        late = sum(
+            self.copy_rows(model, lookup, restaurant, source, target, since=switched_at)
+            for model, lookup in models
+        )
+        for model, lookup in reversed(models):
+            self.delete_rows(model, lookup, restaurant, source)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {restaurant.name} from {source} to {target} in {elapsed:.2f}s: "
+            f"{copied} rows copied, {delta} changed during the copy, "
+            f"{removed} deleted during the copy, {late} written after the switch"
+        ))
+
+    def get_restaurant(self, value):
+        try:
+            lookup = {'qr_code_id': uuid.UUID(value)}
+        except ValueError:
+            lookup = {'pk': value}
+        try:
+            return Restaurant.objects.get(**lookup)
+        except (Restaurant.DoesNotExist, ValueError):
+            raise CommandError(f"Restaurant '{value}' not found")
+
+    def filter(self, model, lookup, restaurant, db):
+        return model._base_manager.using(db).filter(**{lookup: restaurant})
+
+    def lock(self, db, models):
+        # SQLite takes the database write lock on the first write statement
+        # of a transaction; this no-op UPDATE claims it up front
+        table = connections[db].ops.quote_name(models[0][0]._meta.db_table)
+        with connections[db].cursor() as cursor:
+            cursor.execute(f'UPDATE {table} SET id = id WHERE id = -1')
+
+    def copy_rows(self, model, lookup, restaurant, source, target, since=None):
+        """
+        Copy rows from source to target, keeping primary keys and timestamps
+
+        With since, only rows changed after that moment are copied; rows that
+        already exist on the target are updated in place.
+        """
+        rows = self.filter(model, lookup, restaurant, source).order_by('pk')
+        if since is not None:
+            rows = rows.filter(updated_at__gte=since)
+
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        timestamp_fields = [
+            field.attname for field in fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+        ]
+        count = 0
+        batch = []
+
+        for values in rows.values().iterator(chunk_size=self.batch_size):
+            batch.append(values)
+            if len(batch) >= self.batch_size:
+                count += self.write_batch(model, batch, target, fields, timestamp_fields)
+                batch = []
+        if batch:
+            count += self.write_batch(model, batch, target, fields, timestamp_fields)
+
+        return count
+
+    def write_batch(self, model, batch, target, fields, timestamp_fields):
+        existing = set(
+            model._base_manager.using(target).filter(
+                pk__in=[values['id'] for values in batch]
+            ).values_list('pk', flat=True)
+        )
+        new = [model(**values) for values in batch if values['id'] not in existing]
+        changed = [model(**values) for values in batch if values['id'] in existing]
+
+        with transaction.atomic(using=target):
+            if new:
+                try:
+                    model._base_manager.using(target).bulk_create(new)
+                except IntegrityError as e:
+                    raise CommandError(f"{model._meta.label} id collision on {target}: {e}")
+                restore_id_sequence(model, target)
+                # bulk_create stamps auto_now fields; restore the originals
+                if timestamp_fields:
+                    originals = {values['id']: values for values in batch}
+                    for obj in new:
+                        for attname in timestamp_fields:
+                            setattr(obj, attname, originals[obj.pk][attname])
+                    model._base_manager.using(target).bulk_update(new, timestamp_fields)
+            if changed:
+                model._base_manager.using(target).bulk_update(changed, [field.attname for field in fields])
+
+        return len(batch)
+
+    def remove_deleted(self, model, lookup, restaurant, source, target):
+        """Delete target rows whose source row is gone"""
+        source_ids = set(self.filter(model, lookup, restaurant, source).values_list('pk', flat=True))
+        target_ids = set(self.filter(model, lookup, restaurant, target).values_list('pk', flat=True))
+        gone = sorted(target_ids - source_ids)
+        for start in range(0, len(gone), self.batch_size):
+            model._base_manager.using(target).filter(pk__in=gone[start:start + self.batch_size]).delete()
+        return len(gone)
+
+    def delete_rows(self, model, lookup, restaurant, db):
+        """Delete in short transactions so the shard is never locked for long"""
+        while True:
+            ids = list(
+                self.filter(model, lookup, restaurant, db).order_by().values_list('pk', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return
+            with transaction.atomic(using=db):
+                model._base_manager.using(db).filter(pk__in=ids).delete()
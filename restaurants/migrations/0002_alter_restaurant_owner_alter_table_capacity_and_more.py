@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-19 15:38
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='restaurant',
+            name='owner',
+            field=models.OneToOneField(limit_choices_to={'role': 'OWNER'}, on_delete=django.db.models.deletion.CASCADE, related_name='restaurant', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='table',
+            name='capacity',
+            field=models.PositiveIntegerField(help_text='Maximum number of people', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AlterField(
+            model_name='table',
+            name='description',
+            field=models.CharField(blank=True, help_text="e.g., 'Window seat', 'Outdoor patio'", max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='table',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text="Inactive tables won't appear in bookings"),
+        ),
+    ]
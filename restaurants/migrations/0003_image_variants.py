@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_alter_restaurant_owner_alter_table_capacity_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='cover_image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-19 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0003_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='shard',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+    ]
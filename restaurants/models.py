@@ -5,8 +5,12 @@ Restaurant and Table models
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.urls import reverse
 import uuid
 
+from core.sharding import ShardedQuerySet
+from .images import IMAGE_FIELDS
+
 
 class Restaurant(models.Model):
     """
@@ -35,6 +39,10 @@ class Restaurant(models.Model):
     logo = models.ImageField(upload_to='restaurants/logos/', null=True, blank=True)
     cover_image = models.ImageField(upload_to='restaurants/covers/', null=True, blank=True)
 
+    # Resized renditions of the images above, filled in by restaurants.images
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    cover_image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
     # QR Code - unique ID for booking URL
     qr_code_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 
@@ -45,6 +53,9 @@ class Restaurant(models.Model):
     # Status
     is_active = models.BooleanField(default=True)
 
+    # Database alias holding this restaurant's tables and bookings (see core.sharding)
+    shard = models.CharField(max_length=50, blank=True, editable=False)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -57,6 +68,18 @@ class Restaurant(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stored image names, so a save can tell a new upload without
+        # reading the row again (see restaurants.signals)
+        instance._loaded_images = {
+            name: value or ''
+            for name, value in zip(field_names, values)
+            if name in IMAGE_FIELDS
+        }
+        return instance
+
     @property
     def booking_url(self):
         """Generate the booking page URL"""
@@ -65,7 +88,7 @@ class Restaurant(models.Model):
     @property
     def qr_code_url(self):
         """Generate QR code API URL"""
-        return f"/api/restaurants/public/{self.qr_code_id}/qr/"
+        return reverse('restaurants:public_qr_code', kwargs={'qr_code_id': self.qr_code_id})
 
 
 class Table(models.Model):
@@ -104,6 +127,8 @@ class Table(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     class Meta:
         ordering = ['table_number']
         verbose_name = 'Table'
@@ -111,4 +136,9 @@ class Table(models.Model):
         unique_together = ['restaurant', 'table_number']
 
     def __str__(self):
-        return f"{self.restaurant.name} - Table {self.table_number}"
\ No newline at end of file
+        return f"{self.restaurant.name} - Table {self.table_number}"
+
+    @property
+    def booking_url(self):
+        """Generate the booking page URL with this table preselected"""
+        return f"{self.restaurant.booking_url}?table={self.id}"
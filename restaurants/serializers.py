@@ -4,6 +4,9 @@ Serializers for Restaurant and Table models
 
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from core.tracing import TracedListSerializer, TracedSerializerMixin
+from .images import IMAGE_VARIANT_FORMATS
 from .models import Restaurant, Table
 
 
@@ -40,11 +43,30 @@ class RestaurantSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'owner', 'qr_code_id', 'created_at', 'updated_at']
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Turns stored variant paths into URLs
+    {'mobile': {'width': 640, 'height': 360, 'jpeg': url, 'webp': url}, ...}
+    Empty until the background renditions are ready.
+    """
+
+    def to_representation(self, value):
+        return {
+            variant: {
+                key: default_storage.url(path) if key in IMAGE_VARIANT_FORMATS else path
+                for key, path in renditions.items()
+            }
+            for variant, renditions in (value or {}).items()
+        }
+
+
 class RestaurantPublicSerializer(serializers.ModelSerializer):
     """
     Public serializer - only shows info needed for booking page
     Hides sensitive owner information
     """
+    logo_variants = ImageVariantsField()
+    cover_image_variants = ImageVariantsField()
 
     class Meta:
         model = Restaurant
@@ -52,6 +74,7 @@ class RestaurantPublicSerializer(serializers.ModelSerializer):
             'id', 'name', 'description',
             'address', 'city', 'state',
             'logo', 'cover_image',
+            'logo_variants', 'cover_image_variants',
             'opening_time', 'closing_time'
         ]
 
@@ -76,7 +99,35 @@ class TableSerializer(serializers.ModelSerializer):
         return value
 
 
-class TablePublicSerializer(serializers.ModelSerializer):
+class TableBulkUpdateSerializer(TableSerializer):
+    """
+    Serializer for one item of a bulk table update
+    Same fields as TableSerializer plus the writable id of the table to change
+    """
+    id = serializers.IntegerField()
+
+    class Meta(TableSerializer.Meta):
+        read_only_fields = ['restaurant', 'created_at', 'updated_at']
+
+    def validate(self, attrs):
+        """Require the id even in partial updates, where other fields are optional"""
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': [self.fields['id'].error_messages['required']]})
+        return super().validate(attrs)
+
+
+class TableBulkStatusSerializer(serializers.Serializer):
+    """
+    Serializer for activating/deactivating many tables at once
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False
+    )
+    is_active = serializers.BooleanField()
+
+
+class TablePublicSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     """
     Public table serializer - for booking page
     Shows only necessary information
@@ -85,6 +136,7 @@ class TablePublicSerializer(serializers.ModelSerializer):
     class Meta:
         model = Table
         fields = ['id', 'table_number', 'capacity', 'description']
+        list_serializer_class = TracedListSerializer
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
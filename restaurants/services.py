@@ -0,0 +1,181 @@
+"""
+Table management business logic
+Bulk operations for floor-plan imports and edits
+"""
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from core.sharding import db_for_restaurant
+from core.transactions import write_atomic
+from .models import Table
+
+
+def _conflict_errors(items):
+    """Per-item errors for a batch that hit the unique table_number constraint"""
+    return [
+        {'table_number': [f"Table {item['table_number']} was just added by another request, please retry"]}
+        if 'table_number' in item else {}
+        for item in items
+    ]
+
+
+class TableService:
+    """
+    Service class for multi-table operations
+
+    Every bulk method validates the whole batch with a fixed number of
+    queries and writes it in the same transaction, which holds the write
+    lock from the start (core.transactions), so a batch either applies
+    completely or not at all and no other writer can take a table number
+    between the check and the write.
+    """
+
+    @staticmethod
+    def bulk_create_tables(restaurant, items):
+        """
+        Create many tables at once
+
+        Args:
+            restaurant: Restaurant instance
+            items: List of validated table dicts (table_number, capacity, ...)
+
+        Returns:
+            tuple: (success: bool, tables: list or None, errors: list)
+            errors is aligned with items, one dict per item
+        """
+        db = db_for_restaurant(restaurant)
+        try:
+            with write_atomic(using=db):
+                return TableService._bulk_create_tables(db, restaurant, items)
+        except IntegrityError:
+            # Another request took one of the numbers after the check: on
+            # backends that do not hold the write lock from BEGIN
+            return False, None, _conflict_errors(items)
+
+    @staticmethod
+    def _bulk_create_tables(db, restaurant, items):
+        errors = [{} for _ in items]
+        numbers = [item['table_number'] for item in items]
+
+        taken = set(
+            Table.objects.using(db).filter(
+                restaurant=restaurant,
+                table_number__in=numbers
+            ).order_by().values_list('table_number', flat=True)
+        )
+
+        seen = set()
+        for index, number in enumerate(numbers):
+            if number in taken:
+                errors[index]['table_number'] = [f"Table {number} already exists"]
+            elif number in seen:
+                errors[index]['table_number'] = [f"Table {number} appears more than once in this batch"]
+            seen.add(number)
+
+        if any(errors):
+            return False, None, errors
+
+        tables = [Table(restaurant=restaurant, **item) for item in items]
+        return True, Table.objects.using(db).bulk_create(tables), []
+
+    @staticmethod
+    def bulk_update_tables(restaurant, items):
+        """
+        Update many tables at once
+
+        Args:
+            restaurant: Restaurant instance
+            items: List of validated dicts, each with 'id' plus fields to change
+
+        Returns:
+            tuple: (success: bool, tables: list or None, errors: list)
+        """
+        db = db_for_restaurant(restaurant)
+        try:
+            with write_atomic(using=db):
+                return TableService._bulk_update_tables(db, restaurant, items)
+        except IntegrityError:
+            return False, None, _conflict_errors(items)
+
+    @staticmethod
+    def _bulk_update_tables(db, restaurant, items):
+        errors = [{} for _ in items]
+        ids = [item['id'] for item in items]
+
+        tables = Table.objects.using(db).filter(restaurant=restaurant, id__in=ids).in_bulk()
+
+        # Final table_number of every table in the restaurant once the batch applies
+        numbers = dict(
+            Table.objects.using(db).filter(restaurant=restaurant).order_by().values_list('id', 'table_number')
+        )
+
+        seen_ids = set()
+        for index, item in enumerate(items):
+            if item['id'] not in tables:
+                errors[index]['id'] = [f"Table {item['id']} not found"]
+            elif item['id'] in seen_ids:
+                errors[index]['id'] = [f"Table {item['id']} appears more than once in this batch"]
+            elif 'table_number' in item:
+                numbers[item['id']] = item['table_number']
+            seen_ids.add(item['id'])
+
+        owners = {}
+        for table_id, number in numbers.items():
+            owners.setdefault(number, []).append(table_id)
+
+        for index, item in enumerate(items):
+            if errors[index] or 'table_number' not in item:
+                continue
+            if len(owners[item['table_number']]) > 1:
+                errors[index]['table_number'] = [f"Table {item['table_number']} already exists"]
+
+        if any(errors):
+            return False, None, errors
+
+        now = timezone.now()
+        fields = {'updated_at'}
+        updated = []
+        for item in items:
+            table = tables[item['id']]
+            for field, value in item.items():
+                if field != 'id':
+                    setattr(table, field, value)
+                    fields.add(field)
+            table.updated_at = now
+            updated.append(table)
+
+        renamed = [table for table, item in zip(updated, items) if 'table_number' in item]
+
+        if renamed:
+            # SQLite checks unique constraints row by row, so swapping two
+            # numbers needs a pass through placeholder values first
+            final_numbers = [table.table_number for table in renamed]
+            for table in renamed:
+                table.table_number = f"__renaming_{table.id}"
+            Table.objects.using(db).bulk_update(renamed, ['table_number'])
+            for table, number in zip(renamed, final_numbers):
+                table.table_number = number
+
+        Table.objects.using(db).bulk_update(updated, sorted(fields))
+
+        return True, updated, []
+
+    @staticmethod
+    def bulk_set_active(restaurant, table_ids, is_active):
+        """
+        Activate or deactivate many tables with one UPDATE
+
+        Args:
+            restaurant: Restaurant instance
+            table_ids: IDs of tables to change
+            is_active: New status
+
+        Returns:
+            int: Number of tables updated
+        """
+        db = db_for_restaurant(restaurant)
+        with transaction.atomic(using=db):
+            return Table.objects.using(db).filter(
+                restaurant=restaurant,
+                id__in=table_ids
+            ).update(is_active=is_active, updated_at=timezone.now())
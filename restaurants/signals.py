@@ -0,0 +1,108 @@
+"""
+Signal handlers for Restaurant models
+"""
+
+from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from core.sharding import db_for_restaurant, default_shard, sharded_models, sharding_enabled
+from core.transactions import write_atomic
+from .images import IMAGE_FIELDS, schedule_image_variants, schedule_variant_cleanup
+from .models import Restaurant
+
+
+@receiver(pre_save, sender=Restaurant)
+def assign_shard(sender, instance, **kwargs):
+    """Record the initial shard of a new restaurant so later shard changes don't move it"""
+    if not instance.shard and sharding_enabled():
+        instance.shard = default_shard(instance.qr_code_id)
+
+
+@receiver(pre_save, sender=Restaurant)
+def track_image_changes(sender, instance, update_fields=None, **kwargs):
+    """
+    Detect replaced logo/cover uploads before the row is written
+
+    Variants of a replaced image are cleared in the same UPDATE and
+    remembered so post_save can delete their files. The row is only read
+    for images that differ from the names stored when the instance was
+    loaded; saves that leave them out of update_fields skip the check.
+    """
+    instance._changed_images = []
+    instance._stale_variants = []
+
+    loaded = getattr(instance, '_loaded_images', {})
+    fields = [
+        field_name for field_name in IMAGE_FIELDS
+        if (update_fields is None or field_name in update_fields)
+        and (field_name not in loaded or (getattr(instance, field_name).name or '') != loaded[field_name])
+    ]
+    if not fields:
+        return
+
+    previous = {}
+    if instance.pk:
+        previous = Restaurant.objects.filter(pk=instance.pk).values(
+            *fields, *(IMAGE_FIELDS[field_name] for field_name in fields)
+        ).first() or {}
+
+    for field_name in fields:
+        current_name = getattr(instance, field_name).name or ''
+        if current_name == (previous.get(field_name) or ''):
+            continue
+
+        instance._changed_images.append(field_name)
+        instance._stale_variants.append(previous.get(IMAGE_FIELDS[field_name]))
+        setattr(instance, IMAGE_FIELDS[field_name], {})
+
+
+@receiver(post_save, sender=Restaurant)
+def schedule_image_processing(sender, instance, update_fields=None, **kwargs):
+    """Render variants for new uploads off the request path"""
+    for variants in getattr(instance, '_stale_variants', []):
+        schedule_variant_cleanup(variants)
+
+    for field_name in getattr(instance, '_changed_images', []):
+        source_name = getattr(instance, field_name).name
+        if source_name:
+            schedule_image_variants(instance.pk, field_name, source_name)
+
+    # The row now holds these names, as if the instance had been loaded
+    instance._loaded_images = {
+        **getattr(instance, '_loaded_images', {}),
+        **{
+            field_name: getattr(instance, field_name).name or ''
+            for field_name in IMAGE_FIELDS
+            if update_fields is None or field_name in update_fields
+        },
+    }
+
+
+@receiver(pre_delete, sender=Restaurant)
+def delete_sharded_rows(sender, instance, **kwargs):
+    """
+    Cascade a restaurant's deletion to its shard
+
+    Django only cascades on the database the restaurant is deleted from,
+    'default', so its tables, guests and bookings on the shard are deleted
+    here, before the restaurant as CASCADE would. Rows whose restaurant
+    foreign key does not cascade (BookingArchive) are kept, as they are
+    without sharding. If this fails the restaurant is not deleted.
+    """
+    db = db_for_restaurant(instance)
+    if db is None:
+        return
+
+    # The write lock keeps new bookings off tables collected for deletion
+    with write_atomic(using=db):
+        for model, lookup in reversed(sharded_models()):
+            if lookup == 'restaurant' and model._meta.get_field(lookup).remote_field.on_delete is models.CASCADE:
+                # The shard's own collector cascades further (bookings -> outbox)
+                model._base_manager.using(db).filter(restaurant=instance).delete()
+
+
+@receiver(post_delete, sender=Restaurant)
+def delete_image_variants(sender, instance, **kwargs):
+    """Remove variant files of a deleted restaurant"""
+    for variants_field in IMAGE_FIELDS.values():
+        schedule_variant_cleanup(getattr(instance, variants_field))
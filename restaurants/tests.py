@@ -1,3 +1,486 @@
-from django.test import TestCase
+"""
+Tests for the bulk table endpoints, restaurant images and QR codes
 
-# Create your tests here.
+Bulk updates must reject a whole batch, with per-item errors, when any
+item is invalid: missing or unknown ids, ids listed twice, tables of
+another restaurant. Image variants must follow replaced uploads without
+reading the restaurant again on unrelated saves, and be renderable for
+images that have none. QR images must be rendered once, revalidate by
+ETag and reject out-of-range sizes; the bulk command must archive every
+code with its manifest and skip those unchanged since a previous run.
+Moving a restaurant to another shard must carry every row, with its id
+and relations, and leave none behind.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import time, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from bookings.maintenance import archive_bookings
+from bookings.models import Booking, BookingArchive, OutboxMessage
+from bookings.notifications import enqueue_confirmation
+from core.sharding import db_for_restaurant, sharded_models
+from core.utils import (
+    qr_code_key,
+    qr_code_storage_path,
+    read_cached_qr_code,
+    render_qr_code,
+    restaurant_booking_full_url,
+    store_qr_code
+)
+from .images import variant_paths
+from .management.commands.move_restaurant_shard import Command as MoveRestaurantShard
+from .models import Restaurant, Table
+from .services import TableService
+
+
+def create_restaurant(owner, name):
+    return Restaurant.objects.create(
+        owner=owner,
+        name=name,
+        email='owner@example.com',
+        phone='5550000000',
+        address='1 Main Street',
+        city='Springfield',
+        state='IL',
+        zip_code='62701'
+    )
+
+
+def png(width, height):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TableBulkTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        cls.restaurant = create_restaurant(cls.owner, 'Budget Bistro')
+        other_owner = get_user_model().objects.create_user(username='other', password='pass', role='OWNER')
+        cls.other_restaurant = create_restaurant(other_owner, 'Other Diner')
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+        self.tables = self.add_tables(self.restaurant, 3)
+        self.other_table = self.add_tables(self.other_restaurant, 1)[0]
+
+    def add_tables(self, restaurant, count):
+        db = db_for_restaurant(restaurant) or DEFAULT_DB_ALIAS
+        return Table.objects.using(db).bulk_create([
+            Table(restaurant=restaurant, table_number=str(number + 1), capacity=4)
+            for number in range(count)
+        ])
+
+    def reload(self, table):
+        db = db_for_restaurant(table.restaurant) or DEFAULT_DB_ALIAS
+        return Table.objects.using(db).get(pk=table.pk)
+
+    def patch(self, items):
+        return self.client.patch(reverse('restaurants:table_bulk'), items, content_type='application/json')
+
+    def test_update_swaps_numbers(self):
+        first, second, _ = self.tables
+        response = self.patch([
+            {'id': first.id, 'table_number': '2', 'capacity': 6},
+            {'id': second.id, 'table_number': '1'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.reload(first).table_number, self.reload(first).capacity), ('2', 6))
+        self.assertEqual(self.reload(second).table_number, '1')
+
+    def test_update_without_id_is_rejected(self):
+        response = self.patch([{'id': self.tables[0].id, 'capacity': 6}, {'capacity': 8}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        self.assertEqual(self.reload(self.tables[0]).capacity, 4)
+
+    def test_update_with_duplicate_id_is_rejected(self):
+        table = self.tables[0]
+        response = self.patch([{'id': table.id, 'capacity': 6}, {'id': table.id, 'capacity': 8}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('more than once', response.data[1]['id'][0])
+        self.assertEqual(self.reload(table).capacity, 4)
+
+    def test_update_of_another_restaurants_table_is_rejected(self):
+        response = self.patch([
+            {'id': self.tables[0].id, 'capacity': 6},
+            {'id': self.other_table.id, 'capacity': 8},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not found', response.data[1]['id'][0])
+        self.assertEqual(self.reload(self.tables[0]).capacity, 4)
+        self.assertEqual(self.reload(self.other_table).capacity, 4)
+
+    def test_update_to_a_taken_number_is_rejected(self):
+        response = self.patch([{'id': self.tables[0].id, 'table_number': '2'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('table_number', response.data[0])
+
+    def test_number_taken_after_the_check_is_a_validation_error(self):
+        items = [{'table_number': '9', 'capacity': 4}, {'table_number': '1', 'capacity': 2}]
+        # Another request added table 1 between the check and the insert
+        with mock.patch.object(QuerySet, 'values_list', return_value=[]):
+            success, tables, errors = TableService.bulk_create_tables(self.restaurant, items)
+        self.assertEqual((success, tables), (False, None))
+        self.assertIn('another request', errors[1]['table_number'][0])
+        db = db_for_restaurant(self.restaurant) or DEFAULT_DB_ALIAS
+        self.assertFalse(Table.objects.using(db).filter(restaurant=self.restaurant, table_number='9').exists())
+
+    def test_bulk_status_only_changes_own_tables(self):
+        ids = [table.id for table in self.tables[:2]] + [self.other_table.id]
+        response = self.client.post(
+            reverse('restaurants:table_bulk_status'),
+            {'ids': ids, 'is_active': False},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual([self.reload(table).is_active for table in self.tables], [False, False, True])
+        self.assertTrue(self.reload(self.other_table).is_active)
+
+        response = self.client.post(
+            reverse('restaurants:table_bulk_status'),
+            {'ids': ids, 'is_active': True},
+            content_type='application/json'
+        )
+        self.assertEqual(response.data['updated'], 2)
+        self.assertTrue(self.reload(self.tables[0]).is_active)
+
+    def test_bulk_status_requires_ids(self):
+        response = self.client.post(
+            reverse('restaurants:table_bulk_status'),
+            {'ids': [], 'is_active': False},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        self.restaurant = create_restaurant(owner, 'Budget Bistro')
+
+    def upload(self, name, width=800):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.logo = SimpleUploadedFile(name, png(width, width // 2))
+            self.restaurant.save()
+        self.restaurant.refresh_from_db()
+        return self.restaurant.logo_variants
+
+    def test_replaced_upload_gets_new_variants(self):
+        first = self.upload('logo.png')
+        self.assertEqual(first['mobile']['width'], 640)
+
+        second = self.upload('logo.png', width=100)
+        self.assertEqual(second['mobile']['width'], 100)
+        self.assertFalse(any(default_storage.exists(path) for path in variant_paths(first)))
+
+    def test_saves_without_new_images_do_not_read_the_row(self):
+        self.upload('logo.png')
+        restaurant = Restaurant.objects.get(pk=self.restaurant.pk)
+        with self.assertNumQueries(1):
+            restaurant.name = 'Renamed Bistro'
+            restaurant.save()
+        with self.assertNumQueries(1):
+            restaurant.save(update_fields=['name'])
+        # The instance that saved the upload knows the stored name too
+        with self.assertNumQueries(1):
+            self.restaurant.save()
+        self.assertTrue(Restaurant.objects.get(pk=self.restaurant.pk).logo_variants)
+
+    def test_command_renders_missing_variants(self):
+        variants = self.upload('logo.png')
+        # As if the background job had been lost
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(logo_variants={})
+
+        call_command('generate_image_variants', stdout=StringIO())
+        self.restaurant.refresh_from_db()
+        self.assertEqual(self.restaurant.logo_variants, variants)
+
+        output = StringIO()
+        call_command('generate_image_variants', stdout=output)
+        self.assertIn('0 images rendered', output.getvalue())
+        call_command('generate_image_variants', '--all', stdout=output)
+        self.assertIn('1 images rendered', output.getvalue())
+
+    def test_command_reports_missing_sources(self):
+        self.upload('logo.png')
+        default_storage.delete(self.restaurant.logo.name)
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(logo_variants={})
+
+        output = StringIO()
+        with self.assertLogs('restaurants.images', 'ERROR'):
+            call_command('generate_image_variants', stdout=output)
+        self.assertIn('0 images rendered', output.getvalue())
+        self.assertIn('1 failed', output.getvalue())
+
+
+class QRCodeImageTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        cls.restaurant = create_restaurant(cls.owner, 'Budget Bistro')
+
+    def setUp(self):
+        cache.clear()
+        # A media root per test, so every test starts with no rendered image
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def get(self, **params):
+        return self.client.get(self.restaurant.qr_code_url, params)
+
+    def test_url_serves_the_image_and_renders_it_once(self):
+        with mock.patch('core.utils.render_qr_code', wraps=render_qr_code) as render:
+            first, second = self.get(), self.get()
+        self.assertEqual((first.status_code, first['Content-Type']), (200, 'image/png'))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(self.get(image='svg')['Content-Type'], 'image/svg+xml')
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get()['ETag']
+        with mock.patch('core.utils.read_cached_qr_code') as read:
+            for if_none_match in (etag, f'W/"stale", {etag}', f'W/{etag}', '*'):
+                response = self.client.get(self.restaurant.qr_code_url, HTTP_IF_NONE_MATCH=if_none_match)
+                self.assertEqual(response.status_code, 304, if_none_match)
+                self.assertEqual((response.content, response['ETag']), (b'', etag))
+        read.assert_not_called()
+
+        response = self.client.get(self.restaurant.qr_code_url, {'size': 12}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cache_headers(self):
+        cache_control = self.get()['Cache-Control']
+        self.assertIn('public', cache_control)
+        self.assertIn(f'max-age={settings.QR_CACHE_MAX_AGE}', cache_control)
+        self.assertNotIn('immutable', cache_control)
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('restaurants:qr_code'), {'image': 'png'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'size': 0}, {'size': 41}, {'border': 11}, {'size': 'big'}, {'image': 'gif'}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+        self.assertEqual(self.get(size=40, border=0).status_code, 200)
+
+    def test_concurrent_renders_keep_one_image(self):
+        key = qr_code_key('https://example.com/r/1/book/')
+        store_qr_code(key, 'png', b'image')
+        # The second process checked for the image before the first saved it
+        exists = default_storage.exists
+        checks = []
+
+        def missing_once(name):
+            checks.append(name)
+            return len(checks) > 1 and exists(name)
+
+        with mock.patch.object(default_storage, 'exists', side_effect=missing_once):
+            store_qr_code(key, 'png', b'image')
+        directory = os.path.dirname(qr_code_storage_path(key, 'png'))
+        self.assertEqual(default_storage.listdir(directory)[1], [f'{key}.png'])
+        self.assertEqual(read_cached_qr_code(key, 'png'), b'image')
+
+    def generate(self, *args):
+        """Run generate_qr_codes; returns the ZIP's images and its manifest"""
+        output = os.path.join(settings.MEDIA_ROOT, 'codes.zip')
+        call_command('generate_qr_codes', '--output', output, '--workers', '1', *args, stdout=StringIO())
+        with zipfile.ZipFile(output) as archive:
+            manifest = json.loads(archive.read('manifest.json'))
+            images = {name: archive.read(name) for name in archive.namelist() if name != 'manifest.json'}
+        with open(os.path.join(settings.MEDIA_ROOT, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        return images, manifest
+
+    def test_command_writes_codes_and_manifest(self):
+        db = db_for_restaurant(self.restaurant) or DEFAULT_DB_ALIAS
+        table = Table.objects.using(db).create(restaurant=self.restaurant, table_number='1', capacity=4)
+        prefix = self.restaurant.qr_code_id
+
+        images, manifest = self.generate('--tables')
+        self.assertEqual(set(images), {f'{prefix}/restaurant.png', f'{prefix}/table-{table.id}.png'})
+        self.assertTrue(all(image.startswith(b'\x89PNG') for image in images.values()))
+        codes = {code['file']: code for code in manifest['codes']}
+        self.assertEqual(codes[f'{prefix}/restaurant.png']['url'], restaurant_booking_full_url(self.restaurant))
+        self.assertEqual(codes[f'{prefix}/table-{table.id}.png']['table_number'], '1')
+        self.assertEqual({code['status'] for code in manifest['codes']}, {'rendered'})
+        self.assertEqual((manifest['image'], manifest['size'], manifest['border']), ('png', 10, 4))
+
+        # Rendered images went to the cache
+        images, manifest = self.generate('--tables')
+        self.assertEqual(len(images), 2)
+        self.assertEqual({code['status'] for code in manifest['codes']}, {'cached'})
+
+    def test_command_rejects_out_of_range_sizes(self):
+        for args in (['--size', '0'], ['--size', '41'], ['--border', '-1'], ['--border', '11']):
+            with self.assertRaises(CommandError, msg=args):
+                call_command('generate_qr_codes', '--output', os.devnull, *args, stdout=StringIO())
+
+    def test_command_leaves_out_codes_unchanged_since_previous(self):
+        self.generate()
+        previous = os.path.join(settings.MEDIA_ROOT, 'manifest.json')
+        other = create_restaurant(get_user_model().objects.create_user(username='other', password='pass'), 'Other')
+
+        images, manifest = self.generate('--previous', previous)
+        self.assertEqual(set(images), {f'{other.qr_code_id}/restaurant.png'})
+        statuses = {code['restaurant_id']: code['status'] for code in manifest['codes']}
+        self.assertEqual(statuses, {self.restaurant.id: 'unchanged', other.id: 'rendered'})
+
+
+@skipUnless(len(settings.DATABASE_SHARDS) >= 2, 'Needs two shards (DB_SHARDS=2)')
+class ShardMoveTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='owner', password='pass', role='OWNER')
+        self.restaurant = create_restaurant(owner, 'Budget Bistro')
+        self.source = db_for_restaurant(self.restaurant)
+        self.target = next(shard for shard in settings.DATABASE_SHARDS if shard != self.source)
+
+        tables = Table.objects.using(self.source).bulk_create([
+            Table(restaurant=self.restaurant, table_number=str(number), capacity=4) for number in (1, 2)
+        ])
+        for number, days in enumerate((-3, 1, 2)):
+            booking = Booking.objects.using(self.source).create(
+                restaurant=self.restaurant,
+                table=tables[number % 2],
+                customer_name=f'Guest {number % 2}',
+                customer_email=f'guest{number % 2}@example.com',
+                customer_phone='5551234567' if number % 2 else '5550000000',
+                party_size=2,
+                booking_date=timezone.localdate() + timedelta(days=days),
+                booking_time=time(19),
+                status='completed' if days < 0 else 'confirmed'
+            )
+            enqueue_confirmation(booking)
+        self.assertEqual(archive_bookings(after_days=0), 1)
+
+    def rows(self, db):
+        """Model label -> {id: row values} of the restaurant on db"""
+        return {
+            model._meta.label: {
+                row['id']: row
+                for row in model._base_manager.using(db).filter(**{lookup: self.restaurant}).values()
+            }
+            for model, lookup in sharded_models()
+        }
+
+    def move(self):
+        call_command(
+            'move_restaurant_shard', str(self.restaurant.pk), self.target,
+            drain_seconds=0, stdout=StringIO()
+        )
+        self.restaurant.refresh_from_db()
+
+    def test_move_copies_rows_with_ids_and_empties_the_source(self):
+        before = self.rows(self.source)
+        self.assertEqual(
+            {label: len(rows) for label, rows in before.items()},
+            {'restaurants.Table': 2, 'bookings.Guest': 2, 'bookings.Booking': 2,
+             'bookings.OutboxMessage': 2, 'bookings.BookingArchive': 1}
+        )
+
+        self.move()
+        self.assertEqual(db_for_restaurant(self.restaurant), self.target)
+        self.assertEqual(self.rows(self.target), before)
+        self.assertFalse(any(self.rows(self.source).values()))
+
+        # Relations resolve on the target shard
+        bookings = Booking.objects.using(self.target).filter(restaurant=self.restaurant)
+        self.assertEqual(
+            {(booking.table.restaurant_id, booking.guest.restaurant_id) for booking in bookings},
+            {(self.restaurant.pk, self.restaurant.pk)}
+        )
+        self.assertEqual(
+            set(OutboxMessage.objects.using(self.target).values_list('booking_id', flat=True)),
+            {booking.pk for booking in bookings}
+        )
+
+    def test_moved_ids_keep_their_range_and_new_rows_use_the_targets(self):
+        self.move()
+        id_range = settings.DATABASE_SHARD_ID_RANGE
+        source_start = (settings.DATABASE_SHARDS.index(self.source) + 1) * id_range
+        target_start = (settings.DATABASE_SHARDS.index(self.target) + 1) * id_range
+
+        moved = Table.objects.using(self.target).values_list('id', flat=True)
+        self.assertTrue(all(source_start < table_id < source_start + id_range for table_id in moved))
+
+        table = Table.objects.create(restaurant=self.restaurant, table_number='3', capacity=2)
+        self.assertEqual(table._state.db, self.target)
+        self.assertTrue(target_start < table.id < target_start + id_range)
+
+    def test_deleting_the_restaurant_cascades_on_its_shard(self):
+        restaurant_id = self.restaurant.pk
+        self.restaurant.delete()
+        self.assertEqual(
+            {
+                model._meta.label: model._base_manager.using(self.source).count()
+                for model, _ in sharded_models()
+            },
+            {'restaurants.Table': 0, 'bookings.Guest': 0, 'bookings.Booking': 0,
+             'bookings.OutboxMessage': 0, 'bookings.BookingArchive': 1}
+        )
+        # History is kept, as without sharding
+        self.assertEqual(
+            BookingArchive.objects.using(self.source).get().restaurant_id, restaurant_id
+        )
+
+    def test_deleting_the_owner_cascades_on_the_shard(self):
+        self.restaurant.owner.delete()
+        self.assertFalse(Restaurant.objects.exists())
+        self.assertFalse(Table.objects.using(self.source).exists())
+        self.assertFalse(Booking.objects.using(self.source).exists())
+
+    def test_bulk_updates_during_the_copy_are_carried_over(self):
+        OutboxMessage.objects.using(self.source).update(status='failed', attempts=5)
+        lock = MoveRestaurantShard.lock
+
+        def retry_then_lock(command, db, models):
+            # An admin retries the messages after the bulk copy
+            OutboxMessage.objects.using(self.source).update(status='pending', attempts=0)
+            lock(command, db, models)
+
+        with mock.patch.object(MoveRestaurantShard, 'lock', retry_then_lock):
+            self.move()
+        self.assertEqual(
+            set(OutboxMessage.objects.using(self.target).values_list('status', 'attempts')),
+            {('pending', 0)}
+        )
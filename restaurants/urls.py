@@ -20,8 +20,11 @@ urlpatterns = [
     # Table Management
     path('tables/', views.table_list_create, name='table_list_create'),
     path('tables/<int:pk>/', views.table_detail, name='table_detail'),
+    path('tables/bulk/', views.table_bulk, name='table_bulk'),
+    path('tables/bulk/status/', views.table_bulk_status, name='table_bulk_status'),
 
     # Public endpoints
     path('public/<uuid:qr_code_id>/info/', views.public_restaurant_info, name='public_info'),
     path('public/<uuid:qr_code_id>/tables/', views.public_restaurant_tables, name='public_tables'),
+    path('public/<uuid:qr_code_id>/qr/', views.public_restaurant_qr_code, name='public_qr_code'),
 ]
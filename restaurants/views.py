@@ -6,22 +6,34 @@ Restaurant and Table API views
 """
 
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
 from .models import Restaurant, Table
 from .serializers import (
     UserRegistrationSerializer,
     RestaurantSerializer,
     RestaurantPublicSerializer,
     TableSerializer,
+    TableBulkUpdateSerializer,
+    TableBulkStatusSerializer,
     TablePublicSerializer
 )
-from core.utils import generate_restaurant_qr
-import base64
+from .services import TableService
+from core.sharding import db_for_restaurant
+from core.throttling import PublicReadThrottle
+from core.utils import (
+    QR_FORMATS,
+    generate_restaurant_qr,
+    get_qr_code_image,
+    qr_code_key,
+    restaurant_booking_full_url
+)
 
 
 # ==================== AUTHENTICATION VIEWS ====================
@@ -158,15 +170,65 @@ def restaurant_profile(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def qr_image_response(request, data, public=True):
+    """
+    Build a raw QR image response with cache headers
+
+    Query params: image=png|svg, size=1-40, border=0-10
+    The image's content key doubles as a strong ETag, so a revalidation
+    answers 304 without reading the image. The URL itself is not
+    content-addressed (the image changes with QR_BASE_URL), so responses
+    are cached for QR_CACHE_MAX_AGE and not marked immutable. Responses
+    to authenticated requests must pass public=False so shared caches
+    never hand one owner's code to another.
+    """
+    image_format = request.query_params.get('image', 'png')
+    if image_format not in QR_FORMATS:
+        return Response({
+            'error': f"Unsupported image format, use one of: {', '.join(QR_FORMATS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        size = int(request.query_params.get('size', 10))
+        border = int(request.query_params.get('border', 4))
+    except ValueError:
+        return Response({
+            'error': 'size and border must be integers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not (1 <= size <= 40 and 0 <= border <= 10):
+        return Response({
+            'error': 'size must be 1-40 and border 0-10'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    etag = f'"{qr_code_key(data, size, border, image_format)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content, _ = get_qr_code_image(data, size, border, image_format)
+        response = HttpResponse(content, content_type=QR_FORMATS[image_format])
+
+    response['ETag'] = etag
+    if public:
+        patch_cache_control(response, public=True, max_age=settings.QR_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, max_age=settings.QR_CACHE_MAX_AGE)
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def restaurant_qr_code(request):
     """
     Get QR code for restaurant
     GET /api/restaurants/qr/
+    GET /api/restaurants/qr/?image=png|svg returns the raw image instead of base64 JSON
     """
     try:
         restaurant = Restaurant.objects.get(owner=request.user)
+
+        if 'image' in request.query_params:
+            return qr_image_response(request, restaurant_booking_full_url(restaurant), public=False)
+
         qr_base64 = generate_restaurant_qr(restaurant)
 
         return Response({
@@ -197,7 +259,7 @@ def table_list_create(request):
         }, status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
-        tables = Table.objects.filter(restaurant=restaurant)
+        tables = Table.objects.using(db_for_restaurant(restaurant)).filter(restaurant=restaurant)
         serializer = TableSerializer(tables, many=True)
         return Response(serializer.data)
 
@@ -223,7 +285,7 @@ def table_detail(request, pk):
     """
     try:
         restaurant = Restaurant.objects.get(owner=request.user)
-        table = Table.objects.get(pk=pk, restaurant=restaurant)
+        table = Table.objects.using(db_for_restaurant(restaurant)).get(pk=pk, restaurant=restaurant)
     except (Restaurant.DoesNotExist, Table.DoesNotExist):
         return Response({
             'error': 'Table not found'
@@ -253,10 +315,95 @@ def table_detail(request, pk):
         }, status=status.HTTP_204_NO_CONTENT)
 
 
+@api_view(['POST', 'PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def table_bulk(request):
+    """
+    Create or update many tables in one transaction
+    POST /api/tables/bulk/   Body: [{"table_number": "1", "capacity": 4}, ...]
+    PATCH /api/tables/bulk/  Body: [{"id": 12, "capacity": 6}, ...]
+    """
+    try:
+        restaurant = Restaurant.objects.get(owner=request.user)
+    except Restaurant.DoesNotExist:
+        return Response({
+            'error': 'No restaurant found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'POST':
+        serializer = TableSerializer(
+            data=request.data,
+            many=True,
+            max_length=settings.TABLE_BULK_MAX_ITEMS
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        success, tables, errors = TableService.bulk_create_tables(restaurant, serializer.validated_data)
+        if not success:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'message': f'{len(tables)} tables created successfully',
+            'data': TableSerializer(tables, many=True).data
+        }, status=status.HTTP_201_CREATED)
+
+    elif request.method == 'PATCH':
+        serializer = TableBulkUpdateSerializer(
+            data=request.data,
+            many=True,
+            partial=True,
+            max_length=settings.TABLE_BULK_MAX_ITEMS
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        success, tables, errors = TableService.bulk_update_tables(restaurant, serializer.validated_data)
+        if not success:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'message': f'{len(tables)} tables updated successfully',
+            'data': TableSerializer(tables, many=True).data
+        })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def table_bulk_status(request):
+    """
+    Activate or deactivate many tables with a single update
+    POST /api/tables/bulk/status/
+    Body: {"ids": [1, 2, 3], "is_active": false}
+    """
+    try:
+        restaurant = Restaurant.objects.get(owner=request.user)
+    except Restaurant.DoesNotExist:
+        return Response({
+            'error': 'No restaurant found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = TableBulkStatusSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    updated = TableService.bulk_set_active(
+        restaurant,
+        serializer.validated_data['ids'],
+        serializer.validated_data['is_active']
+    )
+
+    return Response({
+        'message': f'{updated} tables {"activated" if serializer.validated_data["is_active"] else "deactivated"}',
+        'updated': updated
+    })
+
+
 # ==================== PUBLIC VIEWS (NO AUTH) ====================
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([PublicReadThrottle])
 def public_restaurant_info(request, qr_code_id):
     """
     Get public restaurant information for booking page
@@ -269,21 +416,25 @@ def public_restaurant_info(request, qr_code_id):
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([PublicReadThrottle])
 def public_restaurant_tables(request, qr_code_id):
     """
     Get all active tables for a restaurant
     GET /api/public/<qr_code_id>/tables/
     """
     restaurant = get_object_or_404(Restaurant, qr_code_id=qr_code_id, is_active=True)
-    tables = Table.objects.filter(restaurant=restaurant, is_active=True)
+    tables = Table.objects.using(db_for_restaurant(restaurant)).filter(restaurant=restaurant, is_active=True)
     serializer = TablePublicSerializer(tables, many=True)
     return Response(serializer.data)
 
 
-
-
-
-
-
-
-
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+@throttle_classes([PublicReadThrottle])
+def public_restaurant_qr_code(request, qr_code_id):
+    """
+    Get raw QR code image for a restaurant's booking page
+    GET /api/restaurants/public/<qr_code_id>/qr/?image=png|svg&size=10&border=4
+    """
+    restaurant = get_object_or_404(Restaurant, qr_code_id=qr_code_id, is_active=True)
+    return qr_image_response(request, restaurant_booking_full_url(restaurant))